@@ -1,18 +1,34 @@
 import streamlit as st
-import os, json, io, tempfile, re, math, time
-from typing import List, Optional
-from enum import Enum
+import os, json, io, tempfile, math, time, random, contextvars
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from collections import defaultdict
 import pypdf
-from docx import Document
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-from google import genai
 from google.genai import types
-from pydantic import BaseModel, Field
 from pyvis.network import Network
 import networkx as nx
+from chunk_tools import (
+    BREAK_KEYWORD_SETS, BREAK_KEYWORD_SET_CN,
+    KeywordMatcher, get_break_matcher, cohesion_breaks, agreement_report,
+    TokenEstimator, pack_chunks, pack_groups, DEDUP_THRESHOLD, find_near_duplicates,
+    duplicate_id_stats, yield_score
+)
+from llm_runtime import (
+    generate_cached, agenerate_cached, llm_cache,
+    TokenBucketLimiter, run_async_jobs, EXTRACT_RPM, EXTRACT_TPM, EXTRACT_MAX_IN_FLIGHT,
+    AimdController, EXTRACT_RETRIES, JOB_STATUS_CN, JobJournal, job_id,
+    wavefront_chains, decode_json_model, agenerate_stream_cached,
+    llm_telemetry, STAGE_CN, HedgePolicy, EXTRACT_TIMEOUT, defer_interrupt
+)
+from graph_schema import HistoricalGraphBatch, MultiChunkGraphBatch
+from llm_backend import create_client, needs_api_key, LLM_BACKEND, REPLAY_DIR
+from doc_reader import (
+    summarize_timings, PARALLEL_MIN_PAGES,
+    batch_pages, splice_pages, OCR_PAGE_MARKER,
+    run_ocr_batches, OCR_MAX_IN_FLIGHT,
+    doc_cache, file_digest,
+    as_paragraphs, DocumentParagraphs, digest_pages,
+    read_documents, INGEST_MAX_WORKERS
+)
 
 st.set_page_config(page_title="解书客", layout="wide", page_icon="📖", initial_sidebar_state="collapsed")
 
@@ -203,62 +219,6 @@ st.markdown("""
 
 """, unsafe_allow_html=True)
 
-# ============================================
-# Pydantic Schema - Event-Centric Knowledge Graph
-# ============================================
-
-class RiskLevel(str, Enum):
-    SAFE = "SAFE"               # 符合官方叙事
-    CONTROVERSIAL = "CONTROVERSIAL"  # 有争议/未定论
-    HIGH_RISK = "HIGH_RISK"     # 明显违规/历史虚无主义
-
-class EntityType(str, Enum):
-    PERSON = "PERSON"           # 政治人物
-    LOCATION = "LOCATION"       # 地点
-    ORG = "ORG"                  # 组织/党派
-    DOCUMENT = "DOCUMENT"       # 文件/著作/决议
-    CONCEPT = "CONCEPT"         # 提法/口号/主义
-
-class EventType(str, Enum):
-    MEETING = "MEETING"         # 会议
-    CONFLICT = "CONFLICT"       # 战争/冲突
-    SPEECH = "SPEECH"           # 讲话/发表
-    POLICY = "POLICY"           # 政策出台
-    MOVEMENT = "MOVEMENT"       # 政治运动
-
-# 移除 RelationType 枚举，改为自由文本关系
-
-class EntityNode(BaseModel):
-    """实体节点"""
-    id: str = Field(..., description="归一化ID，如 'PER_Mao_Zedong'")
-    name: str = Field(..., description="实体标准中文名")
-    type: EntityType
-    alias: List[str] = Field(default=[], description="文中出现的别名/黑话")
-
-class EventNode(BaseModel):
-    """事件节点"""
-    id: str = Field(..., description="事件ID，格式：EVT_动词_主体_时间")
-    name: str = Field(..., description="事件简述，如'遵义会议召开'")
-    type: EventType
-    time_str: str = Field(..., description="标准化时间字符串 YYYY-MM-DD")
-    description: str = Field(..., description="事件的详细经过描述")
-    political_significance: str = Field(..., description="该事件的政治定性/历史意义")
-    risk_level: RiskLevel = Field(..., description="根据输入源判断该描述的风险等级")
-
-class RelationEdge(BaseModel):
-    """关系边"""
-    source_id: str = Field(..., description="源节点ID (Entity 或 Event)")
-    target_id: str = Field(..., description="目标节点ID")
-    relation: str = Field(..., description="关系动词/动作，如：参与、组织、发起、批评、支持、反对、任命、出席、领导、提出、批准、签署、调任、逮捕、处决、平反等")
-    details: str = Field(..., description="关系的具体细节，如'担任组长'、'造成300人伤亡'")
-    evidence: str = Field(..., description="原文证据片段")
-
-class HistoricalGraphBatch(BaseModel):
-    """单次处理返回的图谱切片"""
-    entities: List[EntityNode]
-    events: List[EventNode]
-    relations: List[RelationEdge]
-
 ENTITY_TYPE_CN = {
     "PERSON": "人物", "LOCATION": "地点", "ORG": "组织",
     "DOCUMENT": "文件", "CONCEPT": "概念"
@@ -283,8 +243,6 @@ RELATION_TYPE_CN = {
 # ============================================
 if "step" not in st.session_state:
     st.session_state.step = 1
-if "text_content" not in st.session_state:
-    st.session_state.text_content = ""
 if "chunks" not in st.session_state:
     st.session_state.chunks = []
 if "entities" not in st.session_state:
@@ -295,21 +253,53 @@ if "relations" not in st.session_state:
     st.session_state.relations = []
 if "focus_stats" not in st.session_state:
     st.session_state.focus_stats = {"nodes": 0, "relations": 0}
+if "telemetry_runs" not in st.session_state:
+    st.session_state.telemetry_runs = []  # 本会话开启过的遥测轮次（侧栏汇总 / 导出只看自己的）
 
 CHUNK_SIZE = 4000
+CHUNK_TARGET_TOKENS = 6000     # 每次抽取请求的输入 token 上限（含提示词）
+CHUNK_MIN_FRACTION = 5         # 事件块最小长度 = 正文预算 / 5
+PACK_MAX_CHUNKS = 8            # 多块打包：每次请求最多片段数（输出随片段数增长，过多易截断）
+PACK_LABEL_TOKENS = 8          # 多块打包：每个片段标题【片段 k】的 token 开销
+STREAM_PREVIEW_INTERVAL = 1.0  # 流式预览刷新间隔（秒）
+STREAM_PREVIEW_EDGES = 40      # 局部图谱预览显示最近的关系条数
+EXTRACT_SEGMENTS = 0           # 波前调度段数：段间并行、段内串行传递前情提要（默认 0 = 全并行，不牺牲吞吐）
+SUMMARY_MAX_CHARS = 1000       # 前情提要长度上限（计入每次请求的提示词开销）
+SUMMARY_MAX_ENTITIES = 30      # 前情提要沿段传递的实体 ID 数（最近出现的优先）
+PREVIEW_FRACTION = 0.2         # 按产出优先抽取时，完成这一比例的请求后给出初步图谱
+PREVIEW_MIN_REQUESTS = 5       # 请求数少于此值时不提供初步图谱（很快就能全部完成）
+TOKEN_CALIBRATION_PATH = os.environ.get(
+    "JIESHUKE_TOKEN_CALIBRATION", os.path.join(".cache", "token_calibration.json")
+)
+
+OCR_PROMPT = """This PDF contains {n} pages. Please transcribe the full text content of every page verbatim. Do not summarize.
+Before the text of each page, output a separator line exactly like `{marker}`, where N is the page number within this PDF (1 to {n}).
+Just output the separators and the text content found in the document."""
+
+OCR_CACHE_VERSION = "2"  # OCR 提示词或分页标记变化时递增
+
+OCR_STATE_CN = {
+    "uploading": "上传中", "processing": "服务端处理中", "streaming": "识别中",
+    "retrying": "重试中", "done": "完成", "failed": "失败"
+}
 
 # ============================================
 # File Reading
 # ============================================
 
-def ocr_pdf_with_gemini(file_bytes, api_key):
-    """Fallback: Batch OCR using Gemini 3 Flash Preview (10 pages per request)"""
+def ocr_pdf_with_gemini(file_bytes, api_key, pages=None, max_in_flight=OCR_MAX_IN_FLIGHT):
+    """
+    Batch OCR using Gemini 3 Flash Preview (10 pages per request)
+    pages: 需要识别的页号（0 起始），None 表示全部页
+    max_in_flight: 同时在途的分卷数
+    返回 {页号: 识别文本}
+    """
     try:
         if not api_key:
-            return ""
+            return {}
         
-        # Init client
-        client = genai.Client(api_key=api_key)
+        # Init client（live / record / replay 由 llm_backend 决定）
+        client = create_client(api_key)
         
         # Load PDF Structure
         try:
@@ -317,191 +307,209 @@ def ocr_pdf_with_gemini(file_bytes, api_key):
             total_pages = len(pdf_reader.pages)
         except Exception as e:
             st.error(f"PDF解析失败，无法分卷: {e}")
-            return ""
+            return {}
+
+        if pages is None:
+            pages = list(range(total_pages))
+        pages = [p for p in pages if 0 <= p < total_pages]
+        if not pages:
+            return {}
+
+        # Strict Model
+        model_name = "gemini-3-flash-preview"
+
+        # 已识别过的页直接取缓存（同一文件 + 同一模型）
+        digest = file_digest(file_bytes)
+        cache_version = f"ocr-{model_name}-{OCR_CACHE_VERSION}"
+        cached_pages = doc_cache.get(digest, cache_version) or {}
+        missing = [p for p in pages if p not in cached_pages]
+        if not missing:
+            st.toast(f"OCR 缓存命中，跳过 {len(pages)} 页识别", icon="⚡")
+            return {p: cached_pages[p] for p in pages}
 
-        full_text = ""
         batch_size = 10 # 10 pages fits well within 8k output token limit
+        batches = batch_pages(missing, batch_size)
         
         # UI Elements
-        st.toast(f"开始全量识别，共 {total_pages} 页，将分 {math.ceil(total_pages/batch_size)} 批处理...", icon="📚")
+        cached_note = f"（{len(pages) - len(missing)} 页命中缓存）" if len(missing) < len(pages) else ""
+        st.toast(f"开始识别 {len(missing)}/{total_pages} 页{cached_note}，将分 {len(batches)} 批处理...", icon="📚")
         status_text = st.empty()
         progress_bar = st.progress(0)
         
         preview_expander = st.expander("实时识别预览 (分卷处理中)", expanded=True)
         preview_area = preview_expander.empty()
-        
-        # Strict Model
-        model_name = "gemini-3-flash-preview"
-
-        for start_idx in range(0, total_pages, batch_size):
-            end_idx = min(start_idx + batch_size, total_pages)
-            status_text.markdown(f"🚀 正在处理第 **{start_idx+1} - {end_idx}** 页 (共 {total_pages} 页)...")
-            
-            # Create Batch PDF
-            writer = pypdf.PdfWriter()
-            # If start_idx not 0, careful with resource referencing if strict, but pypdf usually handles well
-            for i in range(start_idx, end_idx):
-                writer.add_page(pdf_reader.pages[i])
-            
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_batch:
-                writer.write(tmp_batch)
-                batch_path = tmp_batch.name
-                
-            try:
-                # Upload
-                uploaded_file = client.files.upload(file=batch_path)
-                
-                # Processing Wait
-                while uploaded_file.state.name == "PROCESSING":
-                    time.sleep(1)
-                    uploaded_file = client.files.get(name=uploaded_file.name)
-                
-                if uploaded_file.state.name == "FAILED":
-                    st.error(f"分卷 {start_idx}-{end_idx} 上传处理失败，跳过。")
-                    continue
-
-                # Generate Stream
-                response_stream = client.models.generate_content_stream(
-                    model=model_name,
-                    contents=[
-                        uploaded_file,
-                        "Please transcribe the full text content of this document verbatim. Do not summarize. Just output the text content found in the document."
-                    ]
-                )
-                
-                batch_text = ""
-                for chunk in response_stream:
-                    if chunk.text:
-                        batch_text += chunk.text
-                        # Preview: Show tail of full text + current batch growing
-                        display_text = (full_text[-200:] if full_text else "") + "\n[...接上文...]\n" + batch_text
-                        preview_area.markdown(display_text[-1000:] + "...")
-                
-                full_text += batch_text + "\n"
-                
-            except Exception as e:
-                st.warning(f"⚠️ 分卷 {start_idx}-{end_idx} 识别出现问题: {e}")
-                # Don't break, try next batch
-            finally:
-                if os.path.exists(batch_path):
-                    os.remove(batch_path)
-            
-            # Update Progress
-            progress_bar.progress(end_idx / total_pages)
 
-        status_text.success(f"✅ 全文档处理完成！共 {len(full_text)} 字")
+        # 多个分卷同时在途（切分/上传/轮询/生成重叠），结果按页号回填
+        batch_status = {}
+        batch_preview = defaultdict(str)
+        unresolved = set()  # 页标记缺失的页：本次照常使用，但不写缓存，下次重新识别
+
+        def on_event(event):
+            idx = event["batch"]
+            pages_in_batch = event["pages"]
+            label = f"{pages_in_batch[0]+1}-{pages_in_batch[-1]+1}"
+            batch_status[idx] = OCR_STATE_CN.get(event["state"], event["state"])
+            if event["state"] == "streaming":
+                batch_preview[idx] += event.get("text", "")
+                preview_area.markdown(f"[第 {label} 页]\n" + batch_preview[idx][-1000:] + "...")
+            elif event["state"] == "retrying":
+                st.toast(f"分卷 {label} 出错，正在重试: {event.get('error')}", icon="🔁")
+            elif event["state"] in ("done", "failed"):
+                batch_preview.pop(idx, None)
+                unresolved.update(event.get("unresolved", []))
+                if event["state"] == "failed":
+                    st.warning(f"⚠️ 分卷 {label} 识别出现问题: {event.get('error')}")
+                progress_bar.progress(event["done"] / event["total"])
+            in_flight = " · ".join(
+                f"#{i+1} {s}" for i, s in sorted(batch_status.items()) if s not in ("完成", "失败")
+            )
+            finished = sum(1 for s in batch_status.values() if s in ("完成", "失败"))
+            eta = f" · 预计剩余 {event['eta']:.0f}s" if event.get("eta") else ""
+            status_text.markdown(f"🚀 已完成 **{finished}/{len(batches)}** 批{eta}  \n{in_flight}")
+
+        page_texts = run_ocr_batches(
+            client, model_name, file_bytes, batches,
+            prompt_for_batch=lambda b: OCR_PROMPT.format(n=len(b), marker=OCR_PAGE_MARKER.format(n="N")),
+            max_in_flight=max_in_flight,
+            on_event=on_event,
+            telemetry=llm_telemetry
+        )
+        resolved = {p: t for p, t in page_texts.items() if p not in unresolved}
+        if resolved:
+            cached_pages.update(resolved)
+            doc_cache.put(digest, cache_version, cached_pages)
+        page_texts = {**{p: cached_pages[p] for p in pages if p in cached_pages}, **page_texts}
+
+        total_chars = sum(len(t) for t in page_texts.values())
+        status_text.success(f"✅ OCR 完成！共 {len(page_texts)} 页 {total_chars} 字")
         time.sleep(1)
         status_text.empty()
         progress_bar.empty()
-        return full_text
+        return page_texts
 
     except Exception as e:
         st.error(f"OCR 流程致命错误: {e}")
-        return ""
+        return {}
+
+
+def finish_document(doc, data, api_key=None):
+    """读取后的主线程收尾：耗时提示 + 扫描页 OCR 回填，返回各页文本"""
+    name, pages = doc["name"], doc["pages"]
+    if doc["error"]:
+        st.error(f"读取失败: {doc['error']}")
+        return pages
+
+    timing = summarize_timings(doc["timings"])
+    if timing["pages"] >= PARALLEL_MIN_PAGES:
+        slowest = ", ".join(f"第{p}页 {t:.2f}s" for p, t in timing["slowest"])
+        st.caption(f"📄 {name}: {timing['pages']} 页, 累计 {timing['total']:.1f}s, 最慢: {slowest}")
+    
+    # Per-page triage & OCR only the low-quality pages
+    # 按字符密度与乱码占比逐页评分，扫描页/水印页单独送 OCR 后按页位回填
+    ocr_targets = doc["ocr_targets"]
+    if ocr_targets:
+        if api_key:
+            # Provide feedback to user
+            st.toast(f"正在使用 Gemini Vision 识别 {name} 中的 {len(ocr_targets)} 个扫描页...", icon="👁️")
+            ocr_pages = ocr_pdf_with_gemini(data, api_key, pages=ocr_targets)
+            if ocr_pages:
+                pages = splice_pages(pages, ocr_pages)
+        else:
+            if sum(len(p.strip()) for p in pages) < 100:
+                st.warning(f"文件 {name} 似乎是扫描版PDF，需要 API Key 才能进行 OCR 识别。")
+            else:
+                st.warning(f"文件 {name} 有 {len(ocr_targets)} 页疑似扫描页，需要 API Key 才能进行 OCR 识别。")
+    return pages
 
 
-def read_file(f, api_key=None):
-    name = getattr(f, "name", "")
-    ext = name.lower().rsplit(".", 1)[-1] if "." in name else ""
-    data = f.read()
-    if hasattr(f, "seek"):
+def ingest_uploads(files, api_key=None, max_workers=INGEST_MAX_WORKERS):
+    """
+    多文件并发读取：各文件在线程池中解析（互不影响），
+    实时显示每个文件的状态与耗时，结果按上传顺序返回 [(文件名, 各页文本)]
+    """
+    items = []
+    for f in files:
+        items.append((f.name, f.read()))
         f.seek(0)
-    
-    text = ""
-    try:
-        if ext == "pdf":
-            # 1. Try PyPDF first (Fast & Cheap)
-            try:
-                for page in pypdf.PdfReader(io.BytesIO(data)).pages:
-                    text += (page.extract_text() or "") + "\n"
-            except:
-                pass # Fail silently to trigger fallback
-            
-            # 2. Check sufficiency & Trigger OCR
-            # Enhanced logic: Raise threshold to 500 to catch watermarked scanned PDFs
-            clean_text = text.strip()
-            if len(clean_text) < 500:
-                if api_key:
-                    # Provide feedback to user
-                    st.toast(f"正在使用 Gemini Vision 识别扫描文档: {name}...", icon="👁️")
-                    ocr_text = ocr_pdf_with_gemini(data, api_key)
-                    
-                    # Accept OCR result if it's substantial
-                    if ocr_text and len(ocr_text) > 100:
-                        text = ocr_text
-                else:
-                    if len(clean_text) < 100:
-                        st.warning(f"文件 {name} 似乎是扫描版PDF，需要 API Key 才能进行 OCR 识别。")
-
-        elif ext == "epub":
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".epub") as tmp:
-                tmp.write(data)
-                path = tmp.name
-            try:
-                book = epub.read_epub(path, options={'ignore_ncx': True})
-                for item in book.get_items():
-                    if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                        soup = BeautifulSoup(item.get_content(), "html.parser")
-                        for tag in soup(['script', 'style']):
-                            tag.decompose()
-                        text += soup.get_text(separator='\n', strip=True) + "\n"
-            finally:
-                if os.path.exists(path):
-                    os.remove(path)
-        elif ext in ["docx", "doc"]:
-            text = "\n".join(p.text for p in Document(io.BytesIO(data)).paragraphs)
+
+    status_area = st.empty()
+    rows = [f"⏳ {name}" for name, _ in items]
+    status_area.markdown("  \n".join(rows))
+
+    def on_done(i, doc):
+        if doc["error"]:
+            rows[i] = f"❌ {doc['name']} · 读取失败: {doc['error']}"
         else:
-            text = data.decode("utf-8", errors="ignore")
-    except Exception as e:
-        st.error(f"读取失败: {e}")
-    return re.sub(r'\n{3,}', '\n\n', text).strip()
-
-def split_text_simple(text, size=CHUNK_SIZE):
-    """简单切分（备用）"""
-    paragraphs = re.split(r'\n\s*\n', text)
-    chunks, current = [], ""
-    for p in paragraphs:
-        p = p.strip()
-        if not p:
-            continue
-        if len(current) + len(p) < size:
+            chars = doc["chars"]
+            ocr = f" · {len(doc['ocr_targets'])} 页待 OCR" if doc["ocr_targets"] else ""
+            rows[i] = f"✅ {doc['name']} · {chars} 字 · {doc['elapsed']:.1f}s{ocr}"
+        status_area.markdown("  \n".join(rows))
+
+    t0 = time.perf_counter()
+    docs = read_documents(items, max_workers=max_workers, on_done=on_done)
+    st.caption(f"📚 {len(items)} 个文件读取完成，用时 {time.perf_counter() - t0:.1f}s "
+               f"（逐个累计 {sum(d['elapsed'] for d in docs):.1f}s）")
+
+    # OCR 需要更新 UI 且自带分卷并发，在主线程逐个文件进行
+    return [(doc["name"], finish_document(doc, data, api_key)) for doc, (_, data) in zip(docs, items)]
+
+
+def split_text_simple(text, size=CHUNK_SIZE, measure=len):
+    """
+    简单切分（备用）：按空行分段后装箱
+    text 可以是整段字符串，也可以是段落流（逐段消费，不复制全文）
+    measure 为长度度量（默认字符数，可传 token 估算器）
+    没有非空段落时：字符串输入与原先一致返回 [text[:size]]，段落流已被消费无从截取，返回 []
+    """
+    chunks, current, block = [], "", []
+    current_size = 0
+
+    def add_block(p):
+        nonlocal current, current_size
+        p_size = measure(p)
+        if current_size + p_size < size:
             current += "\n\n" + p if current else p
+            current_size += p_size
         else:
             if current:
                 chunks.append(current)
-            current = p
+            current, current_size = p, p_size
+
+    for para in as_paragraphs(text):
+        if para.new_block and block:
+            add_block("\n".join(block))
+            block = []
+        block.append(para.text)
+    if block:
+        add_block("\n".join(block))
     if current:
         chunks.append(current)
-    return chunks or [text[:size]]
+    if not chunks and isinstance(text, str):
+        return [text[:size]]
+    return chunks
 
 # ============================================
 # LLM Client
 # ============================================
 @st.cache_resource
 def get_client(key):
-    return genai.Client(api_key=key)
+    return create_client(key)
+
+def start_telemetry_run(name: str, **params) -> str:
+    """开启一轮遥测并记到本会话名下（遥测对象全进程共享，轮次按会话区分）"""
+    run = llm_telemetry.start_run(name, **params)
+    st.session_state.telemetry_runs.append(run)
+    return run
+
+@st.cache_resource
+def get_token_estimator():
+    """进程内共享的 token 估算器（校准样本跨会话累积，抽取结束后落盘）"""
+    return TokenEstimator.load(TOKEN_CALIBRATION_PATH)
 
 # ============================================
 # 事件切分关键词（规则优先 + 少量 LLM 校验）
 # ============================================
-EVENT_BREAK_KEYWORDS = [
-    # 时间跳跃
-    "第二天", "次日", "翌日", "几天后", "数日后", "一周后", "几周后",
-    "一个月后", "数月后", "半年后", "一年后", "多年后", "若干年后",
-    "转眼", "不久", "随后", "此后", "后来", "最终", "终于",
-    # 空间跳跃
-    "与此同时", "另一边", "在另一处", "在北京", "在上海", "在延安",
-    "回到", "来到", "抵达", "前往", "离开",
-    # 新事件标志
-    "会议开始", "会议召开", "大会开幕", "会上", "会后",
-    "战斗打响", "战役开始", "冲突爆发",
-    "发表讲话", "作报告", "发言指出", "宣布",
-    "颁布", "出台", "通过决议", "签署",
-    # 章节标记
-    "第一章", "第二章", "第三章", "第四章", "第五章",
-    "一、", "二、", "三、", "四、", "五、",
-    "（一）", "（二）", "（三）", "（四）", "（五）",
-]
+# 关键词集合与匹配器见 chunk_tools.py（按文档类型可选，可附加自定义关键词）
 
 BREAKPOINT_PROMPT = """判断以下两个段落之间是否发生了【明显的事件转移】或【时间/地点的大幅跳跃】。
 
@@ -512,29 +520,39 @@ BREAKPOINT_PROMPT = """判断以下两个段落之间是否发生了【明显的
 如果是新的事件开始，输出 YES。
 只输出 YES 或 NO。"""
 
-def is_obvious_break(para_start: str) -> bool:
-    """规则判断：是否为明显的事件断点"""
-    for kw in EVENT_BREAK_KEYWORDS:
-        if kw in para_start[:50]:
-            return True
-    return False
+BREAKPOINT_BATCH_PROMPT = """以下有 {n} 组相邻段落。请逐组判断两段之间是否发生了【明显的事件转移】或【时间/地点的大幅跳跃】。
+
+{pairs}
+
+对每一组：如果是同一个事件的延续，输出 "NO"；如果是新的事件开始，输出 "YES"。
+按组号顺序只输出一个 JSON 数组，例如 ["NO", "YES", "NO"]，数组长度必须为 {n}。"""
+
+BREAKPOINT_BATCH_SIZE = 20   # 每次请求打包的断点数
+BREAKPOINT_MAX_WORKERS = 4   # 并发请求数
+COHESION_SENSITIVITY = 1.25  # 衔接度断点阈值：深度分数 > 均值 + 灵敏度 × 标准差（bench.py cohesion 中精确率与召回率持平处）
+COHESION_AGREEMENT_SAMPLE = 40  # 与 LLM 对比时的默认抽样断点数
+CHUNK_WINDOW = 2048          # 混合 / 衔接度切分每个窗口的段落数
+
+def is_obvious_break(para_start: str, matcher: Optional[KeywordMatcher] = None) -> bool:
+    """规则判断：是否为明显的事件断点（段首 50 字内命中断点关键词）"""
+    return (matcher or get_break_matcher())(para_start)
 
 def fast_event_chunker(
-    book_content: str, 
+    book_content: Union[str, Iterable], 
     min_chunk_size: int = 800,
-    max_chunk_size: int = 3000
+    max_chunk_size: int = 3000,
+    break_matcher: Optional[KeywordMatcher] = None,
+    measure=len
 ) -> List[str]:
     """
     快速切分：纯规则，无 LLM 调用
+    book_content 可以是整段字符串或段落流（逐段消费）
+    min/max_chunk_size 按 measure 计（默认字符数，可传 token 估算器）
     """
-    paragraphs = [p.strip() for p in book_content.split('\n') if p.strip()]
-    if len(paragraphs) == 0:
-        return [book_content[:max_chunk_size]] if book_content else []
-    
     chunks, current_buffer, current_len = [], [], 0
 
-    for para in paragraphs:
-        para_len = len(para)
+    for para in (p.text for p in as_paragraphs(book_content)):
+        para_len = measure(para)
         if not current_buffer:
             current_buffer.append(para)
             current_len += para_len
@@ -548,7 +566,7 @@ def fast_event_chunker(
             current_buffer = [para]
             current_len = para_len
             continue
-        if is_obvious_break(para):
+        if is_obvious_break(para, break_matcher):
             chunks.append("\n".join(current_buffer))
             current_buffer = [para]
             current_len = para_len
@@ -562,27 +580,94 @@ def fast_event_chunker(
     return chunks
 
 
-def smart_event_chunker_hybrid(
-    book_content: str,
-    client,
-    model: str,
-    min_chunk_size: int = 700,
-    max_chunk_size: int = 3400,
-    llm_budget: int = 35
-) -> List[str]:
+def judge_breakpoint(client, model: str, prev_end: str, next_start: str) -> bool:
+    """单个断点 LLM 判定（YES = 新事件开始）；调用失败按 NO 处理"""
+    try:
+        response = generate_cached(
+            client, model,
+            BREAKPOINT_PROMPT.format(prev_end=prev_end, next_start=next_start),
+            types.GenerateContentConfig(
+                max_output_tokens=3,
+                temperature=0.0
+            ),
+            stage="breakpoint"
+        )
+        return "YES" in response.text.strip().upper()
+    except Exception:
+        return False
+
+
+def _judge_breakpoint_batch(client, model: str, batch):
+    """一次请求判定一批断点；返回数组解析失败或长度不符时逐个回退"""
+    pairs_text = "\n\n".join(
+        f"【第{i}组】\n上一段的结尾: \"...{prev_end}\"\n下一段的开头: \"{next_start}...\""
+        for i, (_, (prev_end, next_start)) in enumerate(batch, start=1)
+    )
+    try:
+        response = generate_cached(
+            client, model,
+            BREAKPOINT_BATCH_PROMPT.format(n=len(batch), pairs=pairs_text),
+            types.GenerateContentConfig(
+                response_mime_type="application/json",
+                max_output_tokens=8 * len(batch) + 32,
+                temperature=0.0
+            ),
+            validate=lambda t: len(json.loads(t)) == len(batch),
+            stage="breakpoint"
+        )
+        answers = json.loads(response.text)
+        if isinstance(answers, list) and len(answers) == len(batch):
+            return {j: "YES" in str(a).upper() for (j, _), a in zip(batch, answers)}
+    except Exception:
+        pass
+    return {j: judge_breakpoint(client, model, prev_end, next_start) for j, (prev_end, next_start) in batch}
+
+
+def judge_breakpoints_batched(client, model: str, pairs, batch_size: int = BREAKPOINT_BATCH_SIZE,
+                              max_workers: int = BREAKPOINT_MAX_WORKERS):
     """
-    混合切分：规则为主，少量 LLM 校验
-    - 规则命中直接切分
-    - 仅在“不明显”场景使用 LLM，且有调用上限
+    批量断点判定：pairs 为 {段落序号: (上一段结尾, 下一段开头)}
+    按 batch_size 打包，多批并发请求，返回 {段落序号: 是否断开}
     """
-    paragraphs = [p.strip() for p in book_content.split('\n') if p.strip()]
-    if len(paragraphs) == 0:
-        return [book_content[:max_chunk_size]] if book_content else []
-
-    chunks, current_buffer, current_len = [], [], 0
+    items = sorted(pairs.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    verdicts = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+        # 每批复制一份调用方上下文，遥测记录归入当前会话的轮次
+        futures = [
+            executor.submit(contextvars.copy_context().run, _judge_breakpoint_batch, client, model, b)
+            for b in batches
+        ]
+        for future in futures:
+            verdicts.update(future.result())
+    return verdicts
+
+
+def _paragraph_windows(content: Union[str, Iterable], size: int) -> Iterator[List[str]]:
+    """把段落流按 size 段一组产出（混合 / 衔接度切分每次只在内存中保留一个窗口）"""
+    window = []
+    for para in as_paragraphs(content):
+        window.append(para.text)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _hybrid_pass(paragraphs, sizes, verdicts, min_chunk_size, max_chunk_size, llm_budget, break_matcher,
+                 start=0, buffer=(), buffer_len=0):
+    """
+    按已知的 LLM 判定走一遍混合切分规则（sizes 为各段长度，预先算好供多轮复用）
+    paragraphs 为全局段号从 start 开始的一个窗口，buffer / buffer_len 为上一窗口留下的未完结块
+    遇到尚未判定的断点时按 NO 继续，并记录其段落序号
+    返回 (已完结的块, 未判定序号, 用到的判定数, 未完结块的段落, 其长度)；未完结块由调用方在流结束时收尾
+    """
+    chunks, current_buffer, current_len, unknown, used = [], list(buffer), buffer_len, [], 0
 
-    for para in paragraphs:
-        para_len = len(para)
+    for k, para in enumerate(paragraphs):
+        j = start + k
+        para_len = sizes[k]
         if not current_buffer:
             current_buffer.append(para)
             current_len += para_len
@@ -596,31 +681,22 @@ def smart_event_chunker_hybrid(
             current_buffer = [para]
             current_len = para_len
             continue
-        if is_obvious_break(para):
+        if is_obvious_break(para, break_matcher):
             chunks.append("\n".join(current_buffer))
             current_buffer = [para]
             current_len = para_len
             continue
 
-        decision = "NO"
+        decision = False
         if llm_budget > 0:
-            prev_end = current_buffer[-1][-60:]
-            next_start = para[:60]
-            try:
-                response = client.models.generate_content(
-                    model=model,
-                    contents=BREAKPOINT_PROMPT.format(prev_end=prev_end, next_start=next_start),
-                    config=types.GenerateContentConfig(
-                        max_output_tokens=3,
-                        temperature=0.0
-                    )
-                )
-                decision = response.text.strip().upper()
-            except Exception:
-                decision = "NO"
+            if j in verdicts:
+                decision = verdicts[j]
+            else:
+                unknown.append(j)
             llm_budget -= 1
+            used += 1
 
-        if "YES" in decision:
+        if decision:
             chunks.append("\n".join(current_buffer))
             current_buffer = [para]
             current_len = para_len
@@ -628,11 +704,159 @@ def smart_event_chunker_hybrid(
             current_buffer.append(para)
             current_len += para_len
 
-    if current_buffer:
-        chunks.append("\n".join(current_buffer))
+    return chunks, unknown, used, current_buffer, current_len
+
+
+def smart_event_chunker_hybrid(
+    book_content: Union[str, Iterable],
+    client,
+    model: str,
+    min_chunk_size: int = 700,
+    max_chunk_size: int = 3400,
+    llm_budget: int = 35,
+    break_matcher: Optional[KeywordMatcher] = None,
+    stats: Optional[dict] = None,
+    measure=len
+) -> List[str]:
+    """
+    混合切分：规则为主，少量 LLM 校验
+    - 规则命中直接切分
+    - 仅在“不明显”场景使用 LLM，且有调用上限
+    - 待判定断点先整体收集，再打包并发判定，多轮直到没有未判定断点
+      （断点 j 的判定只取决于第 j-1 段结尾与第 j 段开头，与切分状态无关）
+    - 预判作废的断点同样计入调用上限：每轮只送出剩余额度内的断点，实际请求数不超过 llm_budget；
+      额度用尽后余下的断点按 NO 处理，因此预判作废较多时判定数会少于逐个串行判定
+    - book_content 可以是整段字符串或段落流；按 CHUNK_WINDOW 段一个窗口逐窗处理，
+      窗口末尾未完结的块带入下一窗口，结果与整书一次处理相同
+    """
+    chunks, buffer, buffer_len = [], [], 0
+    start, prev_tail = 0, ""
+    rounds = judged = requested = breaks = 0
+
+    for paragraphs in _paragraph_windows(book_content, CHUNK_WINDOW):
+        sizes = [measure(p) for p in paragraphs]
+        verdicts = {}
+        remaining = llm_budget - requested
+        while True:
+            done, unknown, used, rest, rest_len = _hybrid_pass(
+                paragraphs, sizes, verdicts, min_chunk_size, max_chunk_size, remaining, break_matcher,
+                start, buffer, buffer_len
+            )
+            # 第一个未判定断点必在实际切分路径上，额度未尽时每轮至少推进一处
+            batch = unknown[:remaining - len(verdicts)]
+            if not batch:
+                break
+            rounds += 1
+            pairs = {
+                j: ((paragraphs[j - start - 1] if j > start else prev_tail)[-60:], paragraphs[j - start][:60])
+                for j in batch
+            }
+            verdicts.update(judge_breakpoints_batched(client, model, pairs))
+        chunks.extend(done)
+        buffer, buffer_len = rest, rest_len
+        judged += used - len(unknown)
+        requested += len(verdicts)
+        breaks += sum(1 for v in verdicts.values() if v)
+        start += len(paragraphs)
+        prev_tail = paragraphs[-1]
+    if buffer:
+        chunks.append("\n".join(buffer))
+
+    if stats is not None:
+        stats.update({
+            "rounds": rounds,
+            "judged": judged,                  # 实际切分路径上得到 LLM 判定的断点数
+            "speculative": requested - judged, # 因前序断点切分而作废的预判（同样计入上限）
+            "breaks": breaks,
+        })
+    return chunks
 
+
+def cohesion_event_chunker(
+    book_content: Union[str, Iterable],
+    min_chunk_size: int = 700,
+    max_chunk_size: int = 3400,
+    break_matcher: Optional[KeywordMatcher] = None,
+    sensitivity: float = COHESION_SENSITIVITY,
+    stats: Optional[dict] = None,
+    measure=len,
+    sample: int = 0,
+    seed: int = 0
+) -> List[str]:
+    """
+    本地衔接度切分：与混合切分规则相同，但“不明显”断点改由字符 n-gram 衔接度判定
+    - 无 LLM 调用，不受校验上限限制
+    - 两遍扫描：先逐块算出全书各段的深度分数（阈值取全书均值与标准差），再按 CHUNK_WINDOW 逐窗切分；
+      book_content 需可重复迭代（字符串、列表或 DocumentParagraphs），单次迭代器会先缓存成列表
+    - sample > 0 时在规则未命中的断点中各抽样至多 sample 个切 / 不切断点（含两侧文本），
+      放入 stats["samples"] 供 cohesion_agreement 对比 LLM
+    """
+    if not isinstance(book_content, str) and iter(book_content) is book_content:
+        book_content = list(as_paragraphs(book_content))
+    breaks = cohesion_breaks(p.text for p in as_paragraphs(book_content))
+
+    chunks, buffer, buffer_len = [], [], 0
+    start, prev_tail, judged = 0, "", 0
+    samples = {True: [], False: []}
+    seen = {True: 0, False: 0}
+    rng = random.Random(seed)
+    for paragraphs in _paragraph_windows(book_content, CHUNK_WINDOW):
+        verdicts = {j: bool(breaks[j]) for j in range(max(start, 1), start + len(paragraphs))}
+        done, _, used, buffer, buffer_len = _hybrid_pass(
+            paragraphs, [measure(p) for p in paragraphs], verdicts,
+            min_chunk_size, max_chunk_size, len(breaks), break_matcher, start, buffer, buffer_len
+        )
+        chunks.extend(done)
+        judged += used
+        for j, verdict in verdicts.items() if sample > 0 else ():
+            text = paragraphs[j - start]
+            if is_obvious_break(text, break_matcher):
+                continue
+            # 蓄水池抽样：每类等概率保留 sample 个
+            seen[verdict] += 1
+            pair = (j, (paragraphs[j - start - 1] if j > start else prev_tail)[-60:], text[:60])
+            if len(samples[verdict]) < sample:
+                samples[verdict].append(pair)
+            else:
+                slot = rng.randrange(seen[verdict])
+                if slot < sample:
+                    samples[verdict][slot] = pair
+        start += len(paragraphs)
+        prev_tail = paragraphs[-1]
+    if buffer:
+        chunks.append("\n".join(buffer))
+
+    if stats is not None:
+        stats.update({
+            "samples": samples,
+            "judged": judged,
+            "breaks": int(breaks.sum()),
+        })
     return chunks
 
+
+def cohesion_agreement(
+    client,
+    model: str,
+    samples: dict,
+    sample_size: int = COHESION_AGREEMENT_SAMPLE,
+    seed: int = 0
+) -> dict:
+    """
+    抽样对比本地衔接度判定与 LLM 判定
+    samples 为 cohesion_event_chunker 在规则未命中的断点中抽出的切 / 不切两类断点，
+    两类各取一半（断点稀少，均匀抽样几乎全是“不切”）
+    """
+    rng = random.Random(seed)
+    half = sample_size // 2
+    picked = rng.sample(samples[True], min(half, len(samples[True])))
+    picked = [(True, pair) for pair in picked]
+    negative = rng.sample(samples[False], min(sample_size - len(picked), len(samples[False])))
+    picked += [(False, pair) for pair in negative]
+    pairs = {j: (prev_end, next_start) for _, (j, prev_end, next_start) in picked}
+    llm_verdicts = judge_breakpoints_batched(client, model, pairs)
+    return agreement_report({pair[0]: verdict for verdict, pair in picked}, llm_verdicts)
+
 # ============================================
 # Extraction with Structured Output + Context Injection
 # ============================================
@@ -670,100 +894,589 @@ EXTRACTION_PROMPT_WITH_CONTEXT = """你是一个专业的历史政治文献分
 
 请提取所有实体、事件和它们之间的关系，注意保持与前文的ID一致性。"""
 
+EXTRACTION_PROMPT_MULTI = EXTRACTION_PROMPT_WITH_CONTEXT + """
+
+**多片段：** 当前文本由 {n} 个独立片段组成，以【片段 k】标出。请逐片段分别提取，
+每个片段输出一项（chunk_index = k，共 {n} 项），不要合并片段；同一对象在各片段中使用相同ID。"""
+
 def extract_with_context(
     client, 
     model: str, 
     text: str,
     global_context: str = "",
-    last_event_summary: str = "无"
+    last_event_summary: str = "无",
+    token_estimator: Optional[TokenEstimator] = None
 ) -> HistoricalGraphBatch:
-    """使用 Pydantic Schema 进行结构化抽取（带上下文）"""
+    """使用 Pydantic Schema 进行结构化抽取（带上下文）；给出 token_estimator 时用实际用量校准"""
     try:
-        prompt = EXTRACTION_PROMPT_WITH_CONTEXT.format(
-            global_context=global_context or "历史政治文献分析",
-            last_event_summary=last_event_summary,
-            text=text
-        )
-        response = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=HistoricalGraphBatch
-            )
-        )
-        data = json.loads(response.text)
-        return HistoricalGraphBatch(**data)
+        prompt, config = _extraction_request(text, global_context, last_event_summary)
+        response = generate_cached(client, model, prompt, config, validate=_validate_extraction, stage="extract")
+        return _finish_extraction(prompt, response, token_estimator)[0]
     except Exception as e:
         st.warning(f"抽取警告: {e}")
         return HistoricalGraphBatch(entities=[], events=[], relations=[])
 
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+async def extract_with_context_async(
+    client,
+    model: str,
+    text: str,
+    global_context: str = "",
+    last_event_summary: str = "无",
+    token_estimator: Optional[TokenEstimator] = None,
+    gate=None,
+    on_object=None
+) -> Tuple[HistoricalGraphBatch, Optional[int], bool]:
+    """
+    extract_with_context 的异步版本（client.aio），另返回实际输入 token 数（缓存命中时为 None）
+    与本次响应是否截断 / 格式有误而经过抢救（抢救结果不完整，不应记入续跑日志）
+    不吞异常：429/503 等由调用方（run_async_jobs）退避重试，最终失败的块在汇总里展示
+    gate 为发请求前等待的限流协程（见 run_async_jobs）
+    给出 on_object 时流式生成，每个实体 / 事件 / 关系对象一闭合即回调 on_object(类别, dict)
+    """
+    prompt, config = _extraction_request(text, global_context, last_event_summary)
+    response = await _agenerate(client, model, prompt, config, _validate_extraction, gate, on_object)
+    return _finish_extraction(prompt, response, token_estimator)
 
-def process_book_pipeline(
-    book_text: str,
+
+GRAPH_STREAM_KEYS = ("entities", "events", "relations")
+
+
+async def _agenerate(client, model, prompt, config, validate, gate, on_object):
+    if on_object is None:
+        return await agenerate_cached(client, model, prompt, config, validate=validate, gate=gate, stage="extract")
+    return await agenerate_stream_cached(
+        client, model, prompt, config, on_object=on_object, watch=GRAPH_STREAM_KEYS,
+        validate=validate, gate=gate, stage="extract"
+    )
+
+
+def carry_entities(known: Dict[str, str], batch: Optional[HistoricalGraphBatch],
+                   max_entities: int = SUMMARY_MAX_ENTITIES) -> Dict[str, str]:
+    """段内实体 ID 表（ID -> 名称）：并入本块实体，最近出现的排在前面，超出上限的旧 ID 淘汰"""
+    merged = {e.id: e.name for e in (batch.entities if batch is not None else [])}
+    for eid, name in known.items():
+        merged.setdefault(eid, name)
+    return dict(list(merged.items())[:max_entities])
+
+
+def carry_entities_all(known: Dict[str, str], batches: List[Optional[HistoricalGraphBatch]]) -> Dict[str, str]:
+    for batch in batches:
+        known = carry_entities(known, batch)
+    return known
+
+
+def rolling_summary(batch: Optional[HistoricalGraphBatch], known: Optional[Dict[str, str]] = None,
+                    max_events: int = 6) -> str:
+    """前情提要：上一块的最近事件（ID/名称/时间）+ 段内已出现实体的 ID，供下一块沿用"""
+    lines = [f"{ev.id}: {ev.name}（{ev.time_str}）" for ev in (batch.events[-max_events:] if batch is not None else [])]
+    if known:
+        lines.append("已出现实体: " + "、".join(f"{eid}({name})" for eid, name in known.items()))
+    return "\n".join(lines)[:SUMMARY_MAX_CHARS] or "无"
+
+
+def _extraction_request(text: str, global_context: str, last_event_summary: str):
+    prompt = EXTRACTION_PROMPT_WITH_CONTEXT.format(
+        global_context=global_context or "历史政治文献分析",
+        last_event_summary=last_event_summary,
+        text=text
+    )
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=HistoricalGraphBatch
+    )
+    return prompt, config
+
+
+def _validate_extraction(text: str) -> HistoricalGraphBatch:
+    """写缓存前的严格校验：截断或格式错误的输出不入缓存"""
+    return HistoricalGraphBatch.model_validate_json(text)
+
+
+def _parse_extraction(text: str) -> Tuple[HistoricalGraphBatch, bool]:
+    """快速校验，失败时抢救截断输出中的完整实体 / 事件 / 关系（见 llm_runtime.decode_json_model）"""
+    return decode_json_model(HistoricalGraphBatch, text)
+
+
+async def extract_many_async(
     client,
     model: str,
+    texts: List[str],
     global_context: str = "",
-    chunk_mode: str = "hybrid",
-    llm_budget: int = 35,
-    max_workers: int = 5
-) -> List[HistoricalGraphBatch]:
+    last_event_summary: str = "无",
+    token_estimator: Optional[TokenEstimator] = None,
+    gate=None,
+    on_object=None
+) -> Tuple[List[Optional[HistoricalGraphBatch]], Optional[int], bool]:
     """
-    上下文注入函数（并行优化版）：
-    1) 事件切分（混合/纯规则/固定长度）
-    2) 并行抽取各块
-    3) 返回每块的结构化图谱
+    多块打包抽取：多个短块共用一次请求与一份提示词，按片段编号拆回逐块结果
+    单块时等同 extract_with_context_async；响应里缺失的片段为 None（不写缓存，续跑时重抽）
+    第三项为本次响应是否经过抢救（见 extract_with_context_async）
+    """
+    if len(texts) == 1:
+        batch, prompt_tokens, salvaged = await extract_with_context_async(
+            client, model, texts[0], global_context, last_event_summary, token_estimator, gate, on_object
+        )
+        return [batch], prompt_tokens, salvaged
+    prompt = EXTRACTION_PROMPT_MULTI.format(
+        global_context=global_context or "历史政治文献分析",
+        last_event_summary=last_event_summary,
+        text=_label_chunks(texts),
+        n=len(texts)
+    )
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=MultiChunkGraphBatch
+    )
+    response = await _agenerate(
+        client, model, prompt, config,
+        lambda text: None not in _parse_multi(text, len(texts), salvage=False)[0], gate, on_object
+    )
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    if token_estimator is not None:
+        token_estimator.observe(prompt, prompt_tokens)
+    batches, salvaged = _parse_multi(response.text, len(texts))
+    return batches, prompt_tokens, salvaged
+
+
+def _label_chunks(texts: List[str]) -> str:
+    return "\n\n".join(f"【片段 {k}】\n{text}" for k, text in enumerate(texts, start=1))
+
+
+def _parse_multi(text: str, n: int, salvage: bool = True) -> Tuple[List[Optional[HistoricalGraphBatch]], bool]:
+    batches: List[Optional[HistoricalGraphBatch]] = [None] * n
+    multi, salvaged = decode_json_model(MultiChunkGraphBatch, text, salvage=salvage)
+    for item in multi.chunks:
+        if 1 <= item.chunk_index <= n and batches[item.chunk_index - 1] is None:
+            batches[item.chunk_index - 1] = HistoricalGraphBatch(
+                entities=item.entities, events=item.events, relations=item.relations
+            )
+    return batches, salvaged
+
+
+def _finish_extraction(prompt: str, response, token_estimator: Optional[TokenEstimator]):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    if token_estimator is not None:
+        token_estimator.observe(prompt, prompt_tokens)
+    batch, salvaged = _parse_extraction(response.text)
+    return batch, prompt_tokens, salvaged
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+def plan_book_chunks(
+    book_text: Union[str, Iterable],
+    client,
+    model: str,
+    chunk_mode: str,
+    llm_budget: int,
+    estimator: TokenEstimator,
+    min_size: int,
+    max_size: int,
+    overhead: int,
+    target_tokens: int,
+    break_matcher: Optional[KeywordMatcher] = None,
+    cohesion_sensitivity: float = COHESION_SENSITIVITY,
+    agreement_sample: int = 0,
+    pack: str = "multi"
+) -> List[str]:
+    """
+    切分计划：按模式切出事件块（长度按估算 token 计）
+    pack="merge" 时再把相邻事件块拼接到每次请求的输入上限；"multi" 时保留事件块，由抽取阶段打包请求
+    agreement_sample > 0 时（仅衔接度模式）抽样对比本地与 LLM 断点判定
     """
-    # 大文件用更大的 chunk 减少调用次数
-    text_len = len(book_text)
-    if text_len > 500000:  # > 500KB
-        min_size, max_size = 2000, 6000
-    elif text_len > 100000:  # > 100KB
-        min_size, max_size = 1200, 4500
-    else:
-        min_size, max_size = 700, 3400
-    
     if chunk_mode == "hybrid":
+        chunk_stats = {}
+        t0 = time.perf_counter()
         raw_chunks = smart_event_chunker_hybrid(
             book_text, client, model,
             min_chunk_size=min_size,
             max_chunk_size=max_size,
-            llm_budget=llm_budget
+            llm_budget=llm_budget,
+            break_matcher=break_matcher,
+            stats=chunk_stats,
+            measure=estimator
         )
+        if chunk_stats.get("judged"):
+            st.caption(
+                f"✂️ LLM 断点校验: {chunk_stats['judged']} 处（另有 {chunk_stats['speculative']} 处预判作废），"
+                f"{chunk_stats['rounds']} 轮批量判定，用时 {time.perf_counter() - t0:.1f}s"
+            )
+    elif chunk_mode == "cohesion":
+        chunk_stats = {}
+        t0 = time.perf_counter()
+        raw_chunks = cohesion_event_chunker(
+            book_text,
+            min_chunk_size=min_size,
+            max_chunk_size=max_size,
+            break_matcher=break_matcher,
+            sensitivity=cohesion_sensitivity,
+            stats=chunk_stats,
+            measure=estimator,
+            sample=agreement_sample
+        )
+        st.caption(
+            f"✂️ 本地衔接度判定: {chunk_stats['judged']} 处（衔接低谷 {chunk_stats['breaks']} 处），"
+            f"用时 {time.perf_counter() - t0:.2f}s"
+        )
+        if agreement_sample > 0:
+            with st.spinner("正在抽样对比 LLM 断点判定..."):
+                report = cohesion_agreement(
+                    client, model, chunk_stats["samples"], sample_size=agreement_sample
+                )
+            with st.expander(f"衔接度 vs LLM 一致率: {report['agreement']:.0%}（{report['n']} 处抽样）"):
+                st.markdown(
+                    f"- Cohen's kappa: **{report['kappa']:.2f}**\n"
+                    f"- 双方都切: {report['tp']}　双方都不切: {report['tn']}\n"
+                    f"- 仅本地切: {report['fp']}　仅 LLM 切: {report['fn']}"
+                )
+                st.caption("抽样在规则未命中的断点中进行，本地判定切/不切各占一半")
     elif chunk_mode == "fixed":
-        raw_chunks = split_text_simple(book_text, size=max_size)
+        raw_chunks = split_text_simple(book_text, size=max_size, measure=estimator)
     else:
-        raw_chunks = fast_event_chunker(book_text, min_chunk_size=min_size, max_chunk_size=max_size)
+        raw_chunks = fast_event_chunker(
+            book_text, min_chunk_size=min_size, max_chunk_size=max_size,
+            break_matcher=break_matcher, measure=estimator
+        )
+
+    if pack == "merge":
+        event_chunks = len(raw_chunks)
+        raw_chunks = pack_chunks(raw_chunks, estimator, max_size)
+        if raw_chunks:
+            body_tokens = sum(estimator(c) for c in raw_chunks)
+            _packing_caption(event_chunks, len(raw_chunks), body_tokens, overhead, target_tokens, estimator, "合并为")
 
-    total_chunks = len(raw_chunks)
+    return raw_chunks
+
+
+def _packing_caption(event_chunks: int, requests: int, body_tokens: int, overhead: int,
+                     target_tokens: int, estimator: TokenEstimator, verb: str):
+    avg_tokens = body_tokens / requests + overhead
+    calib_err = estimator.error()
+    calib_note = f"估算误差约 {calib_err:.0%}" if calib_err is not None else "未校准估算"
+    st.caption(
+        f"📦 {event_chunks} 个事件块{verb} {requests} 次请求，"
+        f"平均约 {avg_tokens:,.0f} 输入 tokens/次（上限 {target_tokens:,}，{calib_note}）"
+    )
+
+
+class StreamPreview:
+    """
+    流式抽取的实时计数与局部图谱预览：对象按请求分桶，某请求重试时清空其已到达的对象再重计
+    渲染按 interval 秒节流；记录首个对象 / 首个请求完成的耗时
+    """
+
+    def __init__(self, requests: int, interval: float = STREAM_PREVIEW_INTERVAL, edges: int = STREAM_PREVIEW_EDGES):
+        self.live = [{key: [] for key in GRAPH_STREAM_KEYS} for _ in range(requests)]
+        self.owner = [None] * requests
+        self.interval, self.edges = interval, edges
+        self.t0 = time.perf_counter()
+        self.first_object: Optional[float] = None
+        self.first_done: Optional[float] = None
+        self.placeholder = st.empty()
+        self.rendered_at = 0.0
+
+    def reset(self, pos: int) -> object:
+        """新一次尝试（重试或对冲副本）接管该请求的预览；返回凭据，旧尝试的后续对象被忽略"""
+        for objs in self.live[pos].values():
+            objs.clear()
+        self.owner[pos] = object()
+        return self.owner[pos]
+
+    def add(self, pos: int, kind: str, obj: dict, owner: object = None):
+        if owner is not None and owner is not self.owner[pos]:
+            return
+        if self.first_object is None:
+            self.first_object = time.perf_counter() - self.t0
+        self.live[pos][kind].append(obj)
+        self.render()
+
+    def done(self):
+        if self.first_done is None:
+            self.first_done = time.perf_counter() - self.t0
+
+    def render(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self.rendered_at < self.interval:
+            return
+        self.rendered_at = now
+        merged = {key: [o for bucket in self.live for o in bucket[key]] for key in GRAPH_STREAM_KEYS}
+        names = {o.get("id"): o.get("name", o.get("id")) for o in merged["entities"] + merged["events"]}
+        with self.placeholder.container():
+            st.caption(
+                f"🔴 实时抽取: 实体 {len(merged['entities'])} · 事件 {len(merged['events'])} · "
+                f"关系 {len(merged['relations'])}（首个结果 {self.first_object or 0:.1f}s）"
+            )
+            recent = merged["relations"][-self.edges:]
+            if recent:
+                label = lambda nid: json.dumps(str(names.get(nid, nid)), ensure_ascii=False)
+                lines = [
+                    f"{label(r.get('source_id'))} -> {label(r.get('target_id'))} "
+                    f"[label={json.dumps(str(r.get('relation', '')), ensure_ascii=False)}]"
+                    for r in recent
+                ]
+                st.graphviz_chart("digraph {rankdir=LR; node [shape=box, fontsize=10]; edge [fontsize=9];\n"
+                                  + "\n".join(lines) + "\n}")
+
+    def clear(self):
+        self.placeholder.empty()
+
+
+def process_book_pipeline(
+    book_text: Union[str, Iterable],
+    client,
+    model: str,
+    global_context: str = "",
+    chunk_mode: str = "hybrid",
+    llm_budget: int = 35,
+    max_in_flight: int = EXTRACT_MAX_IN_FLIGHT,
+    rpm: int = EXTRACT_RPM,
+    tpm: int = EXTRACT_TPM,
+    retries: int = EXTRACT_RETRIES,
+    target_tokens: int = CHUNK_TARGET_TOKENS,
+    token_estimator: Optional[TokenEstimator] = None,
+    break_matcher: Optional[KeywordMatcher] = None,
+    cohesion_sensitivity: float = COHESION_SENSITIVITY,
+    agreement_sample: int = 0,
+    dedup_threshold: Optional[float] = DEDUP_THRESHOLD,
+    segments: int = EXTRACT_SEGMENTS,
+    pack: str = "multi",
+    stream: bool = True,
+    job: Optional[str] = None,
+    resume: bool = True,
+    hedge: bool = True,
+    timeout: Optional[float] = EXTRACT_TIMEOUT,
+    prioritize: bool = True,
+    on_preview: Optional[Callable[[List[HistoricalGraphBatch], int, int], None]] = None,
+    preview_fraction: float = PREVIEW_FRACTION
+) -> List[HistoricalGraphBatch]:
+    """
+    上下文注入函数（并行优化版）：
+    1) 事件切分（混合/纯规则/本地衔接度/固定长度），长度按估算 token 计
+    2) 相邻事件块装满每次请求 target_tokens 输入上限（扣除提示词开销）：
+       pack="merge" 拼接正文；"multi" 把短块打包进一次请求、按片段编号返回逐块结果
+       （每次最多 PACK_MAX_CHUNKS 块，近重复复用 / 任务日志 / 前情提要仍按块进行）
+    3) 近重复块（多版本/合集重叠）复用代表块结果，其余在 asyncio 事件循环里并发抽取
+       （令牌桶按 rpm / tpm 限流；AIMD 并发窗口遇 429/503 收缩、成功后回升，上限 max_in_flight；
+        失败块抖动指数退避重试 retries 次），返回每块的结构化图谱（放弃的块为空图谱）
+    4) 波前调度：待抽取请求按原文顺序切成 segments 段，段间并行，段内逐次把上一请求的
+       前情提要（rolling_summary）注入下一请求，保持 ID 一致；segments=0 为全并行、无前情提要
+    5) stream 为真时流式生成：实体 / 事件 / 关系对象一闭合即计入实时计数与局部图谱预览
+    6) hedge 为真时对冲尾延迟：请求超过运行中 p95 耗时仍未返回就发副本，先返回者胜出
+       （副本花费不超过 HEDGE_BUDGET）；timeout 为单次调用超时，超时按可重试错误处理
+    7) prioritize 为真时按产出预估（称谓 / 机构 / 地名后缀、日期、断点关键词的密度）先抽高产出的请求；
+       完成 preview_fraction 的请求后回调一次 on_preview(已完成各块图谱, 已完成请求数, 总请求数)
+    job 为任务 ID（见 llm_runtime.job_id）时，切分计划与每块结果写入任务日志；
+    resume 为真且日志存在时直接沿用上次的切分计划，只抽取尚未完成的块
+    """
+    # 按 token 预算规划分块：事件块不超过正文预算，再把相邻小事件块装满一次请求
+    estimator = token_estimator or get_token_estimator()
+    prompt_args = dict(
+        global_context=global_context or "历史政治文献分析",
+        last_event_summary="事" * SUMMARY_MAX_CHARS if segments > 0 else "无",
+        text=""
+    )
+    overhead = estimator.estimate(EXTRACTION_PROMPT_WITH_CONTEXT.format(**prompt_args), with_base=True)
+    multi_overhead = estimator.estimate(EXTRACTION_PROMPT_MULTI.format(n=PACK_MAX_CHUNKS, **prompt_args), with_base=True)
+    max_size = max(target_tokens - overhead, 500)
+    min_size = max_size // CHUNK_MIN_FRACTION
+    
+    journal = JobJournal(job) if job else None
+    if journal is not None and not resume:
+        journal.reset()
+    if journal is not None and journal.plan is not None:
+        raw_chunks = journal.plan
+        st.info(f"⏯️ 续跑上次任务：{len(journal.results)}/{len(raw_chunks)} 块已完成，沿用原切分计划")
+    else:
+        raw_chunks = plan_book_chunks(
+            book_text, client, model, chunk_mode, llm_budget, estimator,
+            min_size, max_size, overhead, target_tokens,
+            break_matcher=break_matcher,
+            cohesion_sensitivity=cohesion_sensitivity,
+            agreement_sample=agreement_sample,
+            pack=pack
+        )
+        if journal is not None:
+            journal.start(raw_chunks)
+
+    # 抽取前建 MinHash/LSH 索引：与更早入队块近重复的块不再调用模型
+    duplicates = find_near_duplicates(raw_chunks, dedup_threshold) if dedup_threshold else {}
+    if duplicates:
+        st.caption(
+            f"♻️ {len(duplicates)} 个块与前文近重复（相似度 ≥ {dedup_threshold:.0%}），"
+            f"复用已有抽取结果，节省 {len(duplicates)} 次调用"
+        )
+    
+    # 任务日志里已完成的块直接取回（校验失败的重抽）
+    all_graph_data = [None] * len(raw_chunks)
+    for idx, data in (journal.results.items() if journal is not None else ()):
+        try:
+            all_graph_data[idx] = HistoricalGraphBatch(**data)
+        except Exception:
+            pass
+    queued = [i for i in range(len(raw_chunks)) if i not in duplicates and all_graph_data[i] is None]
+    
+    # 请求分组：多块打包时相邻短块合成一次请求（只含一块的组走单块提示词）
+    if pack == "multi":
+        sizes = [estimator(raw_chunks[i]) + PACK_LABEL_TOKENS for i in queued]
+        groups = [[queued[p] for p in g] for g in pack_groups(sizes, max(target_tokens - multi_overhead, 500), PACK_MAX_CHUNKS)]
+        if groups:
+            _packing_caption(
+                len(queued), len(groups), sum(sizes),
+                multi_overhead, target_tokens, estimator, "打包为（逐块返回结果）"
+            )
+    else:
+        groups = [[i] for i in queued]
+    total_requests = len(groups)
+    
+    # 产出预估：高产出请求先发（波前段内仍按原文顺序）
+    priority = None
+    if prioritize and total_requests > 1:
+        texts = ["\n\n".join(raw_chunks[i] for i in g) for g in groups]
+        priority = [yield_score(text, break_matcher) for text in texts]
+        weights = [score * len(text) / 1000 for score, text in zip(priority, texts)]  # 各请求的加权命中数
+        head = sorted(range(total_requests), key=lambda p: -priority[p])
+        head = head[:max(1, math.ceil(total_requests * preview_fraction))]
+        if sum(weights):
+            st.caption(
+                f"🎯 按产出预估优先抽取：前 {len(head)} 次请求（{len(head) / total_requests:.0%}）"
+                f"覆盖 {sum(weights[p] for p in head) / sum(weights):.0%} 的人名 / 机构 / 日期 / 断点关键词命中"
+            )
+    # 初步图谱只在按产出优先时有意义：否则先完成的只是原文开头几块
+    preview_at = None
+    if on_preview is not None and priority is not None:
+        preview_at = math.ceil(total_requests * preview_fraction)
+    if preview_at is not None and (total_requests < PREVIEW_MIN_REQUESTS or preview_at >= total_requests):
+        preview_at = None
     
     # 并行抽取（带进度条）
-    all_graph_data = [None] * total_chunks
     completed = [0]  # 用列表以便在闭包中修改
     
-    progress_bar = st.progress(0, text=f"抽取进度: 0/{total_chunks}")
+    progress_bar = st.progress(0, text=f"抽取进度: 0/{total_requests}")
+    
+    # 段内前序请求结束时（on_done）已写入结果与实体 ID 表；段首请求沿用日志里已完成的前一块（若有）
+    after = wavefront_chains(len(groups), segments)
+    pending = set(queued)
+    carried: List[Dict[str, str]] = [{} for _ in groups]
     
-    def extract_chunk(idx, chunk):
-        return idx, extract_with_context(
-            client, model, chunk,
+    def summary_for(pos):
+        if segments <= 0:
+            return "无"
+        if after[pos] is not None:
+            return rolling_summary(all_graph_data[groups[after[pos]][-1]], carried[after[pos]])
+        prev = groups[pos][0] - 1
+        batch = all_graph_data[prev] if prev >= 0 and prev not in pending else None
+        return rolling_summary(batch, carry_entities({}, batch))
+    
+    preview = StreamPreview(len(groups)) if stream else None
+    
+    async def extract_group(pos, gate):
+        owner = preview.reset(pos) if preview is not None else None  # 每次尝试（含重试 / 对冲副本）从零计数
+        batches, prompt_tokens, salvaged = await extract_many_async(
+            client, model, [raw_chunks[i] for i in groups[pos]],
             global_context=global_context,
-            last_event_summary="无"  # 并行时无法串行传递上下文
+            last_event_summary=summary_for(pos),
+            token_estimator=estimator,
+            gate=gate,
+            on_object=defer_interrupt(lambda kind, obj: preview.add(pos, kind, obj, owner)) if preview is not None else None
         )
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(extract_chunk, i, c) for i, c in enumerate(raw_chunks)]
-        for future in as_completed(futures):
-            idx, result = future.result()
-            all_graph_data[idx] = result
-            completed[0] += 1
-            progress_bar.progress(
-                completed[0] / total_chunks, 
-                text=f"抽取进度: {completed[0]}/{total_chunks}"
+        if prompt_tokens is not None:  # 只统计真实请求的产出，与遥测里的 token 对应
+            done = [b for b in batches if b is not None]
+            llm_telemetry.add_yield(
+                "extract", chunks=len(done), entities=sum(len(b.entities) for b in done),
+                events=sum(len(b.events) for b in done), relations=sum(len(b.relations) for b in done)
             )
+        return (batches, salvaged), prompt_tokens
+    
+    limiter = TokenBucketLimiter(rpm=rpm, tpm=tpm)
+    controller = AimdController(initial=min(16, max_in_flight), maximum=max_in_flight)
+    hedge_policy = HedgePolicy() if hedge else None
+    salvaged_requests = [0]
+    
+    def on_done(pos, outcome):
+        batches, salvaged = outcome.result or ([None] * len(groups[pos]), False)
+        salvaged_requests[0] += salvaged
+        for idx, batch in zip(groups[pos], batches):
+            all_graph_data[idx] = batch
+            # 抢救出的结果不完整：本次照常使用，但不记入日志，续跑时重抽
+            if journal is not None and batch is not None and not salvaged:
+                journal.record(idx, batch.model_dump())
+        carried[pos] = carry_entities_all(carried[after[pos]] if after[pos] is not None else {}, batches)
+        if preview is not None:
+            preview.done()
+        completed[0] += 1
+        progress_bar.progress(
+            completed[0] / total_requests, 
+            text=f"抽取进度: {completed[0]}/{total_requests}（并发窗口 {controller.limit:.0f}）"
+        )
+        if completed[0] == preview_at:
+            on_preview([b for b in all_graph_data if b is not None], completed[0], total_requests)
+    
+    jobs = [
+        ((multi_overhead if len(g) > 1 else overhead) + sum(estimator(raw_chunks[i]) for i in g), pos)
+        for pos, g in enumerate(groups)
+    ]
+    outcomes = run_async_jobs(
+        jobs, extract_group, limiter, max_in_flight=max_in_flight, on_done=on_done,
+        controller=controller, retries=retries, after=after, hedge=hedge_policy, timeout=timeout,
+        priority=priority
+    )
+    missing = sum(1 for i in queued if all_graph_data[i] is None) - sum(
+        len(g) for g, o in zip(groups, outcomes) if o.result is None
+    )
+    for idx in queued:
+        if all_graph_data[idx] is None:
+            all_graph_data[idx] = HistoricalGraphBatch(entities=[], events=[], relations=[])
     
     progress_bar.empty()
+    if journal is not None and journal.error:
+        st.warning(f"任务日志写入失败，本次结果不受影响，但中断后无法续跑: {journal.error}")
+    if preview is not None and preview.first_object is not None:
+        preview.clear()
+        st.caption(
+            f"⚡ 流式抽取: 首个结果 {preview.first_object:.1f}s · 首个请求完成 {preview.first_done or 0:.1f}s · "
+            f"全部完成 {time.perf_counter() - preview.t0:.1f}s"
+        )
+    if hedge_policy is not None and hedge_policy.issued:
+        st.caption(
+            f"🪝 尾延迟对冲: {hedge_policy.issued} 次请求超过 p{hedge_policy.quantile} "
+            f"（{hedge_policy.delay() or 0:.1f}s）后发出副本，其中 {hedge_policy.won} 次副本先返回；"
+            f"额外预估 {hedge_policy.extra_tokens:,} token"
+            + (f"，{hedge_policy.capped} 次因预算上限未对冲" if hedge_policy.capped else "")
+        )
+    if limiter.waited > 0:
+        st.caption(f"⏱️ 按 {rpm} RPM / {tpm:,} TPM 限流，累计排队等待 {limiter.waited:.1f}s")
+    if salvaged_requests[0]:
+        st.caption(
+            f"🩹 {salvaged_requests[0]} 次响应被截断或格式有误，"
+            f"已保留其中完整的实体 / 事件 / 关系（续跑时会重抽；可调小每次请求 token 上限减少截断）"
+        )
+    
+    # 逐次请求结果：成功 / 重试后成功 / 放弃
+    counts = {status: sum(1 for o in outcomes if o.status == status) for status in JOB_STATUS_CN}
+    if counts["retried"] or counts["dropped"]:
+        st.caption(
+            " · ".join(f"{JOB_STATUS_CN[k]} {v}" for k, v in counts.items()) +
+            f"（并发窗口峰值 {controller.peak:.0f}，收缩 {controller.shrinks} 次）"
+        )
+        with st.expander(f"逐块抽取结果（{counts['dropped']} 次请求放弃）", expanded=bool(counts["dropped"])):
+            for g, outcome in zip(groups, outcomes):
+                if outcome.status != "succeeded":
+                    label = f"块 {g[0] + 1}" + (f"–{g[-1] + 1}" if len(g) > 1 else "")
+                    line = f"{label}: {JOB_STATUS_CN[outcome.status]}，共尝试 {outcome.attempts} 次"
+                    st.write(line + (f" — {outcome.error}" if outcome.error else ""))
+    if counts["dropped"]:
+        st.warning(f"抽取警告: {counts['dropped']} 次请求多次重试仍失败，其中各块图谱为空")
+    if missing:
+        st.warning(f"抽取警告: {missing} 块在打包响应中缺失，其图谱为空（断点续跑时会重抽）")
+    for idx, rep_idx in duplicates.items():
+        all_graph_data[idx] = all_graph_data[rep_idx]
+    try:
+        estimator.save()
+    except OSError as e:
+        st.warning(f"token 估算校准未能保存（不影响本次结果）: {e}")
     return [g for g in all_graph_data if g is not None]
 
 
@@ -846,12 +1559,13 @@ def integrate_orphans(client, model, orphan_entities, orphan_events, all_entitie
 """
     
     try:
-        response = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = generate_cached(
+            client, model, prompt,
+            types.GenerateContentConfig(
                 response_mime_type="application/json"
-            )
+            ),
+            validate=json.loads,
+            stage="orphans"
         )
         data = json.loads(response.text)
         return data.get('relations', [])
@@ -1053,12 +1767,13 @@ def integrate_sparse_with_search(client, model, sparse_entities, sparse_events,
 """
     
     try:
-        response = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        response = generate_cached(
+            client, model, prompt,
+            types.GenerateContentConfig(
                 response_mime_type="application/json"
-            )
+            ),
+            validate=json.loads,
+            stage="sparse"
         )
         data = json.loads(response.text)
         new_relations = data.get("new_relations", [])
@@ -1180,11 +1895,116 @@ def build_event_graph(entities, events, relations, sensitive_node=None):
     
     return G
 
+
+# ============================================
+# 分析流程：抽取 -> 汇总 -> 孤立节点整合 -> 关系精选（Step 1 与「继续抽取剩余块」共用）
+# ============================================
+def run_analysis(documents, api_key, model, job, pipeline, min_weight, top_per_event, extra_focus):
+    """
+    documents 为 [(文件名, 每页文本（列表或惰性页序列）)]，pipeline 为 process_book_pipeline 的其余参数
+    按产出优先抽取时，完成一部分请求后给出初步图谱，可先进入审核；
+    点击后不再发出新请求，进行中的请求完成并写入任务日志后才切换；审核页「继续抽取剩余块」断点续跑
+    """
+    client = get_client(api_key)
+    preview_slot = st.empty()
+
+    def on_preview(batches, done, total):
+        entities, events, relations = aggregate_graph_batches(batches)
+        entities, events, relations, stats = prioritize_graph(
+            entities, events, relations,
+            min_weight=min_weight, top_per_event=top_per_event, extra_focus=extra_focus
+        )
+        if not events:
+            return
+        st.session_state.provisional = {
+            "entities": entities, "events": events, "relations": relations,
+            "focus_stats": stats, "done": done, "total": total
+        }
+        with preview_slot.container():
+            st.info(
+                f"🧭 初步图谱已就绪（按产出优先完成 {done}/{total} 次请求）: "
+                f"{len(events)} 事件 · {len(entities)} 实体 · {len(relations)} 关系，其余块仍在抽取"
+            )
+            st.button(
+                "先看初步图谱", on_click=open_provisional, use_container_width=True,
+                help="点击后不再发出新请求，正在进行中的请求完成并写入任务日志后进入审核页；"
+                     "之后可在审核页「继续抽取剩余块」"
+            )
+
+    # 上下文注入抽取（分块处理）
+    with st.spinner("正在进行上下文注入抽取..."):
+        batches = process_book_pipeline(
+            DocumentParagraphs(documents), client, model, job=job, on_preview=on_preview, **pipeline
+        )
+        preview_slot.empty()
+        entities, events, relations = aggregate_graph_batches(batches)
+        id_stats = duplicate_id_stats(entities, events)
+        if id_stats["groups"]:
+            st.caption(
+                f"🪪 {id_stats['groups']} 组同名节点被赋予不同 ID（多出 {id_stats['extra_ids']} 个），"
+                f"如 {' / '.join(id_stats['examples'][0])}；设置「串行段数 K」（> 0，越小越一致但越慢）可改善"
+            )
+        
+        # 整合孤立节点
+        orphan_entities, orphan_events = find_orphan_nodes(entities, events, relations)
+        if orphan_entities or orphan_events:
+            st.info(f"🔗 正在整合 {len(orphan_entities)} 个孤立实体, {len(orphan_events)} 个孤立事件...")
+            extra_relations = integrate_orphans(
+                client, model, 
+                orphan_entities, orphan_events,
+                entities, events
+            )
+            relations.extend(extra_relations)
+
+    # 关系去冗余：以事件为中心，确保每个事件有 top-N，同时按权重过滤
+    entities, events, relations, stats = prioritize_graph(
+        entities, events, relations,
+        min_weight=min_weight,
+        top_per_event=top_per_event,
+        extra_focus=extra_focus
+    )
+    st.session_state.focus_stats = stats
+
+    st.info(f"📄 切分完成: {len(batches)} 块 · 精选后 {len(relations)} 条关系")
+    
+    if events:
+        st.session_state.entities = entities
+        st.session_state.events = events
+        st.session_state.relations = relations
+        st.session_state.partial_analysis = None
+        st.success(f"✅ 完成: {len(entities)} 实体, {len(events)} 事件, {len(relations)} 关系")
+        st.session_state.step = 2
+        st.rerun()
+    else:
+        st.error("未识别到事件，请检查文档内容")
+
+
+def open_provisional():
+    """「先看初步图谱」：用初步结果进入审核页（本次运行在进行中的请求写入日志后结束）"""
+    provisional = st.session_state.provisional
+    st.session_state.entities = provisional["entities"]
+    st.session_state.events = provisional["events"]
+    st.session_state.relations = provisional["relations"]
+    st.session_state.focus_stats = provisional["focus_stats"]
+    st.session_state.partial_analysis = (provisional["done"], provisional["total"])
+    st.session_state.step = 2
+
+
+def continue_analysis():
+    st.session_state.partial_analysis = None
+    st.session_state.continue_analysis = True
+    st.session_state.step = 1
+
+
 # API Config
 with st.container():
     col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
     with col2:
         api_key = st.text_input("API Key", type="password", placeholder="Gemini API Key", label_visibility="collapsed")
+        if LLM_BACKEND != "live":
+            st.caption(f"🎞️ LLM 后端: {LLM_BACKEND}（磁带目录 {REPLAY_DIR}）")
+        if not needs_api_key():
+            api_key = api_key or "replay"  # 回放模式不联网，无需真实 Key
     with col3:
         model = st.text_input("Model", value="gemini-3-flash-preview", placeholder="模型名称", label_visibility="collapsed")
 
@@ -1235,6 +2055,40 @@ with st.sidebar:
     st.write(f"实体: {len(st.session_state.entities)}")
     st.write(f"事件: {len(st.session_state.events)}")
     st.write(f"关系: {len(st.session_state.relations)}")
+    
+    st.markdown("---")
+    st.markdown("**LLM 响应缓存**")
+    cache_stats = llm_cache.stats()
+    st.write(f"命中: {cache_stats['hits']} / 未命中: {cache_stats['misses']}")
+    st.caption(
+        f"命中率 {cache_stats['hit_rate']:.0%} · {cache_stats['entries']} 条 · "
+        f"{cache_stats['bytes'] / 1024 / 1024:.1f} MB"
+    )
+    
+    st.markdown("---")
+    st.markdown("**LLM 调用遥测**")
+    telemetry_runs = st.session_state.get("telemetry_runs", [])
+    telemetry = llm_telemetry.summary(telemetry_runs[-1]) if telemetry_runs else {}
+    if not telemetry:
+        st.caption("本轮尚无模型调用")
+    for stage, row in telemetry.items():
+        st.write(f"{STAGE_CN.get(stage, stage)}: {row['calls']} 次请求 / 缓存 {row['cache_hits']}")
+        line = (
+            f"p50 {row['p50']:.1f}s · p95 {row['p95']:.1f}s · p99 {row['p99']:.1f}s  \n"
+            f"输入 {row['input_tokens']:,} / 输出 {row['output_tokens']:,} token · ≈${row['cost']:.3f}"
+        )
+        if row["retries"] or row["errors"] or row["cancelled"]:
+            line += f"  \n重试 {row['retries']} 次 · 失败 {row['errors']} 次 · 取消 {row['cancelled']} 次（对冲落败 / 超时）"
+        if "tokens_per_chunk" in row:
+            line += f"  \n每块 {row['tokens_per_chunk']:,.0f} token"
+        if "entities_per_1k_tokens" in row:
+            line += f" · 每千 token {row['entities_per_1k_tokens']:.1f} 个实体"
+        st.caption(line)
+    if telemetry_runs:
+        st.download_button(
+            "导出遥测 (JSONL)", llm_telemetry.to_jsonl(telemetry_runs),
+            file_name="llm_telemetry.jsonl", mime="application/x-ndjson", use_container_width=True
+        )
 
 # ============================================
 # Step 1: Upload & Extract
@@ -1255,9 +2109,9 @@ if st.session_state.step == 1:
         # 切分模式
         chunk_mode = st.radio(
             "切分模式",
-            ["混合切分（推荐）", "纯规则", "固定长度"],
+            ["混合切分（推荐）", "纯规则", "本地衔接度", "固定长度"],
             horizontal=True,
-            help="混合切分：规则+少量 LLM 校验，兼顾准确与速度"
+            help="混合切分：规则+少量 LLM 校验，兼顾准确与速度；本地衔接度：规则+字符 n-gram 衔接度，无 LLM 调用"
         )
         
         # Recall 优先：默认给更高的 LLM 校验预算，降低误切导致的漏抽
@@ -1271,6 +2125,21 @@ if st.session_state.step == 1:
                 step=5,
                 help="Recall 优先：值越大越不容易漏事件（但会变慢）"
             )
+        cohesion_sensitivity, agreement_sample = COHESION_SENSITIVITY, 0
+        if "衔接" in chunk_mode:
+            cohesion_sensitivity = st.slider(
+                "衔接度阈值",
+                min_value=0.0,
+                max_value=2.0,
+                value=COHESION_SENSITIVITY,
+                step=0.05,
+                help="值越大切得越少；低谷深度超过 均值 + 阈值 × 标准差 时切分"
+            )
+            if st.checkbox("抽样对比 LLM 断点判定", help="少量 LLM 调用，用于检验本地判定是否可靠"):
+                agreement_sample = st.slider(
+                    "抽样断点数", min_value=10, max_value=120,
+                    value=COHESION_AGREEMENT_SAMPLE, step=10
+                )
 
         st.markdown("---")
         with st.expander("Advanced Settings", expanded=False):
@@ -1287,6 +2156,84 @@ if st.session_state.step == 1:
                 step=1,
                 help="Recall 优先建议 2-4：越低越不漏（但更冗余）"
             )
+            break_doc_type = st.selectbox(
+                "断点关键词集合",
+                list(BREAK_KEYWORD_SETS.keys()),
+                format_func=lambda x: BREAK_KEYWORD_SET_CN.get(x, x),
+                help="按文档类型选择事件切分的断点关键词"
+            )
+            break_extra_raw = st.text_input(
+                "自定义断点关键词（可选）",
+                placeholder="用逗号分隔，例如：第六章,附录,后记...",
+                help="段首 50 字内出现这些词时直接切分"
+            )
+            target_tokens = st.slider(
+                "每次请求输入 token 上限",
+                min_value=2000,
+                max_value=16000,
+                value=CHUNK_TARGET_TOKENS,
+                step=500,
+                help="按本地估算的 token 数装块：越大请求越少，但单次输出更长、更易截断"
+            )
+            pack_mode = st.radio(
+                "小块装入请求的方式",
+                ["多块打包", "拼接正文"],
+                horizontal=True,
+                help="多块打包：几个短块共用一次请求，按片段返回逐块结果（近重复复用、断点续跑仍按块）；"
+                     "拼接正文：相邻块直接拼成一段文本抽取"
+            )
+            dedup_threshold = st.slider(
+                "近重复块复用阈值",
+                min_value=0.5,
+                max_value=1.0,
+                value=DEDUP_THRESHOLD,
+                step=0.05,
+                help="多个版本/合集重叠时，与前文相似度超过该值的块直接复用已有抽取结果"
+            )
+            rpm_col, tpm_col = st.columns(2)
+            rpm = rpm_col.number_input(
+                "每分钟请求上限 (RPM)", min_value=1, max_value=30000, value=EXTRACT_RPM, step=50,
+                help="按账号配额填写；抽取请求按令牌桶匀速发出，避免 429"
+            )
+            tpm = tpm_col.number_input(
+                "每分钟 token 上限 (TPM)", min_value=10000, max_value=100000000,
+                value=EXTRACT_TPM, step=100000,
+                help="按账号配额填写（输入 token，按本地估算预扣、实际用量修正）"
+            )
+            segments = st.slider(
+                "串行段数 K",
+                min_value=0,
+                max_value=64,
+                value=EXTRACT_SEGMENTS,
+                step=1,
+                help="0（默认）= 全并行、不传前情提要，吞吐最高。K > 0 时把全书切成 K 段，"
+                     "段内逐块串行并传递前情提要，实体/事件 ID 更一致，但每段是一条背靠背的调用链："
+                     "总耗时约为 (请求数/K) × 单次延迟，如 3000 块、K=8 时每段约 375 次串行调用，"
+                     "比全并行慢一个数量级以上；并发、限流、AIMD 与按产出优先排序都只能在段间发挥作用"
+            )
+            stream_extract = st.checkbox(
+                "流式抽取（实时预览）",
+                value=True,
+                help="边生成边解析：实体 / 事件 / 关系一出现就计数并显示局部图谱，不必等最慢的块返回"
+            )
+            hedge_extract = st.checkbox(
+                "尾延迟对冲",
+                value=True,
+                help="某块请求超过已完成请求的 p95 耗时仍未返回时，再发一份相同请求，取先返回者；"
+                     "额外花费不超过全部请求预估 token 的 10%，单次调用超时后自动重试"
+            )
+            prioritize_extract = st.checkbox(
+                "按产出优先抽取（初步图谱）",
+                value=True,
+                help="按人名 / 机构 / 日期 / 断点关键词的密度给各块打分，先抽高产出的块；"
+                     f"完成约 {PREVIEW_FRACTION:.0%} 的请求后即可先查看初步图谱，其余块稍后继续。"
+                     "段内须按原文顺序传递前情提要，串行段数 K 越小排序效果越弱（K = 0 时完全按产出排序）"
+            )
+            resume_job = st.checkbox(
+                "断点续跑",
+                value=True,
+                help="相同文件与参数再次运行时，沿用上次的切分并只抽取未完成的块（中断、刷新或崩溃后可继续）"
+            )
             top_per_event = st.slider(
                 "每个事件至少保留前 N 条关系",
                 min_value=3,
@@ -1299,6 +2246,12 @@ if st.session_state.step == 1:
         files = st.file_uploader("上传文档", accept_multiple_files=True, type=["pdf", "epub", "docx", "txt"],
                                  label_visibility="collapsed")
         
+        # 审核页点了「继续抽取剩余块」：沿用上次的文件与参数，从任务日志断点续跑
+        if st.session_state.pop("continue_analysis", False) and st.session_state.get("analysis"):
+            analysis = st.session_state.analysis
+            start_telemetry_run("resume", model=analysis["model"], job=analysis["job"])
+            run_analysis(**dict(analysis, pipeline=dict(analysis["pipeline"], resume=True)))
+        
         if files:
             st.markdown(f"<p style='text-align:center; color:#86868b;'>已选择 {len(files)} 个文件</p>", 
                        unsafe_allow_html=True)
@@ -1307,62 +2260,69 @@ if st.session_state.step == 1:
                 if not api_key:
                     st.error("请填写 API Key")
                 else:
-                    all_text = ""
-                    for f in files:
-                        all_text += read_file(f, api_key) + "\n\n"
+                    # 本次分析的全部模型调用（OCR / 断点 / 抽取 / 孤立节点）记为一轮遥测，附带可调参数
+                    start_telemetry_run(
+                        "analyze", model=model, chunk_mode=chunk_mode, target_tokens=target_tokens,
+                        llm_budget=llm_budget, segments=segments, pack=pack_mode, stream=stream_extract,
+                        hedge=hedge_extract, prioritize=prioritize_extract,
+                        rpm=int(rpm), tpm=int(tpm), max_in_flight=EXTRACT_MAX_IN_FLIGHT
+                    )
+                    # 各文件按页保留（EPUB / DOCX / TXT 为惰性页序列），不拼接整本；切分器按段落流逐段消费
+                    documents = ingest_uploads(files, api_key)
+                    # 逐页增量哈希 + 字数统计（一遍扫描，不拼接全文）
+                    digests = [digest_pages(pages) for _, pages in documents]
                     
-                    if len(all_text.strip()) < 100:
+                    if sum(chars for _, chars in digests) < 100:
                         st.error("文件内容过少")
                     else:
-                        st.session_state.text_content = all_text
                         st.session_state.global_context = global_context
                         client = get_client(api_key)
                         
-                        mode = "hybrid" if "混合" in chunk_mode else ("rule" if "规则" in chunk_mode else "fixed")
+                        mode = (
+                            "hybrid" if "混合" in chunk_mode
+                            else "rule" if "规则" in chunk_mode
+                            else "cohesion" if "衔接" in chunk_mode
+                            else "fixed"
+                        )
+                        
+                        pack = "multi" if "打包" in pack_mode else "merge"
+                        
+                        # 任务 ID：文件内容 + 影响切分/抽取的全部参数，相同即可续跑
+                        job = job_id(
+                            model, mode, target_tokens, llm_budget, cohesion_sensitivity, segments, pack,
+                            break_doc_type, break_extra_raw, global_context,
+                            *(f"{name}:{digest}" for (name, _), (digest, _) in zip(documents, digests))
+                        )
                         
-                        # 上下文注入抽取（分块处理）
-                        with st.spinner("正在进行上下文注入抽取..."):
-                            batches = process_book_pipeline(
-                                all_text, client, model,
+                        # 保存本次分析的输入与参数：看过初步图谱后「继续抽取剩余块」原样沿用
+                        st.session_state.analysis = dict(
+                            documents=documents, api_key=api_key, model=model, job=job,
+                            pipeline=dict(
                                 global_context=global_context,
                                 chunk_mode=mode,
-                                llm_budget=llm_budget
-                            )
-                            entities, events, relations = aggregate_graph_batches(batches)
-                            
-                            # 整合孤立节点
-                            orphan_entities, orphan_events = find_orphan_nodes(entities, events, relations)
-                            if orphan_entities or orphan_events:
-                                st.info(f"🔗 正在整合 {len(orphan_entities)} 个孤立实体, {len(orphan_events)} 个孤立事件...")
-                                extra_relations = integrate_orphans(
-                                    client, model, 
-                                    orphan_entities, orphan_events,
-                                    entities, events
-                                )
-                                relations.extend(extra_relations)
-
-                        extra_focus = [s.strip() for s in (focus_extra_raw or "").split(",") if s.strip()]
-
-                        # 关系去冗余：以事件为中心，确保每个事件有 top-N，同时按权重过滤
-                        entities, events, relations, stats = prioritize_graph(
-                            entities, events, relations,
+                                llm_budget=llm_budget,
+                                target_tokens=target_tokens,
+                                break_matcher=get_break_matcher(
+                                    break_doc_type,
+                                    [s.strip() for s in (break_extra_raw or "").split(",") if s.strip()]
+                                ),
+                                cohesion_sensitivity=cohesion_sensitivity,
+                                agreement_sample=agreement_sample,
+                                dedup_threshold=dedup_threshold,
+                                segments=segments,
+                                pack=pack,
+                                stream=stream_extract,
+                                hedge=hedge_extract,
+                                prioritize=prioritize_extract,
+                                rpm=int(rpm),
+                                tpm=int(tpm),
+                                resume=resume_job
+                            ),
                             min_weight=min_weight,
                             top_per_event=top_per_event,
-                            extra_focus=extra_focus
+                            extra_focus=[s.strip() for s in (focus_extra_raw or "").split(",") if s.strip()]
                         )
-                        st.session_state.focus_stats = stats
-
-                        st.info(f"📄 切分完成: {len(batches)} 块 · 精选后 {len(relations)} 条关系")
-                        
-                        if events:
-                            st.session_state.entities = entities
-                            st.session_state.events = events
-                            st.session_state.relations = relations
-                            st.success(f"✅ 完成: {len(entities)} 实体, {len(events)} 事件, {len(relations)} 关系")
-                            st.session_state.step = 2
-                            st.rerun()
-                        else:
-                            st.error("未识别到事件，请检查文档内容")
+                        run_analysis(**st.session_state.analysis)
 
 # ============================================
 # Step 2: Review Events & Entities
@@ -1376,6 +2336,14 @@ elif st.session_state.step == 2:
     </div>
     """, unsafe_allow_html=True)
     
+    if st.session_state.get("partial_analysis"):
+        done, total = st.session_state.partial_analysis
+        st.warning(
+            f"🧭 当前为初步图谱：按产出优先完成了 {done}/{total} 次抽取请求，其余块尚未抽取"
+            f"（已完成的块保存在任务日志中，继续时不会重抽）"
+        )
+        st.button("继续抽取剩余块", on_click=continue_analysis, use_container_width=True)
+    
     entities = st.session_state.entities
     events = st.session_state.events
     relations = st.session_state.relations
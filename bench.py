@@ -0,0 +1,1118 @@
+#!/usr/bin/env python3
+"""
+性能基准 - 离线运行，不需要 API Key
+用法:
+    python bench.py pdf --pages 600
+    python bench.py ocr --pages 200 --in-flight 4
+    python bench.py epub --chapters 300
+    python bench.py docx --paragraphs 50000
+    python bench.py keywords --lines 300000
+    python bench.py tokens --events 2000 --min-sentences 5 --max-sentences 60
+    python bench.py extract --chunks 300 --rpm 60 --window 5
+    python bench.py decode --items 3000
+    python bench.py stream --requests 40 --objects 60
+    python bench.py replay --requests 200 --latency 0.2 --error-rate 0.1
+    python bench.py wavefront --chunks 200 --segments 0 4 16 64
+    python bench.py hedge --requests 200 --straggler-rate 0.02 --timeout 5
+    python bench.py yield --chunks 300 --rpm 3000
+    python bench.py gate-timeout --jobs 30 --rpm 600 --timeout 0.3
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from types import SimpleNamespace
+
+# ============================================
+# 合成数据
+# ============================================
+WORDS = ["meeting", "congress", "policy", "army", "province", "committee",
+         "report", "delegate", "campaign", "resolution", "border", "treaty"]
+
+
+def make_synthetic_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """生成多页纯文本 PDF（Helvetica 标准字体，无需外部依赖）"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages，稍后填充
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(pages):
+        lines = [f"Page {p + 1}"] + [
+            " ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(lines_per_page)
+        ]
+        ops = ["BT /F1 10 Tf 12 TL 40 800 Td"] + [f"({line}) Tj T*" for line in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), pages
+    )
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+ZH_SENTENCES = ["会议在延安召开，与会代表讨论了当前形势。", "第二天，部队前往前线。",
+                "他在会上作报告，提出了新的方针。", "此后，各地相继成立委员会。"]
+
+
+def make_synthetic_epub(chapters: int, paras_per_chapter: int = 120, seed: int = 0) -> bytes:
+    """生成多章节 EPUB（manifest 顺序与 spine 顺序相反，用于检验阅读顺序）"""
+    rng = random.Random(seed)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" '
+            'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ))
+        items, refs = [], []
+        for c in range(chapters):
+            paras = "".join(
+                f"<p>{''.join(rng.choice(ZH_SENTENCES) for _ in range(4))}</p>"
+                for _ in range(paras_per_chapter)
+            )
+            zf.writestr(f"OEBPS/ch{c:04d}.xhtml", (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>第' + str(c + 1) + '章</title>'
+                '<style>p { text-indent: 2em; }</style></head><body>'
+                f'<h1>第{c + 1}章</h1>{paras}<script>var x = 1;</script></body></html>'
+            ))
+            items.insert(0, f'<item id="ch{c}" href="ch{c:04d}.xhtml" media-type="application/xhtml+xml"/>')
+            refs.append(f'<itemref idref="ch{c}"/>')
+        zf.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">bench</dc:identifier>'
+            '<dc:title>bench</dc:title><dc:language>zh</dc:language></metadata>'
+            f'<manifest>{"".join(items)}</manifest><spine>{"".join(refs)}</spine></package>'
+        ))
+    return buf.getvalue()
+
+
+def make_synthetic_docx(paragraphs: int, table_every: int = 200, seed: int = 0) -> bytes:
+    """生成大 DOCX：正文段落中每隔 table_every 段插入一张 3x4 表格"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph("".join(rng.choice(ZH_SENTENCES) for _ in range(3)))
+        if table_every and (i + 1) % table_every == 0:
+            table = doc.add_table(rows=3, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"表{i // table_every + 1}-{r}{c}"
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+# ============================================
+# 本地假客户端（模拟 Gemini files / models 接口）
+# ============================================
+class FakeGeminiClient:
+    """
+    模拟文件上传处理延迟、流式生成延迟与随机失败
+    识别结果为每页的确定性文本，便于核对页序
+    """
+
+    def __init__(self, processing_delay=0.5, token_delay=0.02, fail_rate=0.0, seed=0):
+        self.processing_delay = processing_delay
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._files = {}
+        self.files = SimpleNamespace(upload=self._upload, get=self._get)
+        self.models = SimpleNamespace(generate_content_stream=self._generate_content_stream)
+
+    def _upload(self, file, config=None):
+        import pypdf
+        data = file.read() if hasattr(file, "read") else open(file, "rb").read()
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        first_lines = [(p.extract_text() or "").split("\n")[0] for p in reader.pages]
+        with self._lock:
+            name = f"files/fake-{next(self._ids)}"
+            failed = self._rng.random() < self.fail_rate
+        self._files[name] = (time.monotonic() + self.processing_delay, failed, first_lines)
+        return self._get(name=name)
+
+    def _get(self, name, config=None):
+        ready_at, failed, _ = self._files[name]
+        if time.monotonic() < ready_at:
+            state = "PROCESSING"
+        else:
+            state = "FAILED" if failed else "ACTIVE"
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=state))
+
+    def _generate_content_stream(self, model, contents, config=None):
+        uploaded = contents[0]
+        _, _, first_lines = self._files[uploaded.name]
+        for n, line in enumerate(first_lines, start=1):
+            time.sleep(self.token_delay)
+            yield SimpleNamespace(text=f"=== PAGE {n} ===\nOCR {line}\n")
+
+
+class FakeLLMServer:
+    """
+    本地 HTTP 假 Gemini 服务（generateContent 接口），按滑动窗口执行 RPM / TPM 配额：
+    窗口内超额的请求立即返回 429；正常请求延迟 latency 秒后返回空图谱 JSON
+    输入 token 数按请求体里的文本字符数计
+    """
+
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0, latency: float = 0.5, seed: int = 0):
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.rpm, self.tpm, self.window, self.latency = rpm, tpm, window, latency
+        self.accepted = 0
+        self.rejected = 0
+        self._log = []  # (时间, token 数)
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                tokens = sum(len(p.get("text", "")) for c in body.get("contents", []) for p in c.get("parts", []))
+                if not server._admit(tokens):
+                    payload = {"error": {"code": 429, "message": "Resource exhausted", "status": "RESOURCE_EXHAUSTED"}}
+                    return self._reply(429, payload)
+                time.sleep(server.latency * (0.5 + server._rng.random()))
+                text = '{"entities": [], "events": [], "relations": []}'
+                self._reply(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                    "usageMetadata": {"promptTokenCount": tokens, "candidatesTokenCount": 12,
+                                      "totalTokenCount": tokens + 12},
+                })
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def _admit(self, tokens: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._log = [(t, n) for t, n in self._log if now - t < self.window]
+            if len(self._log) + 1 > self.rpm or sum(n for _, n in self._log) + tokens > self.tpm:
+                self.rejected += 1
+                return False
+            self._log.append((now, tokens))
+            self.accepted += 1
+            return True
+
+    def client(self):
+        from google import genai
+        return genai.Client(api_key="bench", http_options={"base_url": self.base_url})
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+# ============================================
+# 基准项
+# ============================================
+def bench_pdf(args):
+    import pypdf
+    from doc_reader import extract_pdf_pages, join_pages, summarize_timings
+
+    data = make_synthetic_pdf(args.pages)
+    print(f"合成 PDF: {args.pages} 页, {len(data) / 1024:.0f} KB")
+
+    t0 = time.perf_counter()
+    serial = ""
+    for page in pypdf.PdfReader(io.BytesIO(data)).pages:
+        serial += (page.extract_text() or "") + "\n"
+    t_serial = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pages, timings, _ = extract_pdf_pages(data, max_workers=args.workers)
+    parallel = join_pages(pages)
+    t_parallel = time.perf_counter() - t0
+
+    summary = summarize_timings(timings)
+    print(f"串行: {t_serial:.2f}s")
+    print(f"并行: {t_parallel:.2f}s  (x{t_serial / max(t_parallel, 1e-9):.1f})")
+    print(f"单页平均 {summary['mean'] * 1000:.1f}ms, 最慢 {summary['slowest']}")
+    print(f"输出一致: {serial == parallel}")
+
+
+def bench_ocr(args):
+    from doc_reader import batch_pages, join_pages, run_ocr_batches, splice_pages
+
+    data = make_synthetic_pdf(args.pages, lines_per_page=5)
+    batches = batch_pages(list(range(args.pages)), 10)
+    print(f"合成 PDF: {args.pages} 页, {len(batches)} 批, 失败率 {args.fail_rate}")
+
+    def prompt(batch):
+        return f"{len(batch)} pages"
+
+    results = {}
+    for in_flight in (1, args.in_flight):
+        client = FakeGeminiClient(
+            processing_delay=args.processing_delay, token_delay=args.token_delay,
+            fail_rate=args.fail_rate, seed=args.seed
+        )
+        states = {}
+
+        def on_event(event):
+            states[event["state"]] = states.get(event["state"], 0) + 1
+            if event["state"] in ("done", "failed") and args.verbose:
+                print(f"  批 {event['batch']+1}: {event['state']} {event['done']}/{event['total']} "
+                      f"ETA {event['eta']:.1f}s")
+
+        t0 = time.perf_counter()
+        pages = run_ocr_batches(client, "fake", data, batches, prompt,
+                                max_in_flight=in_flight, poll_interval=0.05, on_event=on_event)
+        elapsed = time.perf_counter() - t0
+        results[in_flight] = join_pages(splice_pages([""] * args.pages, pages))
+        print(f"在途 {in_flight}: {elapsed:.2f}s, 识别 {len(pages)} 页, 重试 {states.get('retrying', 0)}, "
+              f"失败 {states.get('failed', 0)}")
+
+    expected = join_pages([f"OCR Page {i + 1}" for i in range(args.pages)])
+    if not args.fail_rate:
+        print(f"页序正确: {all(r == expected for r in results.values())}")
+
+
+def _legacy_read_epub(data):
+    """改造前的读取路径：临时文件 + ebooklib + html.parser 逐项串行"""
+    import os
+    import ebooklib
+    from bs4 import BeautifulSoup
+    from ebooklib import epub
+
+    text = ""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".epub") as tmp:
+        tmp.write(data)
+        path = tmp.name
+    try:
+        book = epub.read_epub(path, options={'ignore_ncx': True})
+        for item in book.get_items():
+            if item.get_type() == ebooklib.ITEM_DOCUMENT:
+                soup = BeautifulSoup(item.get_content(), "html.parser")
+                for tag in soup(['script', 'style']):
+                    tag.decompose()
+                text += soup.get_text(separator='\n', strip=True) + "\n"
+    finally:
+        os.remove(path)
+    return text
+
+
+def bench_epub(args):
+    from doc_reader import iter_epub_chapters
+
+    data = make_synthetic_epub(args.chapters)
+    print(f"合成 EPUB: {args.chapters} 章, {len(data) / 1024:.0f} KB")
+
+    t0 = time.perf_counter()
+    legacy = _legacy_read_epub(data)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pages = list(iter_epub_chapters(data, max_workers=args.workers))
+    t_new = time.perf_counter() - t0
+
+    print(f"原路径 (ebooklib + html.parser): {t_legacy:.2f}s")
+    print(f"新路径 (zip + lxml, spine 并行): {t_new:.2f}s  (x{t_legacy / max(t_new, 1e-9):.1f})")
+    first = [p.split("\n", 1)[0] for p in pages[:3]]
+    print(f"阅读顺序: {first} ...")
+    same = sorted(legacy.split()) == sorted(line for p in pages for line in p.split())
+    print(f"文本行集合一致: {same}")
+
+
+def _docx_legacy(data):
+    from docx import Document
+    return [p.text for p in Document(io.BytesIO(data)).paragraphs]
+
+
+def _docx_stream(data):
+    from doc_reader import iter_docx_paragraphs
+    return [line for line in iter_docx_paragraphs(data)]
+
+
+def _run_with_rss(fn, data):
+    """在子进程中运行，返回 (结果, 耗时, 峰值 RSS 增量 MB)；lxml 的内存不在 tracemalloc 统计范围内"""
+    import resource
+    import doc_reader  # noqa: F401  预先导入，避免把模块加载计入增量
+    import docx  # noqa: F401
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    result = fn(data)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result, elapsed, (peak - base) / 1024
+
+
+def bench_docx(args):
+    from concurrent.futures import ProcessPoolExecutor
+    from doc_reader import DOCX_CELL_SEP
+
+    data = make_synthetic_docx(args.paragraphs)
+    print(f"合成 DOCX: {args.paragraphs} 段, {len(data) / 1024:.0f} KB")
+
+    runs = {}
+    for name, fn in (("legacy", _docx_legacy), ("stream", _docx_stream)):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            runs[name] = executor.submit(_run_with_rss, fn, data).result()
+
+    legacy, t_legacy, m_legacy = runs["legacy"]
+    lines, t_new, m_new = runs["stream"]
+    table_rows = sum(1 for line in lines if DOCX_CELL_SEP in line)
+    print(f"python-docx 对象模型: {t_legacy:.2f}s, 峰值 RSS +{m_legacy:.1f} MB, {len(legacy)} 段（不含表格）")
+    print(f"iterparse 流式:       {t_new:.2f}s, 峰值 RSS +{m_new:.1f} MB, "
+          f"{len(lines) - table_rows} 段 + {table_rows} 表格行")
+    print(f"正文段落一致: {[line for line in lines if DOCX_CELL_SEP not in line] == legacy}")
+
+
+def bench_keywords(args):
+    from chunk_tools import EVENT_BREAK_KEYWORDS, get_break_matcher
+
+    rng = random.Random(args.seed)
+    filler = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就"
+    lines = []
+    for _ in range(args.lines):
+        line = "".join(rng.choice(filler) for _ in range(rng.randint(4, 40)))
+        if rng.random() < 0.05:
+            pos = rng.randint(0, len(line))
+            line = line[:pos] + rng.choice(EVENT_BREAK_KEYWORDS) + line[pos:]
+        lines.append(line)
+    print(f"合成 OCR 短行: {len(lines)} 行, 关键词 {len(EVENT_BREAK_KEYWORDS)} 个")
+
+    def legacy(para_start):
+        for kw in EVENT_BREAK_KEYWORDS:
+            if kw in para_start[:50]:
+                return True
+        return False
+
+    matcher = get_break_matcher()
+    t0 = time.perf_counter()
+    old = [legacy(line) for line in lines]
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    new = [matcher(line) for line in lines]
+    t_new = time.perf_counter() - t0
+
+    print(f"逐词子串循环: {t_old:.3f}s")
+    print(f"编译匹配器:   {t_new:.3f}s  (x{t_old / max(t_new, 1e-9):.1f})")
+    print(f"判定一致: {old == new}, 命中 {sum(new)} 行")
+
+
+def bench_cohesion(args):
+    from chunk_tools import cohesion_breaks
+
+    # 合成话题段：同一话题内各段从同一组常用字里抽字，话题之间随机切换
+    rng = random.Random(args.seed)
+    pool = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严龙飞"
+    topics = ["".join(rng.sample(pool, 40)) for _ in range(24)]
+    paragraphs, truth = [], set()
+    while len(paragraphs) < args.paragraphs:
+        vocab = rng.choice(topics)
+        truth.add(len(paragraphs))
+        for _ in range(rng.randint(4, 12)):
+            paragraphs.append("".join(rng.choice(vocab) for _ in range(rng.randint(20, 80))))
+    truth.discard(0)
+    print(f"合成段落: {len(paragraphs)} 段, 话题切换 {len(truth)} 处")
+
+    for sensitivity in args.sensitivities:
+        t0 = time.perf_counter()
+        breaks = cohesion_breaks(paragraphs, sensitivity)
+        elapsed = time.perf_counter() - t0
+        found = {int(j) for j in breaks.nonzero()[0]}
+        hit = len(found & truth)
+        recall, precision = hit / max(len(truth), 1), hit / max(len(found), 1)
+        f1 = 2 * recall * precision / max(recall + precision, 1e-9)
+        print(
+            f"阈值 {sensitivity:.2f}: {elapsed:.3f}s, 判定断点 {len(found)} 处, "
+            f"命中 {hit} (召回 {recall:.0%}, 精确 {precision:.0%}, F1 {f1:.2f})"
+        )
+
+
+def bench_tokens(args):
+    from chunk_tools import TokenEstimator, pack_chunks, pack_groups
+
+    # 合成事件块：中文叙述夹杂年份与拉丁人名，长度不一（模拟旧字符档位切出的块）
+    rng = random.Random(args.seed)
+    names = ["Mao Zedong", "Zhou Enlai", "Edgar Snow", "Anna Louise Strong"]
+    events = []
+    for _ in range(args.events):
+        parts = []
+        for _ in range(rng.randint(args.min_sentences, args.max_sentences)):
+            parts.append(rng.choice(ZH_SENTENCES))
+            if rng.random() < 0.3:
+                parts.append(f"{rng.randint(1921, 1976)}年{rng.choice(names)}")
+        events.append("".join(parts))
+    estimator = TokenEstimator()
+    overhead = args.overhead
+    budget = args.target - overhead
+
+    t0 = time.perf_counter()
+    packed = pack_chunks(events, estimator, budget)
+    elapsed = time.perf_counter() - t0
+    est_tokens = sum(estimator(e) for e in events)
+    print(f"合成事件块: {len(events)} 个, 正文约 {est_tokens:,} tokens（估算）")
+    print(f"逐块请求:   {len(events)} 次, 提示词开销 {len(events) * overhead:,} tokens")
+    print(
+        f"按预算装块: {len(packed)} 次, 提示词开销 {len(packed) * overhead:,} tokens, "
+        f"最大 {max(estimator(c) for c in packed) + overhead:,} / {args.target:,}  ({elapsed:.3f}s)"
+    )
+    # 多块打包：逐块返回结果，每块多一个片段标题，提示词多一段多片段说明，每次最多 max_pack 块
+    multi_overhead = overhead + args.multi_extra
+    sizes = [estimator(e) + args.label_tokens for e in events]
+    groups = pack_groups(sizes, args.target - multi_overhead, args.max_pack)
+    print(
+        f"多块打包:   {len(groups)} 次, 提示词开销 {len(groups) * multi_overhead + len(events) * args.label_tokens:,} tokens, "
+        f"平均 {len(events) / len(groups):.1f} 块/次（逐块返回结果）"
+    )
+
+
+def bench_dedup(args):
+    from chunk_tools import find_near_duplicates
+
+    # 合成多版本：第二版 = 第一版逐字按 edit_rate 随机替换（模拟 OCR / 校订差异），再混入新章节
+    rng = random.Random(args.seed)
+    pool = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力"
+    first = ["".join(rng.choice(pool) for _ in range(args.chunk_chars)) for _ in range(args.chunks)]
+    second = [
+        "".join(rng.choice(pool) if rng.random() < args.edit_rate else ch for ch in chunk)
+        for chunk in first[: args.chunks // 2]
+    ]
+    fresh = ["".join(rng.choice(pool) for _ in range(args.chunk_chars)) for _ in range(args.chunks // 4)]
+    chunks = first + second + fresh
+    print(f"合成块: {len(chunks)} 个（第一版 {len(first)}，重叠版 {len(second)}，新章节 {len(fresh)}）")
+
+    t0 = time.perf_counter()
+    duplicates = find_near_duplicates(chunks, args.threshold)
+    elapsed = time.perf_counter() - t0
+    expected = {len(first) + i: i for i in range(len(second))}
+    hit = sum(1 for k, v in duplicates.items() if expected.get(k) == v)
+    print(f"索引 + 查询: {elapsed:.3f}s")
+    print(f"近重复: {len(duplicates)} 个（正确对应 {hit}/{len(second)}，误判 {len(duplicates) - hit}），节省 {len(duplicates)} 次调用")
+
+
+def bench_extract(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_runtime import AimdController, TokenBucketLimiter, run_async_jobs
+
+    # 配额按 window 秒计（缩短窗口以便快速跑完），rpm / tpm 即每个窗口的额度
+    rng = random.Random(args.seed)
+    chunks = ["".join(rng.choice(ZH_SENTENCES) for _ in range(rng.randint(20, 60))) for _ in range(args.chunks)]
+    model = "gemini-bench"
+    print(f"假服务配额: 每 {args.window:.0f}s {args.rpm} 请求 / {args.tpm:,} tokens，延迟约 {args.latency}s；"
+          f"{len(chunks)} 块，共 {sum(map(len, chunks)):,} tokens")
+
+    def report(name, server, elapsed, ok):
+        print(f"{name}: {elapsed:6.2f}s, 成功 {ok}/{len(chunks)}, 429 {server.rejected} 次, "
+              f"{ok / elapsed:.1f} 块/s")
+
+    # 原方案：5 线程同步调用，无限流（429 即丢块）
+    server = FakeLLMServer(args.rpm, args.tpm, args.window, args.latency, args.seed)
+    client = server.client()
+
+    def call(chunk):
+        try:
+            client.models.generate_content(model=model, contents=chunk)
+            return True
+        except Exception:
+            return False
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        ok = sum(executor.map(call, chunks))
+    report("线程池 x5      ", server, time.perf_counter() - t0, ok)
+    server.close()
+
+    # asyncio 方案：(名称, 是否按真实配额限流, 是否 AIMD + 重试)
+    scenarios = [
+        ("asyncio 无限流 ", False, False),
+        ("asyncio + 令牌桶", True, False),
+        ("AIMD + 退避重试", False, True),
+    ]
+    for name, limited, adaptive in scenarios:
+        server = FakeLLMServer(args.rpm, args.tpm, args.window, args.latency, args.seed)
+        client = server.client()
+
+        async def worker(chunk, gate):
+            await gate()
+            response = await client.aio.models.generate_content(model=model, contents=chunk)
+            return True, response.usage_metadata.prompt_token_count
+
+        if limited:
+            limiter = TokenBucketLimiter(args.rpm, args.tpm, burst=args.window / 10, period=args.window)
+        else:
+            limiter = TokenBucketLimiter(10 ** 9, 10 ** 12, period=args.window)
+        controller = AimdController(initial=8, maximum=args.in_flight) if adaptive else None
+        t0 = time.perf_counter()
+        outcomes = run_async_jobs(
+            [(len(c), c) for c in chunks], worker, limiter, max_in_flight=args.in_flight,
+            controller=controller, retries=args.retries if adaptive else 0, seed=args.seed
+        )
+        ok = sum(1 for o in outcomes if o.status != "dropped")
+        report(name, server, time.perf_counter() - t0, ok)
+        if adaptive:
+            retried = sum(1 for o in outcomes if o.status == "retried")
+            print(f"    重试后成功 {retried} 块，并发窗口峰值 {controller.peak:.0f}，收缩 {controller.shrinks} 次，"
+                  f"配额上限 {args.rpm / args.window:.1f} 块/s")
+        server.close()
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "truncated")
+
+
+def make_graph_response(items: int, seed: int = 0) -> str:
+    """合成大响应：items 个实体 / 事件 / 关系，字段长度接近真实抽取输出"""
+    rng = random.Random(seed)
+
+    def sentence(n):
+        return "".join(rng.choice(ZH_SENTENCES) for _ in range(n))
+
+    data = {
+        "entities": [{"id": f"PER_{i}", "name": sentence(1)[:6], "type": "PERSON", "alias": [sentence(1)[:4]]}
+                     for i in range(items)],
+        "events": [{"id": f"EVT_{i}_19{rng.randint(21, 76)}", "name": sentence(1)[:10], "type": "MEETING",
+                    "time_str": f"19{rng.randint(21, 76)}-01-01", "description": sentence(3),
+                    "political_significance": sentence(2), "risk_level": "SAFE"} for i in range(items)],
+        "relations": [{"source_id": f"PER_{rng.randrange(items)}", "target_id": f"EVT_{rng.randrange(items)}",
+                       "relation": "参与", "details": sentence(1), "evidence": sentence(2)} for _ in range(items)],
+    }
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def bench_decode(args):
+    import graph_schema
+    from graph_schema import HistoricalGraphBatch
+    from llm_runtime import decode_json_model
+
+    def timed(fn, repeat):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return (time.perf_counter() - t0) / repeat, result
+
+    def counts(obj):
+        parts = obj.chunks if hasattr(obj, "chunks") else [obj]
+        return tuple(sum(len(getattr(p, key)) for p in parts) for key in ("entities", "events", "relations"))
+
+    text = make_graph_response(args.items, args.seed)
+    print(f"合成响应: {len(text) / 1e6:.2f} MB，实体 / 事件 / 关系各 {args.items} 条")
+    old, _ = timed(lambda: HistoricalGraphBatch(**json.loads(text)), args.repeat)
+    new, _ = timed(lambda: decode_json_model(HistoricalGraphBatch, text)[0], args.repeat)
+    print(f"json.loads + 构造: {old * 1000:7.1f} ms")
+    print(f"model_validate_json: {new * 1000:7.1f} ms  ({old / new:.1f}x)")
+    truncated = text[: int(len(text) * args.cut)]
+    salvage, obj = timed(lambda: decode_json_model(HistoricalGraphBatch, truncated)[0], args.repeat)
+    print(f"截断到 {args.cut:.0%} 后抢救: {salvage * 1000:7.1f} ms，保留 {'/'.join(map(str, counts(obj)))} 条"
+          f"（原方案整块丢弃）")
+
+    with open(os.path.join(FIXTURE_DIR, "expected.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    print(f"\n截断 / 格式错误样本（{FIXTURE_DIR}）:")
+    passed = 0
+    for name, exp in expected.items():
+        with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+            sample = f.read()
+        want = (exp["entities"], exp["events"], exp["relations"])
+        try:
+            got = counts(decode_json_model(getattr(graph_schema, exp["schema"]), sample)[0])
+        except Exception as e:
+            got = f"失败: {e}"
+        passed += got == want
+        print(f"  {'✓' if got == want else '✗'} {name:36s} 抢救 {got}，期望 {want}")
+    print(f"{passed}/{len(expected)} 个样本符合期望")
+
+
+def bench_stream(args):
+    import asyncio
+    from llm_runtime import (
+        ResponseCache, TokenBucketLimiter, agenerate_cached, agenerate_stream_cached, run_async_jobs
+    )
+
+    # 模拟模型：首 token 延迟 + 逐对象生成（每个对象约 obj_delay 秒），每个请求的对象数随机
+    rng = random.Random(args.seed)
+    plans = [(rng.uniform(0.2, 1.0) * args.first_token, rng.randint(args.objects // 4, args.objects))
+             for _ in range(args.requests)]
+
+    def body(pos):
+        return json.dumps({"entities": [{"id": f"PER_{pos}_{k}", "name": f"人物{k}"}
+                                        for k in range(plans[pos][1])]}, ensure_ascii=False)
+
+    async def generate_stream(model, contents, config=None):
+        pos = int(contents)
+        delay, count = plans[pos]
+        pieces = [body(pos)[i:i + 40] for i in range(0, len(body(pos)), 40)]
+
+        async def gen():
+            await asyncio.sleep(delay)
+            for piece in pieces:
+                await asyncio.sleep(args.obj_delay * count / len(pieces))
+                yield SimpleNamespace(text=piece, usage_metadata=None)
+        return gen()
+
+    async def generate(model, contents, config=None):
+        text = ""
+        async for chunk in await generate_stream(model, contents, config):
+            text += chunk.text
+        return SimpleNamespace(text=text, usage_metadata=None)
+
+    client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+        generate_content=generate, generate_content_stream=generate_stream)))
+    print(f"{args.requests} 个请求，每个 {args.objects // 4}-{args.objects} 个对象，"
+          f"首 token ≤{args.first_token}s，每对象 {args.obj_delay * 1000:.0f}ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for streaming in (False, True):
+            cache = ResponseCache(os.path.join(tmp, f"cache-{streaming}.sqlite3"))
+            t0 = time.perf_counter()
+            first_object, first_done, objects = [None], [None], [0]
+
+            def on_object(kind, obj):
+                objects[0] += 1
+                if first_object[0] is None:
+                    first_object[0] = time.perf_counter() - t0
+
+            async def worker(pos, gate):
+                if streaming:
+                    await agenerate_stream_cached(client, "m", str(pos), on_object=on_object,
+                                                  watch=("entities",), cache=cache, gate=gate)
+                else:
+                    await agenerate_cached(client, "m", str(pos), cache=cache, gate=gate)
+                return True, None
+
+            def on_done(pos, outcome):
+                if first_done[0] is None:
+                    first_done[0] = time.perf_counter() - t0
+
+            run_async_jobs([(1, pos) for pos in range(args.requests)], worker,
+                           TokenBucketLimiter(10 ** 9, 10 ** 12), max_in_flight=args.in_flight, on_done=on_done)
+            total = time.perf_counter() - t0
+            if streaming:
+                print(f"流式:   首个结果 {first_object[0]:.2f}s（{objects[0]} 个对象边生成边到达），全部完成 {total:.2f}s")
+            else:
+                print(f"非流式: 首个结果 {first_done[0]:.2f}s（首个请求整段返回），全部完成 {total:.2f}s")
+
+
+def bench_replay(args):
+    import asyncio
+    from llm_backend import LLMTape, RecordingClient, ReplayClient
+    from llm_runtime import (AimdController, ResponseCache, TokenBucketLimiter, agenerate_cached, llm_telemetry,
+                             run_async_jobs)
+
+    # 录制：合成"真实"模型（输出由提示词决定，带延迟）经 RecordingClient 落盘；回放：同一批请求离线重跑
+    def fake_output(prompt):
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        return make_graph_response(8, seed)
+
+    async def live_generate(model, contents, config=None):
+        await asyncio.sleep(args.live_latency)
+        return SimpleNamespace(text=fake_output(contents),
+                               usage_metadata=SimpleNamespace(prompt_token_count=len(contents)))
+
+    live = SimpleNamespace(models=None, files=None,
+                           aio=SimpleNamespace(models=SimpleNamespace(generate_content=live_generate)))
+    rng = random.Random(args.seed)
+    prompts = ["".join(rng.choice(ZH_SENTENCES) for _ in range(30)) + f" #{i}" for i in range(args.requests)]
+
+    def run(client, cache_path, retries):
+        cache = ResponseCache(cache_path)  # 每轮独立缓存，保证请求真正打到客户端
+        outputs = [None] * len(prompts)
+
+        async def worker(pos, gate):
+            response = await agenerate_cached(client, "gemini-bench", prompts[pos], cache=cache, gate=gate,
+                                              stage="extract")
+            outputs[pos] = response.text
+            return True, None
+
+        controller = AimdController(initial=8, maximum=args.in_flight)
+        t0 = time.perf_counter()
+        outcomes = run_async_jobs([(1, pos) for pos in range(len(prompts))], worker,
+                                  TokenBucketLimiter(10 ** 9, 10 ** 12), max_in_flight=args.in_flight,
+                                  controller=controller, retries=retries, seed=args.seed)
+        return time.perf_counter() - t0, outcomes, outputs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tape = LLMTape(os.path.join(tmp, "tape"))
+        elapsed, _, recorded = run(RecordingClient(live, tape), os.path.join(tmp, "c1.sqlite3"), 0)
+        print(f"录制: {len(prompts)} 个请求 {elapsed:.2f}s（合成服务延迟 {args.live_latency}s），磁带 {len(tape)} 条")
+
+        replay = ReplayClient(LLMTape(tape.root), latency=str(args.latency),
+                              error_rate=args.error_rate, seed=args.seed)
+        llm_telemetry.start_run("bench-replay", latency=args.latency, error_rate=args.error_rate)
+        elapsed, outcomes, replayed = run(replay, os.path.join(tmp, "c2.sqlite3"), args.retries)
+        retried = sum(1 for o in outcomes if o.status == "retried")
+        dropped = sum(1 for o in outcomes if o.status == "dropped")
+        same = sum(1 for a, b in zip(recorded, replayed) if a == b)
+        print(f"回放: {elapsed:.2f}s，{len(prompts) / elapsed:.1f} 请求/s（延迟 {args.latency}s，"
+              f"注入 {args.error_rate:.0%} 的 {429} 错误），实际调用 {replay.calls} 次，重试后成功 {retried}，放弃 {dropped}")
+        print(f"与录制输出一致: {same}/{len(prompts)}")
+        row = llm_telemetry.summary()["extract"]
+        print(f"遥测: {row['calls']} 次请求（重试 {row['retries']}，失败 {row['errors']}）· "
+              f"p50 {row['p50']:.2f}s p95 {row['p95']:.2f}s p99 {row['p99']:.2f}s · "
+              f"输入 {row['input_tokens']:,} token ≈${row['cost']:.4f}")
+
+
+def bench_hedge(args):
+    import asyncio
+    from llm_runtime import AimdController, HedgePolicy, TokenBucketLimiter, percentile, run_async_jobs
+
+    # 假服务：每次调用独立抽样耗时，少数调用卡住（重尾）；副本与原请求互不影响
+    rng = random.Random(args.seed)
+
+    async def worker(pos, gate):
+        await gate()
+        stuck = rng.random() < args.straggler_rate
+        await asyncio.sleep(args.straggler if stuck else rng.uniform(args.latency * 0.5, args.latency * 1.5))
+        return pos, 1000
+
+    def run(hedge):
+        latencies = []
+        starts = {}
+
+        async def timed(pos, gate):
+            starts.setdefault(pos, time.perf_counter())
+            return await worker(pos, gate)
+
+        def on_done(pos, outcome):
+            latencies.append(time.perf_counter() - starts[pos])
+
+        t0 = time.perf_counter()
+        outcomes = run_async_jobs(
+            [(1000, pos) for pos in range(args.requests)], timed, TokenBucketLimiter(10 ** 9, 10 ** 12),
+            max_in_flight=args.in_flight, on_done=on_done, seed=args.seed,
+            controller=AimdController(initial=args.in_flight, maximum=args.in_flight),
+            hedge=hedge, timeout=args.timeout
+        )
+        assert all(o.result == pos for pos, o in enumerate(outcomes))
+        return time.perf_counter() - t0, latencies
+
+    base, base_lat = run(None)
+    policy = HedgePolicy(budget=args.budget, min_delay=args.min_delay)
+    hedged, hedged_lat = run(policy)
+    print(f"{args.requests} 个请求，并发 {args.in_flight}，{args.straggler_rate:.0%} 卡住 {args.straggler}s，"
+          f"正常约 {args.latency}s")
+    for name, wall, lat in (("不对冲", base, base_lat), ("对冲", hedged, hedged_lat)):
+        print(f"{name}: 总耗时 {wall:.2f}s · 单块 p50 {percentile(lat, 50):.2f}s p95 {percentile(lat, 95):.2f}s "
+              f"p99 {percentile(lat, 99):.2f}s · 最慢 {max(lat):.2f}s")
+    print(f"对冲副本 {policy.issued} 个（额外 {policy.extra_tokens / policy.total_tokens:.1%} 预估 token，"
+          f"预算上限拦下 {policy.capped} 次），其中 {policy.won} 个先返回 · 提速 {base / hedged:.1f}x")
+
+
+ZH_FILLER = ["天气渐渐转凉，道路泥泞难行。", "人们议论纷纷，心情十分复杂。", "夜里下了一场大雨，河水上涨。",
+             "大家围坐在一起，说起了家乡的往事。"]
+
+
+def bench_yield(args):
+    import asyncio
+    from chunk_tools import get_break_matcher, yield_score
+    from llm_runtime import TokenBucketLimiter, run_async_jobs
+
+    # 合成全书：多数块是叙述铺垫，少数块密集记载会议 / 人物 / 日期（重尾），真实产出 = 块内事件句数
+    rng = random.Random(args.seed)
+    names, places = ["张明", "李华", "王强", "赵刚", "陈志远"], ["陕西", "贵州", "湖南", "江西"]
+    chunks, truth = [], []
+    for _ in range(args.chunks):
+        events = int(rng.paretovariate(1.2)) - 1 if rng.random() < args.hot_rate else rng.randint(0, 1)
+        sentences = [rng.choice(ZH_FILLER) for _ in range(rng.randint(20, 40))]
+        for _ in range(events):
+            sentences.insert(rng.randrange(len(sentences) + 1),
+                             f"{rng.randint(1921, 1949)}年{rng.randint(1, 12)}月{rng.randint(1, 28)}日，"
+                             f"{rng.choice(names)}同志在{rng.choice(places)}省出席委员会会议。")
+        chunks.append("".join(sentences))
+        truth.append(events)
+
+    matcher = get_break_matcher()
+    t0 = time.perf_counter()
+    scores = [yield_score(c, matcher) for c in chunks]
+    score_ms = (time.perf_counter() - t0) * 1000
+
+    total = sum(truth)
+    print(f"{args.chunks} 块，真实事件 {total} 个；打分耗时 {score_ms:.1f}ms；限流 {args.rpm} RPM")
+    for name, priority in (("原文顺序", None), ("按产出优先", scores)):
+        t_start = time.perf_counter()
+        found, marks = [0], {}
+
+        def on_done(pos, outcome, t_start=t_start, found=found, marks=marks):
+            found[0] += outcome.result
+            for q in (0.5, 0.8):
+                if q not in marks and found[0] >= q * total:
+                    marks[q] = time.perf_counter() - t_start
+
+        order = []
+
+        async def worker(pos, gate, order=order):
+            await gate()
+            order.append(pos)  # 实际发出顺序
+            await asyncio.sleep(rng.uniform(args.latency * 0.5, args.latency * 1.5))
+            return truth[pos], None
+
+        run_async_jobs([(0, pos) for pos in range(args.chunks)], worker,
+                       TokenBucketLimiter(rpm=args.rpm, tpm=10 ** 12, burst=1), max_in_flight=args.in_flight,
+                       on_done=on_done, priority=priority, seed=args.seed)
+        head = order[:max(1, args.chunks // 5)]
+        print(f"{name}: 前 20% 请求抽出 {sum(truth[p] for p in head) / total:.0%} 的事件 · "
+              f"50% 事件用时 {marks.get(0.5, 0):.1f}s · 80% 用时 {marks.get(0.8, 0):.1f}s · "
+              f"全部 {time.perf_counter() - t_start:.1f}s")
+
+
+def bench_gate_timeout(args):
+    import asyncio
+    from llm_runtime import TokenBucketLimiter, run_async_jobs
+
+    # 限流很慢、单次调用很快：在令牌桶前排队再久也不应触发单次调用超时
+    sent = []
+
+    async def worker(pos, gate):
+        await gate()
+        sent.append(pos)
+        await asyncio.sleep(args.latency)
+        return pos, None
+
+    t0 = time.perf_counter()
+    outcomes = run_async_jobs(
+        [(0, pos) for pos in range(args.jobs)], worker, TokenBucketLimiter(rpm=args.rpm, tpm=10 ** 12, burst=1),
+        max_in_flight=args.jobs, retries=args.retries, timeout=args.timeout, seed=0
+    )
+    dropped = [pos for pos, o in enumerate(outcomes) if o.status == "dropped"]
+    print(f"{args.jobs} 个 job，{args.rpm} RPM，超时 {args.timeout}s：用时 {time.perf_counter() - t0:.1f}s，"
+          f"发出 {len(sent)} 次，放弃 {len(dropped)} 个")
+    assert not dropped, f"限流排队被计入超时: {[outcomes[p].error for p in dropped][:3]}"
+    assert all(o.result == pos for pos, o in enumerate(outcomes))
+
+
+def bench_wavefront(args):
+    import asyncio
+    from chunk_tools import duplicate_id_stats
+    from llm_runtime import TokenBucketLimiter, run_async_jobs, wavefront_chains
+
+    # 模拟模型：前情提要里出现过的 ID 照抄，否则从同名的几种 ID 写法里随机挑一个
+    rng = random.Random(args.seed)
+    # 每块 = 主要人物中的 5 个 + 本段附近的 3 个次要人物
+    cast = [f"人物{i}" for i in range(args.entities)]
+    variants = {name: [f"PER_{name}", f"PER_{name}_{i}", f"PER_{i}"] for i, name in enumerate(cast)}
+    leads, minor = cast[:args.leads], cast[args.leads:]
+    chunks = [
+        rng.sample(leads, 5) + rng.sample(minor[min(c * len(minor) // args.chunks, len(minor) - 12):][:12], 3)
+        for c in range(args.chunks)
+    ]
+    print(f"{len(chunks)} 块，{len(cast)} 个人物（主要 {len(leads)} 个，次要人物相邻块重叠），"
+          f"单次延迟约 {args.latency}s")
+
+    for segments in args.segments:
+        after = wavefront_chains(len(chunks), segments)
+        results = [None] * len(chunks)
+        carried = [[] for _ in chunks]
+        call_rng = random.Random(args.seed)
+
+        async def worker(pos, gate):
+            await gate()
+            summary = carried[after[pos]] if segments > 0 and after[pos] is not None else []
+            await asyncio.sleep(args.latency * (0.5 + call_rng.random()))
+            batch = []
+            for name in chunks[pos]:
+                known = [v for v in variants[name] if v in summary]
+                batch.append({"id": known[0] if known else call_rng.choice(variants[name]),
+                              "name": name, "type": "PERSON"})
+            return batch, None
+
+        def on_done(pos, outcome):
+            # 与 app.carry_entities 相同：段内实体 ID 表，最近出现的优先，最多 30 个
+            results[pos] = outcome.result
+            prev = carried[after[pos]] if after[pos] is not None else []
+            ids = [e["id"] for e in outcome.result]
+            carried[pos] = (ids + [i for i in prev if i not in ids])[:30]
+
+        t0 = time.perf_counter()
+        run_async_jobs(
+            [(1, pos) for pos in range(len(chunks))], worker, TokenBucketLimiter(10 ** 9, 10 ** 12),
+            max_in_flight=args.in_flight, on_done=on_done, after=after
+        )
+        elapsed = time.perf_counter() - t0
+        stats = duplicate_id_stats([e for batch in results for e in batch], [])
+        label = "全并行    " if segments <= 0 else f"K={segments:<4d}    "
+        print(f"{label}: {elapsed:6.2f}s，同名多 ID {stats['groups']:3d} 组（多出 {stats['extra_ids']} 个 ID）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解书客性能基准")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("pdf", help="PDF 分页并行提取 vs 串行")
+    p.add_argument("--pages", type=int, default=600)
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser("ocr", help="OCR 分卷并发调度 vs 逐批串行（本地假客户端）")
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--in-flight", type=int, default=4)
+    p.add_argument("--processing-delay", type=float, default=0.3)
+    p.add_argument("--token-delay", type=float, default=0.01)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--verbose", action="store_true")
+    p.set_defaults(func=bench_ocr)
+
+    p = sub.add_parser("epub", help="EPUB 内存读取 + spine 并行解析 vs 原路径")
+    p.add_argument("--chapters", type=int, default=300)
+    p.add_argument("--workers", type=int, default=8)
+    p.set_defaults(func=bench_epub)
+
+    p = sub.add_parser("docx", help="DOCX 流式读取 vs python-docx（耗时与峰值内存）")
+    p.add_argument("--paragraphs", type=int, default=50000)
+    p.set_defaults(func=bench_docx)
+
+    p = sub.add_parser("keywords", help="断点关键词编译匹配器 vs 逐词循环")
+    p.add_argument("--lines", type=int, default=300000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_keywords)
+
+    p = sub.add_parser("cohesion", help="本地衔接度断点检测耗时与召回（合成话题段）")
+    p.add_argument("--paragraphs", type=int, default=50000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--sensitivities", type=lambda v: [float(x) for x in v.split(",")],
+                   default=[0.5, 1.0, 1.1, 1.2, 1.3, 1.5])
+    p.set_defaults(func=bench_cohesion)
+
+    p = sub.add_parser("tokens", help="按 token 预算合并事件块 vs 逐块请求（请求数与提示词开销）")
+    p.add_argument("--events", type=int, default=2000)
+    p.add_argument("--target", type=int, default=6000)
+    p.add_argument("--overhead", type=int, default=900, help="每次请求的提示词 + schema 开销 tokens")
+    p.add_argument("--multi-extra", type=int, default=80, help="多块打包的说明与 schema 额外开销 tokens")
+    p.add_argument("--label-tokens", type=int, default=8)
+    p.add_argument("--max-pack", type=int, default=8)
+    p.add_argument("--min-sentences", type=int, default=40)
+    p.add_argument("--max-sentences", type=int, default=200)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_tokens)
+
+    p = sub.add_parser("dedup", help="MinHash/LSH 近重复块检测（多版本重叠）")
+    p.add_argument("--chunks", type=int, default=400)
+    p.add_argument("--chunk-chars", type=int, default=3000)
+    p.add_argument("--edit-rate", type=float, default=0.01)
+    p.add_argument("--threshold", type=float, default=0.8)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_dedup)
+
+    p = sub.add_parser("extract", help="asyncio + 令牌桶抽取 vs 线程池（本地限流假服务）")
+    p.add_argument("--chunks", type=int, default=300)
+    p.add_argument("--rpm", type=int, default=60, help="每个窗口的请求额度")
+    p.add_argument("--tpm", type=int, default=400000, help="每个窗口的 token 额度")
+    p.add_argument("--window", type=float, default=5.0, help="配额窗口秒数（真实服务为 60）")
+    p.add_argument("--latency", type=float, default=1.0)
+    p.add_argument("--in-flight", type=int, default=256)
+    p.add_argument("--retries", type=int, default=8)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_extract)
+
+    p = sub.add_parser("decode", help="model_validate_json vs json.loads；截断输出抢救（含样本集）")
+    p.add_argument("--items", type=int, default=3000)
+    p.add_argument("--cut", type=float, default=0.9, help="截断位置（占全长比例）")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("stream", help="流式抽取 vs 整段返回：首个结果耗时（本地假模型）")
+    p.add_argument("--requests", type=int, default=40)
+    p.add_argument("--objects", type=int, default=60)
+    p.add_argument("--first-token", type=float, default=1.0, help="首 token 延迟上限（秒）")
+    p.add_argument("--obj-delay", type=float, default=0.05, help="每个对象的生成耗时（秒）")
+    p.add_argument("--in-flight", type=int, default=16)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("replay", help="录制 / 回放 LLM 后端：离线重跑同一批请求（延迟与错误注入）")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--live-latency", type=float, default=0.3)
+    p.add_argument("--latency", type=float, default=0.2, help="回放延迟（秒）")
+    p.add_argument("--error-rate", type=float, default=0.1)
+    p.add_argument("--retries", type=int, default=8)
+    p.add_argument("--in-flight", type=int, default=64)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("hedge", help="尾延迟对冲：超过运行中 p95 发副本 vs 不对冲（重尾假服务）")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--in-flight", type=int, default=32)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--straggler-rate", type=float, default=0.02)
+    p.add_argument("--straggler", type=float, default=20.0)
+    p.add_argument("--budget", type=float, default=0.1)
+    p.add_argument("--min-delay", type=float, default=0.2)
+    p.add_argument("--timeout", type=float, default=None)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_hedge)
+
+    p = sub.add_parser("yield", help="按产出预估优先抽取 vs 原文顺序：多久拿到大部分事件（合成重尾书）")
+    p.add_argument("--chunks", type=int, default=300)
+    p.add_argument("--hot-rate", type=float, default=0.15)
+    p.add_argument("--rpm", type=int, default=3000)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--in-flight", type=int, default=32)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_yield)
+
+    p = sub.add_parser("gate-timeout", help="单次调用超时不计限流排队：慢令牌桶下不应有 job 被放弃")
+    p.add_argument("--jobs", type=int, default=30)
+    p.add_argument("--rpm", type=int, default=600)
+    p.add_argument("--timeout", type=float, default=0.3)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--retries", type=int, default=1)
+    p.set_defaults(func=bench_gate_timeout)
+
+    p = sub.add_parser("wavefront", help="波前调度：段内传递前情提要 vs 全并行（耗时与同名多 ID）")
+    p.add_argument("--chunks", type=int, default=200)
+    p.add_argument("--entities", type=int, default=300)
+    p.add_argument("--leads", type=int, default=12)
+    p.add_argument("--segments", type=int, nargs="+", default=[0, 4, 16, 64])
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--in-flight", type=int, default=256)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_wavefront)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
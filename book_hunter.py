@@ -274,15 +274,16 @@ def import_graph_core():
 class GraphProcessor:
     """图谱处理器 - 简化版，避免导入 Streamlit"""
     
-    def __init__(self):
+    def __init__(self, resume: bool = True):
         self.client = None
         self.model = CONFIG["gemini_model"]
+        self.resume = resume  # False 时忽略任务日志，从头抽取
     
     def init_client(self, api_key: str):
         """初始化 Gemini 客户端"""
         try:
-            from google import genai
-            self.client = genai.Client(api_key=api_key)
+            from llm_backend import create_client
+            self.client = create_client(api_key)
             return True
         except Exception as e:
             print(f"[错误] 初始化 Gemini 失败: {e}")
@@ -295,22 +296,18 @@ class GraphProcessor:
         
         try:
             if ext == ".pdf":
-                import pypdf
+                # 与 app.py 共用分页并行提取 + 内容寻址缓存
+                from doc_reader import extract_pdf_pages_cached, join_pages
                 with open(file_path, 'rb') as f:
-                    reader = pypdf.PdfReader(f)
-                    for page in reader.pages:
-                        text += (page.extract_text() or "") + "\n"
+                    pages, _ = extract_pdf_pages_cached(f.read())
+                text = join_pages(pages)
                         
             elif ext == ".epub":
-                import ebooklib
-                from ebooklib import epub
-                from bs4 import BeautifulSoup
-                
-                book = epub.read_epub(file_path, options={'ignore_ncx': True})
-                for item in book.get_items():
-                    if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                        soup = BeautifulSoup(item.get_content(), "html.parser")
-                        text += soup.get_text(separator='\n', strip=True) + "\n"
+                # 内存中按 spine 顺序并行解析，与 app.py 共用缓存
+                from doc_reader import LazyPages, iter_epub_chapters, EPUB_READER_VERSION
+                with open(file_path, 'rb') as f:
+                    pages = LazyPages(f.read(), iter_epub_chapters, EPUB_READER_VERSION)
+                text = "\n".join(pages)
                         
             elif ext == ".txt":
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
@@ -381,7 +378,7 @@ class GraphProcessor:
             return json.loads(response.text)
         except Exception as e:
             print(f"[错误] 图谱提取失败: {e}")
-            return {"entities": [], "events": [], "relations": []}
+            return {"entities": [], "events": [], "relations": [], "error": str(e)}
     
     def process_book(self, file_path: str) -> Dict:
         """处理整本书"""
@@ -398,14 +395,31 @@ class GraphProcessor:
         chunks = self.chunk_text(text)
         print(f"  切分为 {len(chunks)} 块")
         
+        # 任务日志（与 app.py 共用）：中断后重跑同一本书只补未完成的块
+        from llm_runtime import JobJournal, job_id
+        journal = JobJournal(job_id(self.model, "book_hunter", hashlib.sha256(text.encode("utf-8")).hexdigest()))
+        if journal.plan is None or not self.resume:
+            journal.start(chunks[:20])  # 限制处理前20块
+        else:
+            # 带 error 的结果是抽取失败的空图谱，不算完成，续跑时重抽
+            done = sum(1 for r in journal.results.values() if "error" not in r)
+            if done:
+                print(f"  续跑: {done}/{len(journal.plan)} 块已完成")
+        
         # 提取每块的图谱
         all_entities = {}
         all_events = {}
         all_relations = []
         
-        for i, chunk in enumerate(chunks[:20]):  # 限制处理前20块
-            print(f"  处理第 {i+1}/{min(len(chunks), 20)} 块...")
-            result = self.extract_graph(chunk)
+        for i, chunk in enumerate(journal.plan):
+            if i in journal.results and "error" not in journal.results[i]:
+                result = journal.results[i]
+            else:
+                print(f"  处理第 {i+1}/{len(journal.plan)} 块...")
+                result = self.extract_graph(chunk)
+                if "error" not in result:
+                    journal.record(i, result)
+                time.sleep(1)  # 避免 API 限流
             
             for e in result.get("entities", []):
                 if e.get("id") not in all_entities:
@@ -416,8 +430,9 @@ class GraphProcessor:
                     all_events[ev["id"]] = ev
             
             all_relations.extend(result.get("relations", []))
-            
-            time.sleep(1)  # 避免 API 限流
+        
+        if journal.error:
+            print(f"  ⚠️ 任务日志写入失败，中断后无法续跑: {journal.error}")
         
         # 去重关系
         seen = set()
@@ -445,18 +460,19 @@ class GraphProcessor:
 class BookHunter:
     """图书猎手 - 自动搜索、下载、分析"""
     
-    def __init__(self, api_key: str = ""):
+    def __init__(self, api_key: str = "", resume: bool = True):
         self.sources = [
             LibGenSource(),
             # ZLibrarySource(),  # 需要登录
             # AnnaArchiveSource(),  # 需要解析
         ]
-        self.processor = GraphProcessor()
+        self.processor = GraphProcessor(resume=resume)
         self.processed_db = self._load_processed_db()
         
         # 初始化 Gemini
+        from llm_backend import needs_api_key
         api_key = api_key or CONFIG["gemini_api_key"]
-        if api_key:
+        if api_key or not needs_api_key():
             self.processor.init_client(api_key)
         else:
             print("[警告] 未设置 GEMINI_API_KEY，图谱生成功能不可用")
@@ -631,11 +647,13 @@ def main():
     parser.add_argument("--local", "-l", type=str, help="处理本地文件夹")
     parser.add_argument("--api-key", type=str, help="Gemini API Key")
     parser.add_argument("--watch", "-w", action="store_true", help="持续监控模式")
+    parser.add_argument("--fresh", "--no-resume", dest="fresh", action="store_true",
+                        help="忽略任务日志，从头重新抽取（默认续跑未完成的块）")
     
     args = parser.parse_args()
     
     # 初始化
-    hunter = BookHunter(api_key=args.api_key or "")
+    hunter = BookHunter(api_key=args.api_key or "", resume=not args.fresh)
     
     # 处理本地文件
     if args.local:
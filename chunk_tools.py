@@ -0,0 +1,544 @@
+"""
+切分辅助算法 - 纯文本计算，不依赖 Streamlit，供 app.py / bench.py 共用
+"""
+
+import functools
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ============================================
+# 事件切分关键词（规则优先 + 少量 LLM 校验）
+# ============================================
+EVENT_BREAK_KEYWORDS = [
+    # 时间跳跃
+    "第二天", "次日", "翌日", "几天后", "数日后", "一周后", "几周后",
+    "一个月后", "数月后", "半年后", "一年后", "多年后", "若干年后",
+    "转眼", "不久", "随后", "此后", "后来", "最终", "终于",
+    # 空间跳跃
+    "与此同时", "另一边", "在另一处", "在北京", "在上海", "在延安",
+    "回到", "来到", "抵达", "前往", "离开",
+    # 新事件标志
+    "会议开始", "会议召开", "大会开幕", "会上", "会后",
+    "战斗打响", "战役开始", "冲突爆发",
+    "发表讲话", "作报告", "发言指出", "宣布",
+    "颁布", "出台", "通过决议", "签署",
+    # 章节标记
+    "第一章", "第二章", "第三章", "第四章", "第五章",
+    "一、", "二、", "三、", "四、", "五、",
+    "（一）", "（二）", "（三）", "（四）", "（五）",
+]
+
+_CHAPTER_MARKS = [
+    "第一章", "第二章", "第三章", "第四章", "第五章", "第六章", "第七章", "第八章", "第九章", "第十章",
+    "一、", "二、", "三、", "四、", "五、", "六、", "七、", "八、", "九、", "十、",
+    "（一）", "（二）", "（三）", "（四）", "（五）", "（六）", "（七）", "（八）", "（九）", "（十）",
+]
+
+# 按文档类型的断点关键词集合（"narrative" 即原有的默认集合）
+BREAK_KEYWORD_SETS: Dict[str, List[str]] = {
+    "narrative": EVENT_BREAK_KEYWORDS,
+    "regulatory": _CHAPTER_MARKS + [
+        "第一条", "第二条", "第三条", "第四条", "第五条",
+        "第一节", "第二节", "第三节", "附则", "总则", "附件",
+        "现将", "特此通知", "本办法", "本条例", "本规定",
+    ],
+    "meeting": _CHAPTER_MARKS + [
+        "会议开始", "会议召开", "大会开幕", "会上", "会后", "闭幕",
+        "主持人", "议程", "发言指出", "作报告", "讲话", "通过决议", "表决",
+    ],
+    "opinion": _CHAPTER_MARKS + [
+        "据报道", "网友", "评论", "此外", "另一方面", "与此同时", "值得注意的是", "总之",
+    ],
+    "economic": _CHAPTER_MARKS + [
+        "第一季度", "第二季度", "第三季度", "第四季度", "上半年", "下半年", "全年",
+        "宣布", "签署", "收购", "并购", "发布", "财报", "与此同时",
+    ],
+}
+
+BREAK_KEYWORD_SET_CN = {
+    "narrative": "历史叙事", "regulatory": "法规/公文", "meeting": "会议纪要",
+    "opinion": "舆情/评论", "economic": "经济/商业",
+}
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """把关键词编译成前缀合并的正则（等价于一次扫描的 trie 匹配，较长的词优先）"""
+    trie: dict = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node) -> str:
+        is_end = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in node.items() if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if is_end:
+            return "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+
+class KeywordMatcher:
+    """
+    断点关键词匹配器：构建一次，对每个段落只扫描一遍开头窗口
+    search() 返回 (命中的关键词, 位置)，未命中返回 None
+    """
+
+    def __init__(self, keywords: Iterable[str], window: int = 50):
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self.window = window
+        self._pattern = re.compile(_trie_pattern(self.keywords)) if self.keywords else None
+
+    def search(self, text: str) -> Optional[Tuple[str, int]]:
+        if self._pattern is None:
+            return None
+        m = self._pattern.search(text, 0, self.window)
+        return (m.group(), m.start()) if m else None
+
+    def __call__(self, text: str) -> bool:
+        return self._pattern is not None and self._pattern.search(text, 0, self.window) is not None
+
+    def count(self, text: str) -> int:
+        """全文（不限开头窗口）的关键词命中次数"""
+        return len(self._pattern.findall(text)) if self._pattern is not None else 0
+
+
+MATCHER_CACHE_SIZE = 32   # 缓存的关键词组合数；自定义关键词随用户输入变化，需有上限
+
+
+@functools.lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _compile_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def get_break_matcher(doc_type: str = "narrative", extra: Optional[Iterable[str]] = None) -> KeywordMatcher:
+    """按文档类型（可附加自定义关键词）取匹配器，同一组关键词只编译一次（最近使用的 MATCHER_CACHE_SIZE 组）"""
+    keywords = tuple(BREAK_KEYWORD_SETS.get(doc_type, EVENT_BREAK_KEYWORDS)) + tuple(extra or ())
+    return _compile_matcher(keywords)
+
+
+# ============================================
+# 词汇衔接度断点检测（TextTiling 风格，字符 n-gram，纯 CPU）
+# ============================================
+COHESION_WINDOW = 4          # 断点两侧各取几段计算衔接度
+COHESION_NGRAM = 2           # 字符 n-gram 长度（中文用二元组效果较好）
+COHESION_DIMS = 1024         # n-gram 哈希桶数
+COHESION_BLOCK = 4096        # 分块计算，控制稠密矩阵的内存
+COHESION_DEPTH_RADIUS = 6    # 深度分数：向两侧找峰值的范围（断点数）
+
+
+def _ngram_matrix(paragraphs: List[str], ngram: int, dims: int) -> np.ndarray:
+    """每段的字符 n-gram 哈希计数（行 = 段落）；整块拼接后一次 bincount"""
+    text = "\n".join(paragraphs)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    rows = np.cumsum(codes == 10)          # 换行符处行号 +1，段内不含换行
+    span = len(codes) - ngram + 1
+    if span <= 0:
+        return np.zeros((len(paragraphs), dims), dtype=np.float32)
+    ids = codes[:span].copy()
+    valid = codes[:span] != 10
+    for k in range(1, ngram):
+        ids = ids * 1000003 + codes[k:span + k]
+        valid &= codes[k:span + k] != 10
+    flat = rows[:span][valid] * dims + ids[valid] % dims
+    counts = np.bincount(flat, minlength=len(paragraphs) * dims)
+    return counts.reshape(len(paragraphs), dims).astype(np.float32)
+
+
+def cohesion_scores(
+    paragraphs: List[str],
+    window: int = COHESION_WINDOW,
+    ngram: int = COHESION_NGRAM,
+    dims: int = COHESION_DIMS,
+    block: int = COHESION_BLOCK
+) -> np.ndarray:
+    """
+    scores[j] = 第 j 段之前 window 段与之后 window 段（含第 j 段）的 n-gram 余弦相似度
+    scores[0] 无意义，置为 1。越低说明话题衔接越弱，越可能是断点
+    """
+    n = len(paragraphs)
+    scores = np.ones(n, dtype=np.float32)
+    for start in range(1, n, block):
+        end = min(start + block, n)
+        lo, hi = max(0, start - window), min(n, end + window)
+        mat = _ngram_matrix(paragraphs[lo:hi], ngram, dims)
+        # 窗口和用 window 次平移相加（比沿行 cumsum 快得多），越界部分补零
+        padded = np.pad(mat, ((window, window), (0, 0)))
+        g0, g1 = start - lo + window, end - lo + window
+        left = sum(padded[g0 - k:g1 - k] for k in range(1, window + 1))
+        right = sum(padded[g0 + k:g1 + k] for k in range(window))
+        denom = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        dot = np.einsum("ij,ij->i", left, right)
+        scores[start:end] = np.where(denom > 0, dot / np.maximum(denom, 1e-9), 1.0)
+    return scores
+
+
+def depth_scores(scores: np.ndarray, radius: int = COHESION_DEPTH_RADIUS) -> np.ndarray:
+    """TextTiling 深度分数：两侧 radius 范围内的最高衔接度与当前谷值之差的和"""
+    n = len(scores)
+    if n == 0:
+        return scores
+    padded = np.pad(scores, radius, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, radius + 1)
+    left_peak = windows[:n].max(axis=1)
+    right_peak = windows[radius:radius + n].max(axis=1)
+    return (left_peak - scores) + (right_peak - scores)
+
+
+def iter_cohesion_scores(
+    paragraphs: Iterable[str],
+    window: int = COHESION_WINDOW,
+    ngram: int = COHESION_NGRAM,
+    dims: int = COHESION_DIMS,
+    block: int = COHESION_BLOCK
+) -> np.ndarray:
+    """
+    与 cohesion_scores 结果相同，但逐块消费段落流：内存中只保留 block + 2 × window 段文本，
+    返回的分数数组每段一个 float32
+    """
+    parts: List[np.ndarray] = []
+    buf: List[str] = []   # buf[0] 的全局段号为 base
+    base = done = 0       # done: 已算出分数的段数
+
+    def emit(end: int):
+        nonlocal base, done
+        lo = max(base, done - window)
+        rows = buf[lo - base:end + window - base]
+        scores = cohesion_scores(rows, window, ngram, dims, block=len(rows) + 1)
+        parts.append(scores[done - lo:end - lo])
+        done = end
+        drop = done - window - base   # 之后的段只需向左看 window 段
+        if drop > 0:
+            del buf[:drop]
+            base += drop
+
+    for text in paragraphs:
+        buf.append(text)
+        if base + len(buf) >= done + block + window:   # [done, done + block) 的右侧上下文已齐
+            emit(done + block)
+    if base + len(buf) > done:
+        emit(base + len(buf))
+    return np.concatenate(parts) if parts else np.ones(0, dtype=np.float32)
+
+
+def cohesion_breaks(paragraphs: Iterable[str], sensitivity: float = 1.25) -> np.ndarray:
+    """
+    各段之前是否为衔接度断点（布尔数组，下标与段落对齐）
+    阈值取深度分数的 mean + sensitivity * std（sensitivity 越大切得越少）
+    paragraphs 可以是列表或段落文本流（逐块计算，不保留全部段落）
+    """
+    depth = depth_scores(iter_cohesion_scores(paragraphs))
+    if len(depth) < 2:
+        return np.zeros(len(depth), dtype=bool)
+    depth[0] = 0.0
+    cutoff = depth[1:].mean() + sensitivity * depth[1:].std()
+    return depth > max(cutoff, 1e-6)
+
+
+def agreement_report(local: Dict[int, bool], reference: Dict[int, bool]) -> dict:
+    """本地判定与参考判定（LLM）在共同样本上的一致率、混淆矩阵与 Cohen's kappa"""
+    keys = sorted(set(local) & set(reference))
+    n = len(keys)
+    tp = sum(1 for k in keys if local[k] and reference[k])
+    tn = sum(1 for k in keys if not local[k] and not reference[k])
+    fp = sum(1 for k in keys if local[k] and not reference[k])
+    fn = sum(1 for k in keys if not local[k] and reference[k])
+    if n == 0:
+        return {"n": 0, "agreement": 0.0, "kappa": 0.0, "tp": 0, "tn": 0, "fp": 0, "fn": 0}
+    observed = (tp + tn) / n
+    expected = ((tp + fp) * (tp + fn) + (tn + fn) * (tn + fp)) / (n * n)
+    kappa = (observed - expected) / (1 - expected) if expected < 1 else 1.0
+    return {"n": n, "agreement": observed, "kappa": kappa, "tp": tp, "tn": tn, "fp": fp, "fn": fn}
+
+
+# ============================================
+# 本地 token 估算（按字符类别线性计数，可用实际调用的 usage 校准）
+# ============================================
+TOKEN_FEATURES = ("cjk", "latin_words", "digits", "other", "base")
+TOKEN_DEFAULT_RATES = {
+    "cjk": 0.8,           # 汉字（含全角标点）
+    "latin_words": 1.3,   # 拉丁字母单词 / 人名音译
+    "digits": 1.0,        # 数字基本逐位切分
+    "other": 0.6,         # 其余非空白符号
+    "base": 0.0,          # 每次请求的固定开销（schema 等），由校准得出
+}
+TOKEN_CALIBRATION_MIN = 12     # 至少这么多条样本才拟合
+TOKEN_CALIBRATION_KEEP = 500   # 最多保留的样本数
+TOKEN_CALIBRATION_RIDGE = 0.01 # 拟合时向已有系数收缩的强度
+
+_CJK_RE = re.compile(r"[　-〿㐀-鿿豈-﫿＀-￯]")
+_LATIN_WORD_RE = re.compile(r"[A-Za-z]+")
+_DIGIT_RE = re.compile(r"[0-9]")
+_SPACE_RE = re.compile(r"\s")
+
+
+def token_features(text: str) -> List[float]:
+    """文本的字符类别计数，顺序同 TOKEN_FEATURES"""
+    cjk = len(_CJK_RE.findall(text))
+    words = _LATIN_WORD_RE.findall(text)
+    digits = len(_DIGIT_RE.findall(text))
+    other = len(text) - cjk - sum(len(w) for w in words) - digits - len(_SPACE_RE.findall(text))
+    return [cjk, len(words), digits, max(other, 0), 1.0]
+
+
+class TokenEstimator:
+    """
+    token 数 ≈ 各类字符计数 × 对应系数
+    observe() 记录 (完整 prompt, 实际 prompt_token_count)，样本足够后用最小二乘重新拟合系数；
+    校准结果可 save/load 到 JSON，跨会话沿用
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, path: Optional[str] = None):
+        self.rates = dict(TOKEN_DEFAULT_RATES, **(rates or {}))
+        self.path = path
+        self.samples: List[Tuple[List[float], int]] = []
+        self.unfitted = 0   # 上次拟合后新增的样本数（samples 截断到 TOKEN_CALIBRATION_KEEP 后长度不再变化）
+        self._lock = threading.Lock()
+
+    def estimate(self, text: str, with_base: bool = False) -> int:
+        feats = token_features(text)
+        if not with_base:
+            feats[-1] = 0.0
+        return int(round(sum(f * self.rates[k] for f, k in zip(feats, TOKEN_FEATURES))))
+
+    def __call__(self, text: str) -> int:
+        return self.estimate(text)
+
+    def observe(self, prompt: str, tokens: Optional[int]):
+        """记录一次实际调用；每积累 TOKEN_CALIBRATION_MIN 条新样本重新拟合"""
+        if not tokens:
+            return
+        with self._lock:
+            self.samples.append((token_features(prompt), int(tokens)))
+            self.samples = self.samples[-TOKEN_CALIBRATION_KEEP:]
+            self.unfitted += 1
+            if len(self.samples) >= TOKEN_CALIBRATION_MIN and self.unfitted >= TOKEN_CALIBRATION_MIN:
+                self._fit()
+                self.unfitted = 0
+
+    def _fit(self):
+        x = np.array([f for f, _ in self.samples], dtype=np.float64)
+        y = np.array([t for _, t in self.samples], dtype=np.float64)
+        # 岭回归向当前系数收缩：提示词模板里的固定字符与 base 高度共线，
+        # 纯最小二乘会把开销随意分给二者；样本里没出现的类别也因此保持原值
+        prior = np.array([self.rates[k] for k in TOKEN_FEATURES])
+        scale = np.sqrt((x ** 2).mean(axis=0))
+        scale[scale == 0] = 1.0
+        xs = x / scale
+        reg = np.sqrt(TOKEN_CALIBRATION_RIDGE * len(y))
+        coef, *_ = np.linalg.lstsq(
+            np.vstack([xs, reg * np.eye(len(prior))]),
+            np.concatenate([y, reg * prior * scale]),
+            rcond=None
+        )
+        for k, c in zip(TOKEN_FEATURES, coef / scale):
+            self.rates[k] = max(float(c), 0.0)
+
+    def error(self) -> Optional[float]:
+        """当前系数在已记录样本上的平均相对误差"""
+        with self._lock:
+            if not self.samples:
+                return None
+            errs = [
+                abs(sum(f * self.rates[k] for f, k in zip(feats, TOKEN_FEATURES)) - t) / t
+                for feats, t in self.samples
+            ]
+        return sum(errs) / len(errs)
+
+    def save(self):
+        """原子写入：每次保存用独立临时文件（多个会话共用同一估算器时互不覆盖），失败时抛 OSError"""
+        if not self.path:
+            return
+        with self._lock:
+            payload = {"rates": dict(self.rates), "samples": list(self.samples)}
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "TokenEstimator":
+        est = cls(path=path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            est.rates.update(payload.get("rates", {}))
+            est.samples = [(list(f), int(t)) for f, t in payload.get("samples", [])]
+        except (OSError, ValueError):
+            pass
+        return est
+
+
+def pack_groups(sizes: List[int], budget: int, max_items: Optional[int] = None) -> List[List[int]]:
+    """
+    把相邻条目（按原顺序）分组，每组 sizes 之和不超过 budget、条目数不超过 max_items
+    返回每组的下标列表；单条本身超限时独占一组
+    """
+    groups, current, current_size = [], [], 0
+    for i, size in enumerate(sizes):
+        if current and (current_size + size > budget or (max_items and len(current) >= max_items)):
+            groups.append(current)
+            current, current_size = [], 0
+        current.append(i)
+        current_size += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def pack_chunks(chunks: List[str], measure, budget: int, sep: str = "\n\n") -> List[str]:
+    """
+    把相邻的事件块合并成不超过 budget（按 measure 计）的请求块
+    只在原块边界处合并，不会把一个事件拆开；单块本身超限时原样保留
+    """
+    return [sep.join(chunks[i] for i in group) for group in pack_groups([measure(c) for c in chunks], budget)]
+
+
+# ============================================
+# 近重复块检测（字符 shingle + MinHash/LSH）
+# ============================================
+DEDUP_THRESHOLD = 0.8     # 估算 Jaccard 相似度 ≥ 此值视为近重复
+DEDUP_SHINGLE = 5         # 字符 shingle 长度
+DEDUP_NUM_PERM = 128      # MinHash 签名长度
+DEDUP_BANDS = 32          # LSH 分带数（每带 4 行，候选阈值约 0.42，再用签名复核）
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _shingle_ids(text: str, k: int) -> np.ndarray:
+    """去空白后的字符 k-gram 哈希（折叠到 32 位后去重）"""
+    codes = np.frombuffer(_WS_RE.sub("", text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < k:
+        return codes.astype(np.uint32) if len(codes) == 0 else np.array([codes.sum()], dtype=np.uint32)
+    span = len(codes) - k + 1
+    ids = codes[:span].copy()
+    for j in range(1, k):
+        ids = ids * np.uint64(1000003) + codes[j:span + j]   # uint64 溢出回绕即可
+    return np.unique(((ids >> np.uint64(32)) ^ ids).astype(np.uint32))
+
+
+class MinHashIndex:
+    """
+    按入队顺序逐块加入；add() 返回与之近重复的已入队块序号（没有则为 None）
+    近重复块不会成为新的代表，后续块只会对到最早的那份
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = DEDUP_NUM_PERM,
+                 bands: int = DEDUP_BANDS, shingle: int = DEDUP_SHINGLE, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        rng = np.random.default_rng(seed)
+        # a 取奇数时 x -> a·x + b (mod 2^32) 是 32 位上的置换，全程 uint32 运算
+        self.a = (rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64) | 1).astype(np.uint32)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64).astype(np.uint32)
+        self.threshold, self.bands, self.rows, self.shingle = threshold, bands, num_perm // bands, shingle
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[int, np.ndarray] = {}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        ids = _shingle_ids(text, self.shingle)
+        if len(ids) == 0:
+            return None
+        return (self.a[:, None] * ids[None, :] + self.b[:, None]).min(axis=1)
+
+    def add(self, idx: int, text: str) -> Optional[int]:
+        sig = self.signature(text)
+        if sig is None:
+            return None
+        keys = [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        candidates = {c for band, key in zip(self.buckets, keys) for c in band.get(key, ())}
+        best, best_sim = None, self.threshold
+        for c in sorted(candidates):
+            sim = float((self.signatures[c] == sig).mean())
+            if sim >= best_sim:
+                best, best_sim = c, sim
+        if best is not None:
+            return best
+        self.signatures[idx] = sig
+        for band, key in zip(self.buckets, keys):
+            band.setdefault(key, []).append(idx)
+        return None
+
+
+def find_near_duplicates(chunks: List[str], threshold: float = DEDUP_THRESHOLD) -> Dict[int, int]:
+    """{近重复块序号: 复用其结果的代表块序号}；代表块总是更早入队的那个"""
+    index = MinHashIndex(threshold=threshold)
+    duplicates = {}
+    for i, chunk in enumerate(chunks):
+        rep = index.add(i, chunk)
+        if rep is not None:
+            duplicates[i] = rep
+    return duplicates
+
+
+# ============================================
+# 跨块 ID 一致性：同名同类节点被赋予多个 ID 的情况
+# ============================================
+def duplicate_id_stats(entities: List[dict], events: List[dict], examples: int = 5) -> dict:
+    """
+    按 (类型, 归一化名称) 分组，统计对应多个 ID 的组
+    返回 {"groups": 重复组数, "extra_ids": 多出来的 ID 数, "examples": [[ID, ...], ...]}
+    """
+    groups: Dict[Tuple[str, str], set] = {}
+    for node in list(entities) + list(events):
+        name = _WS_RE.sub("", str(node.get("name", ""))).lower()
+        if name:
+            groups.setdefault((str(node.get("type", "")), name), set()).add(str(node.get("id", "")))
+    dups = [sorted(ids) for ids in groups.values() if len(ids) > 1]
+    dups.sort(key=len, reverse=True)
+    return {
+        "groups": len(dups),
+        "extra_ids": sum(len(ids) - 1 for ids in dups),
+        "examples": dups[:examples],
+    }
+
+
+# ============================================
+# 产出预估：抽取前廉价打分，实体 / 事件密集的块优先抽取
+# ============================================
+_YIELD_NAME_RE = re.compile(
+    r"[\u4e00-\u9fff]{1,4}(?:同志|主席|总理|书记|委员长|司令|部长|将军|省|市|县|委员会|中央|政府|政治局|"
+    r"会议|大会|全会|战役|运动|条约|宣言|决议|军|党|部)"
+)
+_YIELD_DATE_RE = re.compile(
+    r"(?:1[89]|20)\d{2}\s*年|[一二三四五六七八九〇零]{4}年|\d{1,2}\s*月\s*\d{1,2}\s*日|"
+    r"[一二三四五六七八九十]{1,2}月[一二三四五六七八九十]{1,3}日"
+)
+YIELD_WEIGHTS = {"names": 1.0, "dates": 2.0, "breaks": 3.0}   # 日期、断点关键词往往意味着一个新事件
+
+
+def yield_features(text: str, matcher: Optional[KeywordMatcher] = None) -> Dict[str, int]:
+    """实体样式称谓 / 机构 / 地名后缀、日期、断点关键词（全文）的命中数"""
+    return {
+        "names": len(_YIELD_NAME_RE.findall(text)),
+        "dates": len(_YIELD_DATE_RE.findall(text)),
+        "breaks": matcher.count(text) if matcher is not None else 0,
+    }
+
+
+def yield_score(text: str, matcher: Optional[KeywordMatcher] = None) -> float:
+    """每千字的加权命中数：越高越可能抽出较多实体 / 事件"""
+    if not text:
+        return 0.0
+    features = yield_features(text, matcher)
+    return sum(YIELD_WEIGHTS[k] * v for k, v in features.items()) * 1000 / len(text)
@@ -0,0 +1,942 @@
+"""
+文档读取引擎 - 与 Streamlit 解耦，供 app.py 与 book_hunter.py 共用
+（进程池的 worker 必须能在不执行 UI 代码的情况下被导入）
+"""
+
+import codecs
+import collections
+import contextvars
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import posixpath
+import queue
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import unquote
+
+import lxml.html
+import pypdf
+from lxml import etree
+
+# ============================================
+# PDF 分页并行提取
+# ============================================
+PARALLEL_MIN_PAGES = 48      # 少于此页数时进程池开销不划算，直接串行
+RANGES_PER_WORKER = 4        # 每个 worker 分到的页段数，页段越多负载越均衡
+PDF_POOL_WORKERS = os.cpu_count() or 1   # 全进程共用一个进程池，多个 PDF 同时读取时总进程数也不超过此值
+PDF_WORKER_READERS = 4       # 每个 worker 缓存的已解析 PDF 数（多个文件的页段交错到达时不必反复解析）
+PDF_WORKER_SWEEP = 2.0       # worker 每隔几秒释放已结束任务（临时文件已删除）的 PdfReader
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+_worker_readers: Dict[Tuple[str, str], object] = {}
+_worker_readers_lock = threading.Lock()
+_worker_sweeper: Optional[threading.Thread] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    惰性创建共享进程池：用 forkserver（不可用时 spawn）启动 worker，
+    避免从多线程进程（read_documents 的线程池、Streamlit）直接 fork
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS, mp_context=context)
+        return _pdf_pool
+
+
+def _reset_pdf_pool(pool: ProcessPoolExecutor):
+    """进程池损坏（worker 崩溃等）时丢弃，下次重新创建"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _drop_finished_readers():
+    """丢弃临时文件已被删除（所属任务已结束）的 PdfReader"""
+    with _worker_readers_lock:
+        for key in [key for key in _worker_readers if not os.path.exists(key[0])]:
+            del _worker_readers[key]
+
+
+def _sweep_worker_readers():
+    while True:
+        time.sleep(PDF_WORKER_SWEEP)
+        _drop_finished_readers()
+
+
+def _worker_reader(path: str, token: str):
+    """
+    worker 内按 (临时文件路径, 任务令牌) 缓存 PdfReader：同一 PDF 的页段只解析一次结构
+    任务结束删除临时文件后，由后台线程在 PDF_WORKER_SWEEP 秒内释放（worker 空闲时也不会一直占着内存）；
+    令牌防止临时文件名被后续任务复用时误取旧文件的 reader
+    """
+    global _worker_sweeper
+    if _worker_sweeper is None:
+        _worker_sweeper = threading.Thread(target=_sweep_worker_readers, daemon=True)
+        _worker_sweeper.start()
+    _drop_finished_readers()
+    key = (path, token)
+    with _worker_readers_lock:
+        reader = _worker_readers.pop(key, None)
+    if reader is None:
+        with open(path, "rb") as f:
+            reader = pypdf.PdfReader(io.BytesIO(f.read()))
+    with _worker_readers_lock:
+        _worker_readers[key] = reader
+        while len(_worker_readers) > PDF_WORKER_READERS:
+            _worker_readers.pop(next(iter(_worker_readers)))
+    return reader
+
+
+def _extract_range(reader, start: int, end: int) -> Tuple[List[str], List[float], List[int]]:
+    """提取 [start, end) 页文本，返回 (各页文本, 各页耗时, 提取失败的页号)；失败页文本置空，继续后续页"""
+    texts, timings, failed = [], [], []
+    for i in range(start, end):
+        t0 = time.perf_counter()
+        try:
+            texts.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            texts.append("")
+            failed.append(i)
+        timings.append(time.perf_counter() - t0)
+    return texts, timings, failed
+
+
+def _extract_range_in_worker(path: str, token: str, start: int, end: int):
+    return (start,) + _extract_range(_worker_reader(path, token), start, end)
+
+
+def _split_ranges(total_pages: int, parts: int) -> List[Tuple[int, int]]:
+    step = max(1, math.ceil(total_pages / parts))
+    return [(s, min(s + step, total_pages)) for s in range(0, total_pages, step)]
+
+
+def extract_pdf_pages(
+    data: bytes,
+    max_workers: Optional[int] = None,
+    min_parallel_pages: int = PARALLEL_MIN_PAGES
+) -> Tuple[List[str], List[float], List[int]]:
+    """
+    按页提取 PDF 文本（大文件按页段分发到共享进程池；PDF 经临时文件传给 worker，不随每个页段序列化）
+    max_workers 为切分页段时假定的并行度，实际进程数受 PDF_POOL_WORKERS 限制
+    返回 (各页文本, 各页耗时秒数, 提取失败的页号)，页数总等于 PDF 总页数；
+    失败页文本为空，分诊时会被当作待 OCR 页。
+    """
+    try:
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        total_pages = len(reader.pages)
+    except Exception:
+        return [], [], []
+
+    workers = max_workers or os.cpu_count() or 1
+    if total_pages < min_parallel_pages or workers <= 1:
+        return _extract_range(reader, 0, total_pages)
+
+    ranges = _split_ranges(total_pages, min(workers, PDF_POOL_WORKERS) * RANGES_PER_WORKER)
+    pool = None
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        pool = _get_pdf_pool()
+        token = os.urandom(8).hex()
+        futures = [pool.submit(_extract_range_in_worker, path, token, start, end) for start, end in ranges]
+        results = sorted(future.result() for future in futures)
+    except Exception as e:
+        # 进程池不可用（如受限环境、worker 崩溃）时退回串行
+        if pool is not None and isinstance(e, BrokenExecutor):
+            _reset_pdf_pool(pool)
+        return _extract_range(reader, 0, total_pages)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    texts, timings, failed = [], [], []
+    for _, range_texts, range_timings, range_failed in results:
+        texts.extend(range_texts)
+        timings.extend(range_timings)
+        failed.extend(range_failed)
+    return texts, timings, failed
+
+
+def join_pages(page_texts: List[str]) -> str:
+    """按页序拼接（每页后接换行，与原 `text += page + "\\n"` 结果一致）"""
+    return "".join(t + "\n" for t in page_texts)
+
+
+def summarize_timings(timings: List[float], top: int = 3) -> dict:
+    """每页耗时摘要：总耗时、平均、最慢的几页（页码从 1 开始）"""
+    if not timings:
+        return {"pages": 0, "total": 0.0, "mean": 0.0, "slowest": []}
+    total = sum(timings)
+    slowest = sorted(range(len(timings)), key=lambda i: timings[i], reverse=True)[:top]
+    return {
+        "pages": len(timings),
+        "total": total,
+        "mean": total / len(timings),
+        "slowest": [(i + 1, timings[i]) for i in slowest]
+    }
+
+
+# ============================================
+# 逐页质量分诊：只把低质量页送去 OCR
+# ============================================
+OCR_MIN_PAGE_CHARS = 40        # 非空白字符少于此值视为扫描页/空白页
+OCR_MAX_GARBAGE_RATIO = 0.3    # 乱码字形占比超过此值视为提取失败
+OCR_PAGE_MARKER = "=== PAGE {n} ==="
+OCR_PAGE_MARKER_RE = re.compile(r"^\s*=+\s*PAGE\s+(\d+)\s*=+\s*$", re.MULTILINE)
+
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+
+def _is_garbage_char(ch: str) -> bool:
+    """替换符、私用区、控制字符等无法阅读的字形"""
+    code = ord(ch)
+    if ch == "�" or 0xE000 <= code <= 0xF8FF:
+        return True
+    return unicodedata.category(ch) in ("Cc", "Co", "Cs") and ch not in "\n\t\r"
+
+
+def score_page(text: str) -> Tuple[int, float]:
+    """返回 (非空白字符数, 乱码占比)"""
+    cid_hits = len(_CID_RE.findall(text))
+    text = _CID_RE.sub("", text)
+    chars = [ch for ch in text if not ch.isspace()]
+    total = len(chars) + cid_hits
+    if total == 0:
+        return 0, 0.0
+    garbage = sum(1 for ch in chars if _is_garbage_char(ch)) + cid_hits
+    return total - garbage, garbage / total
+
+
+def triage_pages(
+    page_texts: List[str],
+    min_chars: int = OCR_MIN_PAGE_CHARS,
+    max_garbage_ratio: float = OCR_MAX_GARBAGE_RATIO
+) -> List[int]:
+    """找出需要 OCR 的页（0 起始页号）"""
+    needs_ocr = []
+    for i, text in enumerate(page_texts):
+        good_chars, garbage_ratio = score_page(text)
+        if good_chars < min_chars or garbage_ratio > max_garbage_ratio:
+            needs_ocr.append(i)
+    return needs_ocr
+
+
+def batch_pages(pages: List[int], batch_size: int) -> List[List[int]]:
+    """按页序把待 OCR 页分批（同一批内可以不连续）"""
+    return [pages[i:i + batch_size] for i in range(0, len(pages), batch_size)]
+
+
+def split_ocr_batch(batch_text: str, batch: List[int]) -> Tuple[Dict[int, str], List[int]]:
+    """
+    按 OCR 输出中的页标记拆回各页
+    标记缺失或错乱时，整批文本归到该批第一页，其余页置空，保证不丢字
+    返回 (页号 -> 文本, 未能按自身标记拆出的页)；后者内容不可靠，不应写入缓存
+    """
+    marks = list(OCR_PAGE_MARKER_RE.finditer(batch_text))
+    result = {}
+    if marks:
+        for m, nxt in zip(marks, marks[1:] + [None]):
+            n = int(m.group(1))
+            if not 1 <= n <= len(batch) or batch[n - 1] in result:
+                result = {}
+                break
+            end = nxt.start() if nxt else len(batch_text)
+            result[batch[n - 1]] = batch_text[m.end():end].strip()
+        head = batch_text[:marks[0].start()].strip()
+        if result and head:
+            result[batch[0]] = head + "\n" + result.get(batch[0], "")
+    if result:
+        unresolved = [p for p in batch if p not in result]
+    else:
+        result = {batch[0]: batch_text.strip()}
+        unresolved = list(batch) if len(batch) > 1 else []
+    for p in batch:
+        result.setdefault(p, "")
+    return result, unresolved
+
+
+def splice_pages(page_texts: List[str], ocr_pages: Dict[int, str]) -> List[str]:
+    """用 OCR 结果替换对应页（OCR 为空的页保留原提取结果）"""
+    merged = list(page_texts)
+    for i, text in ocr_pages.items():
+        if text and i < len(merged):
+            merged[i] = text
+    return merged
+
+
+# ============================================
+# OCR 分卷并发调度：多批同时在途，按页序回填
+# ============================================
+OCR_MAX_IN_FLIGHT = 4      # 同时在途（上传/等待/生成）的分卷数
+OCR_POLL_INTERVAL = 1.0    # files.get 轮询间隔（秒）
+OCR_BATCH_RETRIES = 1      # 单卷失败后的重试次数
+
+
+class OcrBatchFailed(Exception):
+    """分卷在服务端处理失败（state == FAILED）"""
+
+
+def _build_batch_pdf(reader, batch: List[int], lock: threading.Lock) -> io.BytesIO:
+    # pypdf 的 reader 不是线程安全的，切分时加锁
+    writer = pypdf.PdfWriter()
+    with lock:
+        for i in batch:
+            writer.add_page(reader.pages[i])
+        buf = io.BytesIO()
+        writer.write(buf)
+    buf.seek(0)
+    return buf
+
+
+def _ocr_one_batch(client, model, reader, lock, batch_idx, batch, prompt, events, poll_interval,
+                   telemetry=None, attempt=0):
+    """
+    单个分卷：切分 -> 上传 -> 轮询 -> 流式生成；进度事件写入 events 队列；生成耗时与用量记入 telemetry
+    uploading 事件带 started（真正开始处理的时刻，不含在线程池中排队的时间），供调度方估算剩余时间
+    """
+    events.put({"batch": batch_idx, "state": "uploading", "started": time.perf_counter()})
+    uploaded = client.files.upload(
+        file=_build_batch_pdf(reader, batch, lock),
+        config={"mime_type": "application/pdf"}
+    )
+
+    events.put({"batch": batch_idx, "state": "processing"})
+    while uploaded.state.name == "PROCESSING":
+        time.sleep(poll_interval)
+        uploaded = client.files.get(name=uploaded.name)
+    if uploaded.state.name == "FAILED":
+        raise OcrBatchFailed(f"分卷 {batch[0]+1}-{batch[-1]+1} 上传处理失败")
+
+    events.put({"batch": batch_idx, "state": "streaming", "text": ""})
+    parts, usage = [], None
+    t0 = time.perf_counter()
+    try:
+        for chunk in client.models.generate_content_stream(model=model, contents=[uploaded, prompt]):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if chunk.text:
+                parts.append(chunk.text)
+                events.put({"batch": batch_idx, "state": "streaming", "text": chunk.text})
+    except Exception as e:
+        if telemetry is not None:
+            telemetry.record("ocr", model, time.perf_counter() - t0, usage, attempt=attempt, error=e)
+        raise
+    if telemetry is not None:
+        telemetry.record("ocr", model, time.perf_counter() - t0, usage, attempt=attempt)
+    return "".join(parts)
+
+
+def run_ocr_batches(
+    client,
+    model: str,
+    file_bytes: bytes,
+    batches: List[List[int]],
+    prompt_for_batch: Callable[[List[int]], str],
+    max_in_flight: int = OCR_MAX_IN_FLIGHT,
+    retries: int = OCR_BATCH_RETRIES,
+    poll_interval: float = OCR_POLL_INTERVAL,
+    on_event: Optional[Callable[[dict], None]] = None,
+    telemetry=None
+) -> Dict[int, str]:
+    """
+    并发执行 OCR 分卷，最多 max_in_flight 卷同时在途
+    telemetry: 可选的调用遥测（llm_runtime.CallTelemetry），每次生成记一条 stage="ocr"
+    on_event 只在调用线程中触发（Streamlit 组件不能跨线程更新），事件字段：
+      batch / pages / state(uploading|processing|streaming|retrying|done|failed)
+      text(流式增量) / error / done / total / elapsed / eta
+      unresolved(done 时，未能按页标记拆出的页，见 split_ocr_batch)
+    返回 {页号: 识别文本}，与完成顺序无关
+    """
+    reader = pypdf.PdfReader(io.BytesIO(file_bytes))
+    lock = threading.Lock()
+    events = queue.Queue()
+    page_texts = {}
+    total = len(batches)
+    done = 0
+    durations = []
+    started = {}   # 分卷号 -> 本次尝试真正开始处理的时刻（来自 uploading 事件）
+    t_start = time.perf_counter()
+
+    def emit(event):
+        if on_event:
+            on_event(event)
+
+    def submit(executor, batch_idx, attempt):
+        batch = batches[batch_idx]
+        # 在调用线程的上下文中运行，遥测记录归入调用方当前的轮次
+        future = executor.submit(
+            contextvars.copy_context().run,
+            _ocr_one_batch, client, model, reader, lock, batch_idx, batch,
+            prompt_for_batch(batch), events, poll_interval, telemetry, attempt
+        )
+        return future, (batch_idx, attempt)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+        pending = dict(submit(executor, i, 0) for i in range(total))
+        while pending:
+            finished, _ = wait(list(pending), timeout=0.1, return_when=FIRST_COMPLETED)
+            while not events.empty():
+                event = events.get_nowait()
+                if "started" in event:
+                    started[event["batch"]] = event.pop("started")
+                event["pages"] = batches[event["batch"]]
+                emit(event)
+
+            for future in finished:
+                batch_idx, attempt = pending.pop(future)
+                batch = batches[batch_idx]
+                unresolved = []
+                try:
+                    texts, unresolved = split_ocr_batch(future.result(), batch)
+                    page_texts.update(texts)
+                    state, error = "done", None
+                    durations.append(time.perf_counter() - started.get(batch_idx, t_start))
+                except Exception as e:
+                    if attempt < retries:
+                        emit({"batch": batch_idx, "pages": batch, "state": "retrying", "error": str(e)})
+                        new_future, info = submit(executor, batch_idx, attempt + 1)
+                        pending[new_future] = info
+                        continue
+                    state, error = "failed", str(e)
+
+                done += 1
+                remaining = total - done
+                avg = sum(durations) / len(durations) if durations else 0.0
+                emit({
+                    "batch": batch_idx, "pages": batch, "state": state, "error": error,
+                    "unresolved": unresolved, "done": done, "total": total,
+                    "elapsed": time.perf_counter() - t_start,
+                    "eta": avg * math.ceil(remaining / max(1, max_in_flight))
+                })
+
+    return page_texts
+
+
+# ============================================
+# 内容寻址缓存：SHA-256(文件字节) + 提取器版本 -> 每页文本
+# ============================================
+EXTRACTOR_VERSION = "pdf-pypdf-2"   # 提取逻辑变化时递增，旧缓存自然失效
+DOC_CACHE_DIR = os.environ.get("JIESHUKE_CACHE_DIR", os.path.join(".cache", "documents"))
+DOC_CACHE_MAX_BYTES = int(os.environ.get("JIESHUKE_CACHE_MAX_MB", "512")) * 1024 * 1024
+DOC_CACHE_EVICT_INTERVAL = 60.0    # 两次淘汰扫描的最小间隔（秒），避免每次写入都遍历整个目录
+DOC_CACHE_STALE_TMP_AGE = 3600.0   # 超过此时长的 *.tmp 视为写入中途崩溃的残留，扫描时删除
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class DocumentCache:
+    """
+    磁盘缓存，每个条目一个 JSON 文件：{"pages": {页号: 文本}}
+    - 命中时刷新 mtime，超出容量时按 mtime 从旧到新淘汰（LRU）
+    - 淘汰扫描按 DOC_CACHE_EVICT_INTERVAL 节流，顺带清理残留的临时文件
+    - 写入走临时文件 + os.replace，多进程/多会话并发安全
+    """
+
+    def __init__(
+        self,
+        root: str = DOC_CACHE_DIR,
+        max_bytes: int = DOC_CACHE_MAX_BYTES,
+        evict_interval: float = DOC_CACHE_EVICT_INTERVAL
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._last_evict = float("-inf")
+
+    def _path(self, digest: str, version: str) -> str:
+        key = hashlib.sha256(f"{digest}:{version}".encode()).hexdigest()
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, digest: str, version: str) -> Optional[Dict[int, str]]:
+        path = self._path(digest, version)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {int(k): v for k, v in pages.items()}
+
+    def put(self, digest: str, version: str, pages: Dict[int, str]):
+        path = self._path(digest, version)
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"pages": {str(k): v for k, v in pages.items()}}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            # 缓存不可写时不影响主流程
+            _remove_quietly(tmp)
+            return
+        self._maybe_evict()
+
+    def put_stream(self, digest: str, version: str, pages: Iterable[str]) -> Iterator[str]:
+        """
+        边产出边写入：逐页透传 pages，同时把各页追加写入临时文件，全部产出完才落盘
+        中途停止迭代、读取出错或写入失败时不留下条目；整份文本不在内存中汇总
+        """
+        path = self._path(digest, version)
+        f = tmp = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            f = os.fdopen(fd, "w", encoding="utf-8")
+            f.write('{"pages": {')
+        except OSError:
+            f = self._discard(f, tmp)
+        complete = False
+        try:
+            for i, page in enumerate(pages):
+                if f is not None:
+                    try:
+                        f.write(("," if i else "") + f'"{i}": ' + json.dumps(page, ensure_ascii=False))
+                    except OSError:
+                        f = self._discard(f, tmp)
+                yield page
+            complete = True
+        finally:
+            if f is not None and complete:
+                try:
+                    f.write("}}")
+                    f.close()
+                    os.replace(tmp, path)
+                except OSError:
+                    self._discard(f, tmp)
+                else:
+                    self._maybe_evict()
+            elif f is not None:
+                self._discard(f, tmp)
+
+    @staticmethod
+    def _discard(f, tmp: Optional[str]):
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+        _remove_quietly(tmp)
+        return None
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_evict >= self.evict_interval:
+            self._last_evict = now
+            self.evict()
+
+    def evict(self):
+        entries = []
+        stale_before = time.time() - DOC_CACHE_STALE_TMP_AGE
+        for dirpath, _, filenames in os.walk(self.root):
+            for fn in filenames:
+                if not fn.endswith((".json", ".tmp")):
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    info = os.stat(path)
+                    if fn.endswith(".tmp"):
+                        if info.st_mtime < stale_before:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get_list(self, digest: str, version: str) -> Optional[List[str]]:
+        pages = self.get(digest, version)
+        if pages is None:
+            return None
+        return [pages[i] for i in range(len(pages))]
+
+    def put_list(self, digest: str, version: str, pages: List[str]):
+        self.put(digest, version, dict(enumerate(pages)))
+
+
+def _remove_quietly(path: Optional[str]):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+doc_cache = DocumentCache()
+
+
+def extract_pdf_pages_cached(
+    data: bytes,
+    cache: Optional[DocumentCache] = None,
+    **kwargs
+) -> Tuple[List[str], List[float]]:
+    """
+    带缓存的 extract_pdf_pages；命中缓存时耗时列表为空
+    有页提取失败（或整份无法解析）时不写缓存，下次重新提取
+    """
+    cache = cache or doc_cache
+    digest = file_digest(data)
+    pages = cache.get_list(digest, EXTRACTOR_VERSION)
+    if pages is not None:
+        return pages, []
+    pages, timings, failed = extract_pdf_pages(data, **kwargs)
+    if pages and not failed:
+        cache.put_list(digest, EXTRACTOR_VERSION, pages)
+    return pages, timings
+
+
+class LazyPages:
+    """
+    非 PDF 格式的惰性页序列：可重复迭代，每次迭代逐页产出，不在内存中保留整份文本
+    - 命中内容缓存时逐页取缓存（读入的只是这一份文件的缓存条目）
+    - 未命中时调用 read(data) 流式读取，边产出边写入缓存（见 DocumentCache.put_stream）
+    - version 为 None 时不走缓存（如纯文本，解码本身足够快）
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        read: Callable[[bytes], Iterable[str]],
+        version: Optional[str] = None,
+        cache: Optional[DocumentCache] = None
+    ):
+        self.data = data
+        self.read = read
+        self.version = version
+        self.cache = cache
+        self.digest = file_digest(data) if version is not None else None
+
+    def __iter__(self) -> Iterator[str]:
+        if self.version is None:
+            yield from self.read(self.data)
+            return
+        cache = self.cache or doc_cache
+        pages = cache.get_list(self.digest, self.version)
+        if pages is not None:
+            yield from pages
+            return
+        yield from cache.put_stream(self.digest, self.version, self.read(self.data))
+
+
+def digest_pages(pages: Iterable[str]) -> Tuple[str, int]:
+    """
+    逐页增量计算 SHA-256（结果等同于对以换行拼接的全文求 file_digest，但不拼接），
+    同时统计各页去掉首尾空白后的字符数；返回 (摘要, 字符数)
+    """
+    h = hashlib.sha256()
+    chars = 0
+    for i, page in enumerate(pages):
+        if i:
+            h.update(b"\n")
+        h.update(page.encode("utf-8"))
+        chars += len(page.strip())
+    return h.hexdigest(), chars
+
+
+# ============================================
+# 段落流：读取器 -> 切分器，避免整本拼接与 split 出的大列表
+# ============================================
+class Paragraph(NamedTuple):
+    text: str          # 去除首尾空白后的段落（一行）
+    source: str        # 来源文件名
+    offset: int        # 在该文件提取文本（按页以换行拼接）中的字符偏移
+    new_block: bool    # 前面是否有空行（或位于文件开头），用于按空行分段的切分器
+
+
+def iter_paragraphs(pieces: Iterable[str], source: str = "") -> Iterator[Paragraph]:
+    """
+    逐行产出非空段落，pieces 视为以换行拼接的多段文本（如 PDF 各页）
+    只在当前行上切片，不复制整段文本
+    """
+    base = 0
+    blank = True
+    for piece in pieces:
+        pos, size = 0, len(piece)
+        while pos <= size:
+            end = piece.find("\n", pos)
+            if end == -1:
+                end = size
+            line = piece[pos:end]
+            text = line.strip()
+            if text:
+                lead = len(line) - len(line.lstrip())
+                yield Paragraph(text, source, base + pos + lead, blank)
+                blank = False
+            else:
+                blank = True
+            pos = end + 1
+        base += size + 1
+
+
+def as_paragraphs(content: Union[str, Iterable]) -> Iterator[Paragraph]:
+    """统一切分器输入：整段字符串、Paragraph 流，或字符串流（每项视为独立文本块）"""
+    if isinstance(content, str):
+        yield from iter_paragraphs([content])
+        return
+    for item in content:
+        if isinstance(item, Paragraph):
+            yield item
+        else:
+            yield from iter_paragraphs([item])
+
+
+def iter_document_paragraphs(documents: Iterable[Tuple[str, Iterable[str]]]) -> Iterator[Paragraph]:
+    """按上传顺序串联多个文件 (文件名, 各页文本) 的段落流；页序列可以是列表或 LazyPages"""
+    for source, pages in documents:
+        yield from iter_paragraphs(pages, source)
+
+
+class DocumentParagraphs:
+    """
+    iter_document_paragraphs 的可重复迭代版本：每次迭代都从各文件的页序列重新产出段落，
+    供需要两遍扫描的切分器（衔接度切分）使用，无需把段落缓存成列表
+    """
+
+    def __init__(self, documents: List[Tuple[str, Iterable[str]]]):
+        self.documents = documents
+
+    def __iter__(self) -> Iterator[Paragraph]:
+        return iter_document_paragraphs(self.documents)
+
+
+# ============================================
+# 各格式读取器 + 多文件并发读取
+# ============================================
+INGEST_MAX_WORKERS = 8
+EPUB_READER_VERSION = "epub-spine-lxml-1"
+DOCX_READER_VERSION = "docx-iterparse-2"   # 2: 每个段落 / 表格行一页，不再拼成整份
+TEXT_DECODE_BLOCK = 1 << 20                # 纯文本按块增量解码的字节数
+
+
+EPUB_HTML_TYPES = ("application/xhtml+xml", "text/html")
+EPUB_MAX_WORKERS = 8
+_CONTAINER_NS = {"c": "urn:oasis:names:tc:opendocument:xmlns:container"}
+_OPF_NS = {"opf": "http://www.idpf.org/2007/opf"}
+
+
+def epub_spine_paths(zf: zipfile.ZipFile) -> List[str]:
+    """按 OPF spine 的阅读顺序返回 XHTML 条目路径；元数据缺失时退回按文件名排序"""
+    names = set(zf.namelist())
+    try:
+        container = etree.fromstring(zf.read("META-INF/container.xml"))
+        opf_path = container.find(".//c:rootfile", _CONTAINER_NS).get("full-path")
+        opf = etree.fromstring(zf.read(opf_path))
+        base = posixpath.dirname(opf_path)
+        manifest = {}
+        for item in opf.iterfind(".//opf:manifest/opf:item", _OPF_NS):
+            if item.get("media-type") in EPUB_HTML_TYPES:
+                href = posixpath.normpath(posixpath.join(base, unquote(item.get("href", ""))))
+                manifest[item.get("id")] = href
+        paths = [
+            manifest[ref.get("idref")]
+            for ref in opf.iterfind(".//opf:spine/opf:itemref", _OPF_NS)
+            if ref.get("idref") in manifest
+        ]
+        paths = [p for p in paths if p in names]
+        if paths:
+            return paths
+    except (KeyError, AttributeError, etree.XMLSyntaxError):
+        pass
+    return sorted(n for n in names if n.lower().endswith((".xhtml", ".html", ".htm")))
+
+
+def html_to_text(content: bytes) -> str:
+    """lxml 解析 XHTML 正文，去掉 script/style/注释，每个文本节点一行"""
+    try:
+        root = lxml.html.fromstring(content)
+    except (etree.ParserError, ValueError):
+        return ""
+    body = root.find(".//body")
+    root = body if body is not None else root
+    etree.strip_elements(root, "script", "style", etree.Comment, with_tail=False)
+    return "\n".join(t for t in (s.strip() for s in root.itertext()) if t)
+
+
+def iter_epub_chapters(data: bytes, max_workers: int = EPUB_MAX_WORKERS) -> Iterator[str]:
+    """
+    直接在内存中打开 EPUB（不落临时文件），按 spine 顺序逐章产出文本
+    lxml 解析时释放 GIL，章节在线程池中并行解析；最多预读 max_workers 章，已产出的章节不再保留
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        paths = epub_spine_paths(zf)
+        if len(paths) <= 1:
+            for path in paths:
+                yield html_to_text(zf.read(path))
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            window = collections.deque()
+            for path in paths:
+                window.append(executor.submit(html_to_text, zf.read(path)))
+                if len(window) >= max_workers:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_CELL_SEP = " | "
+
+
+def _docx_paragraph_text(p) -> str:
+    """与 python-docx 的 Paragraph.text 规则一致：w:t 文本，w:tab 为制表符，w:br/w:cr 为换行"""
+    parts = []
+    for node in p.iter(_W + "t", _W + "tab", _W + "br", _W + "cr", _W + "noBreakHyphen"):
+        if node.tag == _W + "t":
+            parts.append(node.text or "")
+        elif node.tag == _W + "tab":
+            parts.append("\t")
+        elif node.tag == _W + "noBreakHyphen":
+            parts.append("-")
+        else:
+            parts.append("\n")
+    return "".join(parts)
+
+
+def iter_docx_paragraphs(data: bytes) -> Iterator[str]:
+    """
+    流式读取 word/document.xml，按文档顺序产出正文段落与表格行
+    表格每行产出一条，单元格之间用 DOCX_CELL_SEP 连接（python-docx 的 paragraphs 会丢掉表格）
+    已处理的元素随即清除，内存占用与文件大小无关
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zf, zf.open("word/document.xml") as xml:
+        rows = []    # 嵌套表格栈：每层为当前行的单元格文本列表
+        cells = []   # 与 rows 对应：当前单元格内的段落
+        for event, elem in etree.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _W + "tr":
+                    rows.append([])
+                elif tag == _W + "tc":
+                    cells.append([])
+                continue
+
+            if tag == _W + "p":
+                text = _docx_paragraph_text(elem)
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield text
+            elif tag == _W + "tc" and cells:
+                cell_text = " ".join(t.strip() for t in cells.pop() if t.strip())
+                if rows:
+                    rows[-1].append(cell_text)
+            elif tag == _W + "tr" and rows:
+                row = rows.pop()
+                line = DOCX_CELL_SEP.join(row)
+                if cells:
+                    cells[-1].append(line)   # 嵌套表格并入外层单元格
+                elif line.strip(" |"):
+                    yield line
+            else:
+                continue
+
+            # 段落/单元格/行处理完即释放，同时删掉已处理的前序兄弟节点
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+
+def iter_text_pieces(data: bytes, block: int = TEXT_DECODE_BLOCK) -> Iterator[str]:
+    """
+    纯文本按块增量解码（UTF-8，忽略非法字节），在换行处切开逐段产出
+    各段以换行拼接即为完整文本，与 iter_paragraphs 的“页”约定一致
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    view = memoryview(data)
+    tail = ""
+    for start in range(0, len(data), block):
+        text = tail + decoder.decode(view[start:start + block])
+        cut = text.rfind("\n")
+        if cut == -1:
+            tail = text
+            continue
+        yield text[:cut]
+        tail = text[cut + 1:]
+    yield tail + decoder.decode(b"", final=True)
+
+
+def read_document(name: str, data: bytes) -> dict:
+    """
+    读取单个文件（不含 OCR 与任何 UI），异常被捕获到 error 字段
+    返回 {name, ext, pages, chars, timings, ocr_targets, error, elapsed}
+    - PDF 的 pages 为各页文本列表（分页并行提取，OCR 按页号回填，需要整份页列表）
+    - EPUB / DOCX / TXT 的 pages 为 LazyPages：这里先完整流式读一遍（校验文件、统计字数、写入缓存），
+      之后每次迭代再逐页产出，不在内存中保留整份文本
+    """
+    ext = name.lower().rsplit(".", 1)[-1] if "." in name else ""
+    doc = {"name": name, "ext": ext, "pages": [], "chars": 0, "timings": [], "ocr_targets": [], "error": None}
+    t0 = time.perf_counter()
+    try:
+        if ext == "pdf":
+            doc["pages"], doc["timings"] = extract_pdf_pages_cached(data)
+            doc["ocr_targets"] = triage_pages(doc["pages"])
+        elif ext == "epub":
+            doc["pages"] = LazyPages(data, iter_epub_chapters, EPUB_READER_VERSION)
+        elif ext in ["docx", "doc"]:
+            doc["pages"] = LazyPages(data, iter_docx_paragraphs, DOCX_READER_VERSION)
+        else:
+            doc["pages"] = LazyPages(data, iter_text_pieces)
+        doc["chars"] = sum(len(p) for p in doc["pages"])
+    except Exception as e:
+        doc["pages"] = []
+        doc["error"] = str(e)
+    doc["elapsed"] = time.perf_counter() - t0
+    return doc
+
+
+def read_documents(
+    items: List[Tuple[str, bytes]],
+    max_workers: int = INGEST_MAX_WORKERS,
+    on_done: Optional[Callable[[int, dict], None]] = None
+) -> List[dict]:
+    """
+    并发读取多个文件，单个文件失败不影响其他文件
+    大 PDF 内部仍会走分页进程池；on_done(序号, 结果) 在调用线程中按完成顺序触发
+    返回值按 items 原顺序排列
+    """
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(read_document, name, data): i for i, (name, data) in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_done:
+                on_done(i, results[i])
+    return results
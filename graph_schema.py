@@ -0,0 +1,72 @@
+"""
+事件中心知识图谱的 Pydantic Schema - 与 Streamlit 解耦，供 app.py（结构化输出）与 bench.py 共用
+"""
+
+from enum import Enum
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# ============================================
+# Pydantic Schema - Event-Centric Knowledge Graph
+# ============================================
+
+class RiskLevel(str, Enum):
+    SAFE = "SAFE"               # 符合官方叙事
+    CONTROVERSIAL = "CONTROVERSIAL"  # 有争议/未定论
+    HIGH_RISK = "HIGH_RISK"     # 明显违规/历史虚无主义
+
+class EntityType(str, Enum):
+    PERSON = "PERSON"           # 政治人物
+    LOCATION = "LOCATION"       # 地点
+    ORG = "ORG"                  # 组织/党派
+    DOCUMENT = "DOCUMENT"       # 文件/著作/决议
+    CONCEPT = "CONCEPT"         # 提法/口号/主义
+
+class EventType(str, Enum):
+    MEETING = "MEETING"         # 会议
+    CONFLICT = "CONFLICT"       # 战争/冲突
+    SPEECH = "SPEECH"           # 讲话/发表
+    POLICY = "POLICY"           # 政策出台
+    MOVEMENT = "MOVEMENT"       # 政治运动
+
+# 移除 RelationType 枚举，改为自由文本关系
+
+class EntityNode(BaseModel):
+    """实体节点"""
+    id: str = Field(..., description="归一化ID，如 'PER_Mao_Zedong'")
+    name: str = Field(..., description="实体标准中文名")
+    type: EntityType
+    alias: List[str] = Field(default=[], description="文中出现的别名/黑话")
+
+class EventNode(BaseModel):
+    """事件节点"""
+    id: str = Field(..., description="事件ID，格式：EVT_动词_主体_时间")
+    name: str = Field(..., description="事件简述，如'遵义会议召开'")
+    type: EventType
+    time_str: str = Field(..., description="标准化时间字符串 YYYY-MM-DD")
+    description: str = Field(..., description="事件的详细经过描述")
+    political_significance: str = Field(..., description="该事件的政治定性/历史意义")
+    risk_level: RiskLevel = Field(..., description="根据输入源判断该描述的风险等级")
+
+class RelationEdge(BaseModel):
+    """关系边"""
+    source_id: str = Field(..., description="源节点ID (Entity 或 Event)")
+    target_id: str = Field(..., description="目标节点ID")
+    relation: str = Field(..., description="关系动词/动作，如：参与、组织、发起、批评、支持、反对、任命、出席、领导、提出、批准、签署、调任、逮捕、处决、平反等")
+    details: str = Field(..., description="关系的具体细节，如'担任组长'、'造成300人伤亡'")
+    evidence: str = Field(..., description="原文证据片段")
+
+class HistoricalGraphBatch(BaseModel):
+    """单次处理返回的图谱切片"""
+    entities: List[EntityNode]
+    events: List[EventNode]
+    relations: List[RelationEdge]
+
+class ChunkGraphBatch(HistoricalGraphBatch):
+    """多块打包请求中单个片段的图谱切片"""
+    chunk_index: int = Field(..., description="片段编号，与【片段 k】中的 k 一致")
+
+class MultiChunkGraphBatch(BaseModel):
+    """多块打包请求的返回：每个片段一份图谱切片"""
+    chunks: List[ChunkGraphBatch]
@@ -0,0 +1,320 @@
+"""
+可插拔的 LLM 客户端层 - 与 Streamlit 解耦，供 app.py 与 book_hunter.py 共用
+后端由环境变量 JIESHUKE_LLM_BACKEND 选择：
+- live（默认）: 原生 google-genai 客户端
+- record: 调用真实服务，同时把每对请求 / 响应按提示词哈希存盘
+- replay: 不联网，从磁盘回放录制的响应；可配置延迟与错误注入，无需 API Key
+接口与 genai.Client 中本项目用到的部分对齐：models / aio.models 的 generate_content(_stream)、files.upload / get
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import List, Optional
+
+from llm_runtime import schema_hash
+
+LLM_BACKEND = os.environ.get("JIESHUKE_LLM_BACKEND", "live").lower()
+REPLAY_DIR = os.environ.get("JIESHUKE_REPLAY_DIR", os.path.join(".cache", "llm_tape"))
+REPLAY_LATENCY = os.environ.get("JIESHUKE_REPLAY_LATENCY", "0")      # 秒数，或 "recorded" 按录制时的耗时
+REPLAY_ERROR_RATE = float(os.environ.get("JIESHUKE_REPLAY_ERROR_RATE", "0"))
+REPLAY_ERROR_CODE = int(os.environ.get("JIESHUKE_REPLAY_ERROR_CODE", "429"))
+REPLAY_STREAM_PIECES = 8     # 回放非流式录制的响应时，流式接口拆成的片段数
+
+
+class ReplayError(Exception):
+    """回放时注入的服务端错误，code 与 SDK 的 APIError 一致（llm_runtime.error_code 可识别）"""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"{code} {message or '回放注入的错误'}")
+        self.code = code
+
+
+class ReplayMiss(KeyError):
+    """回放模式下磁带里没有对应请求"""
+
+
+class ReplayResponse:
+    """回放 / 录制用的响应对象，接口与 SDK 响应的 .text / .usage_metadata 对齐"""
+
+    def __init__(self, text: str, usage: Optional[dict] = None):
+        self.text = text
+        self.usage_metadata = _Usage(usage) if usage else None
+
+
+class _Usage:
+    def __init__(self, usage: dict):
+        self.prompt_token_count = usage.get("prompt_token_count")
+        self.candidates_token_count = usage.get("candidates_token_count")
+        self.total_token_count = usage.get("total_token_count")
+
+
+def _usage_dict(response) -> Optional[dict]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        name: getattr(usage, name, None)
+        for name in ("prompt_token_count", "candidates_token_count", "total_token_count")
+    }
+
+
+# ============================================
+# 磁带：每对请求 / 响应一个 JSON 文件，键 = 模型 + 内容（文件按内容哈希）+ schema/配置哈希
+# ============================================
+class LLMTape:
+    def __init__(self, root: str = REPLAY_DIR):
+        self.root = root
+        self._files = {}   # 上传文件名 -> 内容哈希
+        self._lock = threading.Lock()
+
+    def remember_file(self, name: str, digest: str):
+        with self._lock:
+            self._files[name] = digest
+
+    def key(self, model: str, contents, config=None) -> str:
+        items = contents if isinstance(contents, list) else [contents]
+        parts = []
+        for item in items:
+            name = getattr(item, "name", None)
+            if not isinstance(item, str) and name in self._files:
+                parts.append("file:" + self._files[name])
+            else:
+                parts.append("text:" + str(item))
+        payload = json.dumps([model, parts, schema_hash(config)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, model: str, contents, entry: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        preview = contents[-1] if isinstance(contents, list) else contents
+        entry = dict(entry, model=model, prompt_preview=str(preview)[:200], recorded_at=time.time())
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)  # 原子替换，并发录制同一请求时后写者覆盖
+
+    def __len__(self):
+        count = 0
+        for _, _, names in os.walk(self.root):
+            count += sum(1 for n in names if n.endswith(".json"))
+        return count
+
+
+def _file_digest(file) -> str:
+    if hasattr(file, "read"):
+        data = file.read()
+        if hasattr(file, "seek"):
+            file.seek(0)
+    else:
+        with open(file, "rb") as f:
+            data = f.read()
+    return hashlib.sha256(data).hexdigest()
+
+
+# ============================================
+# 录制：透传真实客户端，成功的响应落盘
+# ============================================
+class RecordingClient:
+    def __init__(self, inner, tape: LLMTape):
+        self._inner, self.tape = inner, tape
+        self.models = _RecordingModels(inner.models, tape)
+        self.aio = _Namespace(models=_AsyncRecordingModels(inner.aio.models, tape))
+        self.files = _RecordingFiles(inner.files, tape)
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class _RecordingFiles:
+    def __init__(self, inner, tape):
+        self._inner, self.tape = inner, tape
+
+    def upload(self, file, config=None):
+        digest = _file_digest(file)
+        uploaded = self._inner.upload(file=file, config=config)
+        self.tape.remember_file(uploaded.name, digest)
+        return uploaded
+
+    def get(self, name, config=None):
+        return self._inner.get(name=name)
+
+
+class _RecordingModels:
+    def __init__(self, inner, tape):
+        self._inner, self.tape = inner, tape
+
+    def generate_content(self, model, contents, config=None):
+        t0 = time.perf_counter()
+        response = self._inner.generate_content(model=model, contents=contents, config=config)
+        self.tape.put(self.tape.key(model, contents, config), model, contents, {
+            "text": response.text or "", "usage": _usage_dict(response), "elapsed": time.perf_counter() - t0
+        })
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        t0 = time.perf_counter()
+        pieces, usage = [], None
+        for chunk in self._inner.generate_content_stream(model=model, contents=contents, config=config):
+            pieces.append(chunk.text or "")
+            usage = _usage_dict(chunk) or usage
+            yield chunk
+        self.tape.put(self.tape.key(model, contents, config), model, contents, {
+            "text": "".join(pieces), "pieces": pieces, "usage": usage, "elapsed": time.perf_counter() - t0
+        })
+
+
+class _AsyncRecordingModels:
+    def __init__(self, inner, tape):
+        self._inner, self.tape = inner, tape
+
+    async def generate_content(self, model, contents, config=None):
+        t0 = time.perf_counter()
+        response = await self._inner.generate_content(model=model, contents=contents, config=config)
+        self.tape.put(self.tape.key(model, contents, config), model, contents, {
+            "text": response.text or "", "usage": _usage_dict(response), "elapsed": time.perf_counter() - t0
+        })
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None):
+        t0 = time.perf_counter()
+        stream = await self._inner.generate_content_stream(model=model, contents=contents, config=config)
+
+        async def recorded():
+            pieces, usage = [], None
+            async for chunk in stream:
+                pieces.append(chunk.text or "")
+                usage = _usage_dict(chunk) or usage
+                yield chunk
+            self.tape.put(self.tape.key(model, contents, config), model, contents, {
+                "text": "".join(pieces), "pieces": pieces, "usage": usage, "elapsed": time.perf_counter() - t0
+            })
+        return recorded()
+
+
+# ============================================
+# 回放：不联网，按键取录制响应；延迟与错误注入可配置
+# ============================================
+class ReplayClient:
+    def __init__(self, tape: LLMTape, latency: str = REPLAY_LATENCY,
+                 error_rate: float = REPLAY_ERROR_RATE, error_code: int = REPLAY_ERROR_CODE,
+                 seed: Optional[int] = None):
+        self.tape = tape
+        self.latency = latency
+        self.error_rate, self.error_code = error_rate, error_code
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.models = _ReplayModels(self)
+        self.aio = _Namespace(models=_AsyncReplayModels(self))
+        self.files = _ReplayFiles(tape)
+
+    def _lookup(self, model, contents, config):
+        """返回 (录制条目, 应等待秒数)；按错误率注入 ReplayError，未录制时抛 ReplayMiss"""
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+        key = self.tape.key(model, contents, config)
+        entry = self.tape.get(key)
+        if entry is None:
+            raise ReplayMiss(f"回放磁带中没有该请求（{key[:12]}…），请先用 record 模式录制")
+        if self.latency == "recorded":
+            delay = float(entry.get("elapsed") or 0)
+        else:
+            delay = float(self.latency or 0)
+        if failed:
+            raise ReplayError(self.error_code)
+        return entry, delay
+
+    @staticmethod
+    def _pieces(entry: dict) -> List[str]:
+        if entry.get("pieces"):
+            return entry["pieces"]
+        text = entry.get("text", "")
+        step = max(1, -(-len(text) // REPLAY_STREAM_PIECES))
+        return [text[i:i + step] for i in range(0, len(text), step)] or [""]
+
+
+class _ReplayFiles:
+    def __init__(self, tape):
+        self.tape = tape
+
+    def upload(self, file, config=None):
+        digest = _file_digest(file)
+        name = f"files/replay-{digest[:16]}"
+        self.tape.remember_file(name, digest)
+        return _Namespace(name=name, state=_Namespace(name="ACTIVE"))
+
+    def get(self, name, config=None):
+        return _Namespace(name=name, state=_Namespace(name="ACTIVE"))
+
+
+class _ReplayModels:
+    def __init__(self, client: ReplayClient):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        entry, delay = self.client._lookup(model, contents, config)
+        time.sleep(delay)
+        return ReplayResponse(entry.get("text", ""), entry.get("usage"))
+
+    def generate_content_stream(self, model, contents, config=None):
+        entry, delay = self.client._lookup(model, contents, config)
+        pieces = self.client._pieces(entry)
+        for i, piece in enumerate(pieces):
+            time.sleep(delay / len(pieces))
+            yield ReplayResponse(piece, entry.get("usage") if i == len(pieces) - 1 else None)
+
+
+class _AsyncReplayModels:
+    def __init__(self, client: ReplayClient):
+        self.client = client
+
+    async def generate_content(self, model, contents, config=None):
+        entry, delay = self.client._lookup(model, contents, config)
+        await asyncio.sleep(delay)
+        return ReplayResponse(entry.get("text", ""), entry.get("usage"))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        entry, delay = self.client._lookup(model, contents, config)
+        pieces = self.client._pieces(entry)
+
+        async def replay():
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(delay / len(pieces))
+                yield ReplayResponse(piece, entry.get("usage") if i == len(pieces) - 1 else None)
+        return replay()
+
+
+# ============================================
+# 工厂：app.get_client / ocr_pdf_with_gemini / GraphProcessor.init_client 都经由这里建客户端
+# ============================================
+def create_client(api_key: str = "", backend: Optional[str] = None, tape_dir: Optional[str] = None):
+    backend = (backend or LLM_BACKEND).lower()
+    if backend == "replay":
+        return ReplayClient(LLMTape(tape_dir or REPLAY_DIR))
+    from google import genai
+    client = genai.Client(api_key=api_key)
+    if backend == "record":
+        return RecordingClient(client, LLMTape(tape_dir or REPLAY_DIR))
+    return client
+
+
+def needs_api_key(backend: Optional[str] = None) -> bool:
+    return (backend or LLM_BACKEND).lower() != "replay"
@@ -0,0 +1,1159 @@
+"""
+LLM 调用运行时 - 与 Streamlit 解耦，供 app.py 与 book_hunter.py 共用
+（响应缓存等与具体提示词无关的基础设施）
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from json.decoder import scanstring
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# ============================================
+# 持久化响应缓存：SQLite，键 = 模型 + 提示词哈希 + schema/配置哈希
+# ============================================
+LLM_CACHE_VERSION = "1"      # 缓存格式变化时递增，旧条目自然失效
+LLM_CACHE_PATH = os.environ.get("JIESHUKE_LLM_CACHE", os.path.join(".cache", "llm_responses.sqlite3"))
+LLM_CACHE_TTL = float(os.environ.get("JIESHUKE_LLM_CACHE_TTL_DAYS", "30")) * 86400
+LLM_CACHE_MAX_BYTES = int(os.environ.get("JIESHUKE_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+LLM_CACHE_EVICT_EVERY = 50   # 每写入多少条检查一次容量
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def schema_hash(config) -> str:
+    """
+    生成配置的稳定哈希：response_schema（Pydantic 类取 JSON Schema）+ 其余生成参数
+    温度、输出上限、工具（如联网搜索）不同都视为不同请求
+    """
+    if config is None:
+        return _sha256("")
+    schema = getattr(config, "response_schema", None)
+    if isinstance(schema, type) and hasattr(schema, "model_json_schema"):
+        schema = schema.model_json_schema()
+    try:
+        rest = config.model_dump(mode="json", exclude={"response_schema"}, exclude_none=True)
+    except AttributeError:
+        rest = config
+    return _sha256(json.dumps({"schema": schema, "config": rest}, sort_keys=True, ensure_ascii=False, default=str))
+
+
+class CachedResponse:
+    """缓存命中时返回的响应，接口与 SDK 响应的 .text 对齐；无 usage 信息"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+        self.cached = True
+
+
+class ResponseCache:
+    """
+    SQLite 响应缓存
+    - 每个线程一个连接，WAL 模式 + busy_timeout，多线程 / 多会话 / 多进程共用同一文件
+    - 过期（TTL）条目读取时视为未命中并删除；超出容量时按最近访问时间从旧到新淘汰
+    - hits / misses 为本进程计数（所有 Streamlit 会话共享）
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, prompt_hash TEXT, schema_hash TEXT,"
+                " value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def key(model: str, prompt: str, config=None) -> str:
+        return _sha256(f"{LLM_CACHE_VERSION}|{model}|{_sha256(prompt)}|{schema_hash(config)}")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            row = None  # 缓存不可用时不影响主流程
+        self._count(row is not None)
+        return row[0] if row is not None else None
+
+    def put(self, key: str, value: str, model: str = "", prompt: str = "", config=None):
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, _sha256(prompt), schema_hash(config), value,
+                 len(value.encode("utf-8")), now, now)
+            )
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % LLM_CACHE_EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目；总大小超限时按 accessed 从旧到新删到容量的 90%"""
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - int(self.max_bytes * 0.9)
+            doomed, freed = [], 0
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                if freed >= excess:
+                    break
+                doomed.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        try:
+            entries, size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+llm_cache = ResponseCache()
+
+
+# ============================================
+# 调用遥测：每次模型调用记录阶段 / 耗时 / token / 重试 / 缓存命中，按运行（一次 OCR 或一次抽取）汇总
+# ============================================
+PRICE_INPUT_PER_M = float(os.environ.get("JIESHUKE_PRICE_INPUT_PER_M", "0.5"))    # 美元 / 百万输入 token（估算成本）
+PRICE_OUTPUT_PER_M = float(os.environ.get("JIESHUKE_PRICE_OUTPUT_PER_M", "3.0"))  # 美元 / 百万输出 token
+TELEMETRY_MAX_RECORDS = 50000    # 超出后丢弃最早的记录
+STAGE_CN = {"ocr": "OCR", "breakpoint": "断点判定", "extract": "块抽取", "orphans": "孤立节点整合", "sparse": "稀疏节点补全"}
+
+# 当前调用是所在 job 的第几次尝试（run_async_jobs 在每次调用 worker 前设置；0 = 首次）
+job_attempt = contextvars.ContextVar("job_attempt", default=0)
+# 当前调用归属的遥测轮次（start_run 在调用方上下文中设置）：多个 Streamlit 会话各自独立，
+# asyncio 任务自动继承；线程池需用 contextvars.copy_context().run 提交
+telemetry_run = contextvars.ContextVar("telemetry_run", default="")
+# 当前 run_async_jobs 收到的界面中断（见 defer_interrupt）；None 表示不在 run_async_jobs 内
+job_interrupts = contextvars.ContextVar("job_interrupts", default=None)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位（q 取 0-100）；空列表返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class CallTelemetry:
+    """
+    模型调用遥测
+    - record() 每次调用一条：stage / model / latency / input_tokens / output_tokens / cached / attempt / error
+    - add_yield() 记录阶段产出（块数、实体 / 事件 / 关系数），用于计算每块 token、每千 token 实体数
+    - start_run() 开启新一轮（附带切分 / 并发 / 预算等参数）并设为当前上下文的轮次（见 telemetry_run），
+      之后的记录归入该轮；summary() / to_jsonl() 默认取当前上下文的轮次
+    线程安全：断点判定、OCR 在线程池中调用
+    """
+
+    def __init__(self, max_records: int = TELEMETRY_MAX_RECORDS):
+        self.max_records = max_records
+        self.records: List[dict] = []
+        self.runs: Dict[str, dict] = {}
+        self._yields: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def start_run(self, name: str, **params) -> str:
+        with self._lock:
+            run = f"{name}-{len(self.runs) + 1}"
+            self.runs[run] = {"run": run, "name": name, "started_at": time.time(), "params": params}
+        telemetry_run.set(run)
+        return run
+
+    def record(self, stage: str, model: str = "", latency: float = 0.0, usage=None,
+               cached: bool = False, attempt: Optional[int] = None, error: Optional[BaseException] = None):
+        entry = {
+            "run": telemetry_run.get(),
+            "stage": stage,
+            "model": model,
+            "ts": time.time(),
+            "latency": round(latency, 4),
+            "input_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+            "cached": cached,
+            "attempt": job_attempt.get() if attempt is None else attempt,
+            "error": f"{type(error).__name__}: {error}"[:200] if error is not None else None,
+            "code": error_code(error) if error is not None else None,
+        }
+        with self._lock:
+            self.records.append(entry)
+            if len(self.records) > self.max_records:
+                del self.records[:len(self.records) - self.max_records]
+
+    def add_yield(self, stage: str, chunks: int = 0, entities: int = 0, events: int = 0, relations: int = 0):
+        with self._lock:
+            totals = self._yields.setdefault((telemetry_run.get(), stage), {"chunks": 0, "entities": 0, "events": 0, "relations": 0})
+            for name, value in (("chunks", chunks), ("entities", entities), ("events", events), ("relations", relations)):
+                totals[name] += value
+
+    def summary(self, run: Optional[str] = None) -> Dict[str, dict]:
+        """
+        按阶段汇总：calls（真实请求）/ cache_hits / errors / cancelled（对冲落败或超时被取消）/
+        retries（重试发出的请求数）/
+        p50 / p95 / p99（成功的真实请求耗时，秒）/ input_tokens / output_tokens / cost（美元）/
+        tokens_per_chunk / entities_per_1k_tokens（有产出记录的阶段）
+        """
+        run = telemetry_run.get() if run is None else run
+        with self._lock:
+            records = [r for r in self.records if r["run"] == run]
+            yields = {stage: dict(v) for (r, stage), v in self._yields.items() if r == run}
+        out = {}
+        for stage in sorted({r["stage"] for r in records} | set(yields), key=lambda s: list(STAGE_CN).index(s)
+                            if s in STAGE_CN else len(STAGE_CN)):
+            rows = [r for r in records if r["stage"] == stage]
+            live = [r for r in rows if not r["cached"]]
+            latencies = [r["latency"] for r in live if r["error"] is None]
+            cancelled = sum(1 for r in live if r["error"] is not None and r["error"].startswith("CancelledError"))
+            tokens_in = sum(r["input_tokens"] for r in live)
+            tokens_out = sum(r["output_tokens"] for r in live)
+            made = yields.get(stage, {})
+            out[stage] = {
+                "calls": len(live),
+                "cache_hits": len(rows) - len(live),
+                "errors": sum(1 for r in live if r["error"] is not None) - cancelled,
+                "cancelled": cancelled,
+                "retries": sum(1 for r in live if r["attempt"]),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "input_tokens": tokens_in,
+                "output_tokens": tokens_out,
+                "cost": (tokens_in * PRICE_INPUT_PER_M + tokens_out * PRICE_OUTPUT_PER_M) / 1e6,
+                **made,
+            }
+            if made.get("chunks"):
+                out[stage]["tokens_per_chunk"] = (tokens_in + tokens_out) / made["chunks"]
+            if tokens_in + tokens_out and "entities" in made:
+                out[stage]["entities_per_1k_tokens"] = made["entities"] / ((tokens_in + tokens_out) / 1000)
+        return out
+
+    def latencies(self, stage: str, run: Optional[str] = None) -> List[float]:
+        """某阶段成功的真实请求耗时（秒）"""
+        run = telemetry_run.get() if run is None else run
+        with self._lock:
+            return [r["latency"] for r in self.records
+                    if r["run"] == run and r["stage"] == stage and not r["cached"] and r["error"] is None]
+
+    def to_jsonl(self, run: Union[str, List[str], None] = None) -> str:
+        """
+        导出 JSON Lines：每轮一行 {"type": "run", ...}，随后每次调用一行 {"type": "call", ...}，最后一行汇总
+        run 可为单个轮次或轮次列表（如某会话开启过的全部轮次），默认当前上下文的轮次
+        """
+        if run is None:
+            run = telemetry_run.get()
+        runs = [run] if isinstance(run, str) else list(run)
+        lines = []
+        for name in runs:
+            if name in self.runs:
+                lines.append(json.dumps(dict(self.runs[name], type="run"), ensure_ascii=False, default=str))
+            with self._lock:
+                rows = [r for r in self.records if r["run"] == name]
+            lines.extend(json.dumps(dict(r, type="call"), ensure_ascii=False) for r in rows)
+            lines.append(json.dumps({"type": "summary", "run": name, "stages": self.summary(name)}, ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+
+
+llm_telemetry = CallTelemetry()
+
+
+def generate_cached(client, model: str, contents: str, config=None,
+                    validate: Optional[Callable[[str], object]] = None,
+                    cache: Optional[ResponseCache] = None, stage: str = ""):
+    """
+    带缓存的 client.models.generate_content
+    只缓存通过 validate 的非空文本（validate 抛异常或返回 False 视为无效），
+    避免把截断/格式错误的输出永久固化；命中时返回 CachedResponse
+    给出 stage 时每次调用（含命中与失败）记入 llm_telemetry
+    """
+    cache = cache or llm_cache
+    key = cache.key(model, contents, config)
+    text = cache.get(key)
+    if text is not None:
+        if stage:
+            llm_telemetry.record(stage, model, cached=True)
+        return CachedResponse(text)
+    t0 = time.perf_counter()
+    try:
+        response = client.models.generate_content(model=model, contents=contents, config=config)
+    except Exception as exc:
+        if stage:
+            llm_telemetry.record(stage, model, time.perf_counter() - t0, error=exc)
+        raise
+    if stage:
+        llm_telemetry.record(stage, model, time.perf_counter() - t0, getattr(response, "usage_metadata", None))
+    _store_if_valid(cache, key, response, validate, model, contents, config)
+    return response
+
+
+async def agenerate_cached(client, model: str, contents: str, config=None,
+                           validate: Optional[Callable[[str], object]] = None,
+                           cache: Optional[ResponseCache] = None, gate=None, stage: str = ""):
+    """
+    generate_cached 的异步版本（client.aio）；本地 SQLite 读写很快，直接在事件循环里进行
+    gate 为未命中、真正发请求前要等待的协程函数（限流），命中缓存时不占配额；耗时不含 gate 等待
+    """
+    cache = cache or llm_cache
+    key = cache.key(model, contents, config)
+    text = cache.get(key)
+    if text is not None:
+        if stage:
+            llm_telemetry.record(stage, model, cached=True)
+        return CachedResponse(text)
+    if gate is not None:
+        await gate()
+    t0 = time.perf_counter()
+    try:
+        response = await client.aio.models.generate_content(model=model, contents=contents, config=config)
+    except (Exception, asyncio.CancelledError) as exc:  # 取消 = 对冲落败或超时
+        if stage:
+            llm_telemetry.record(stage, model, time.perf_counter() - t0, error=exc)
+        raise
+    if stage:
+        llm_telemetry.record(stage, model, time.perf_counter() - t0, getattr(response, "usage_metadata", None))
+    _store_if_valid(cache, key, response, validate, model, contents, config)
+    return response
+
+
+class StreamedResponse:
+    """流式响应拼接后的结果，接口与 SDK 响应的 .text / .usage_metadata 对齐"""
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.cached = False
+
+
+async def agenerate_stream_cached(client, model: str, contents: str, config=None,
+                                  on_object: Optional[Callable[[str, dict], None]] = None,
+                                  watch: Tuple[str, ...] = (),
+                                  validate: Optional[Callable[[str], object]] = None,
+                                  cache: Optional[ResponseCache] = None, gate=None, stage: str = ""):
+    """
+    agenerate_cached 的流式版本（client.aio.models.generate_content_stream）
+    watch 中的键下的数组元素（如 entities / events / relations）每闭合一个对象即回调 on_object(键, 对象)；
+    命中缓存时把缓存文本一次性过一遍解析器，回调行为一致
+    """
+    cache = cache or llm_cache
+    key = cache.key(model, contents, config)
+    parser = JsonObjectStream(watch)
+    text = cache.get(key)
+    if text is not None:
+        for name, obj in parser.feed(text):
+            if on_object:
+                on_object(name, obj)
+        if stage:
+            llm_telemetry.record(stage, model, cached=True)
+        return CachedResponse(text)
+    if gate is not None:
+        await gate()
+    pieces, usage = [], None
+    t0 = time.perf_counter()
+    try:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        async for chunk in stream:
+            piece = chunk.text or ""
+            pieces.append(piece)
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            for name, obj in parser.feed(piece):
+                if on_object:
+                    on_object(name, obj)
+    except (Exception, asyncio.CancelledError) as exc:
+        if stage:
+            llm_telemetry.record(stage, model, time.perf_counter() - t0, usage, error=exc)
+        raise
+    if stage:
+        llm_telemetry.record(stage, model, time.perf_counter() - t0, usage)
+    response = StreamedResponse("".join(pieces), usage)
+    _store_if_valid(cache, key, response, validate, model, contents, config)
+    return response
+
+
+def _store_if_valid(cache: ResponseCache, key: str, response, validate, model: str, contents: str, config):
+    text = response.text
+    if not text:
+        return
+    try:
+        valid = validate is None or validate(text) is not False
+    except Exception:
+        valid = False
+    if valid:
+        cache.put(key, text, model, contents, config)
+
+
+# ============================================
+# 模型输出解码：直接从原始文本校验；截断 / 轻微格式错误时抢救完整条目
+# ============================================
+decode_stats = {"fast": 0, "salvaged": 0, "failed": 0}
+
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_LITERALS = {"true": True, "false": False, "null": None}
+_MISSING = object()
+_JSON_DECODER = json.JSONDecoder(strict=False)  # 容忍字符串内的控制字符（未转义换行）
+
+
+def parse_partial_json(text: str) -> Tuple[object, bool]:
+    """
+    宽松 JSON 解析：返回 (值, 是否完整)
+    截断时保留已完整的键值与数组元素，丢弃末尾残缺的字符串/数字；
+    容忍 ```json 围栏与前后说明文字、尾随逗号、缺失逗号、字符串内未转义换行
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("输出中没有 JSON 对象或数组")
+    value, _, complete = _parse_value(text, start)
+    if value is _MISSING:
+        raise ValueError("JSON 在第一个值内即被截断")
+    return value, complete
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _parse_value(text: str, pos: int):
+    """返回 (值, 新位置, 是否完整)；残缺的标量返回 _MISSING"""
+    pos = _skip_ws(text, pos)
+    if pos >= len(text):
+        return _MISSING, pos, False
+    ch = text[pos]
+    if ch in "{[":
+        # 完整的子树交给 C 实现的扫描器，只有残缺 / 格式有误的那一支才逐字符解析
+        try:
+            value, end = _JSON_DECODER.raw_decode(text, pos)
+            return value, end, True
+        except json.JSONDecodeError:
+            pass
+        return _parse_container(text, pos + 1, {} if ch == "{" else [], "}" if ch == "{" else "]")
+    if ch == '"':
+        try:
+            value, end = scanstring(text, pos + 1, False)
+        except json.JSONDecodeError:
+            return _MISSING, len(text), False
+        return value, end, True
+    match = _NUMBER_RE.match(text, pos)
+    if match:
+        end = match.end()
+        if end >= len(text):  # 数字到结尾为止，可能被截断
+            return _MISSING, end, False
+        number = match.group()
+        return (float(number) if any(c in number for c in ".eE") else int(number)), end, True
+    for word, literal in _LITERALS.items():
+        if text.startswith(word, pos):
+            return literal, pos + len(word), True
+    return _MISSING, len(text), False  # 无法识别：视为截断，保留此前内容
+
+
+def _parse_container(text: str, pos: int, out, close: str):
+    is_object = close == "}"
+    while True:
+        pos = _skip_ws(text, pos)
+        if pos >= len(text):
+            return out, pos, False
+        if text[pos] == close:
+            return out, pos + 1, True
+        if text[pos] == ",":  # 尾随 / 多余逗号
+            pos += 1
+            continue
+        if is_object:
+            if text[pos] != '"':
+                return out, len(text), False
+            key, pos, complete = _parse_value(text, pos)
+            pos = _skip_ws(text, pos)
+            if not complete or pos >= len(text) or text[pos] != ":":
+                return out, len(text), False
+            pos += 1
+        value, pos, complete = _parse_value(text, pos)
+        if value is not _MISSING:
+            if is_object:
+                out[key] = value
+            else:
+                out.append(value)
+        if not complete:
+            return out, pos, False
+
+
+def _list_item_model(annotation):
+    """List[SomeModel] -> SomeModel，否则 None"""
+    if get_origin(annotation) in (list, List):
+        args = get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0]
+    return None
+
+
+_LIST_ADAPTERS: Dict[type, TypeAdapter] = {}
+
+
+def _salvage_list(item_cls, items) -> list:
+    """整列一次校验；失败时剔除报错的条目再整列校验，报错条目单独递归抢救"""
+    if not isinstance(items, list):
+        return []
+    adapter = _LIST_ADAPTERS.setdefault(item_cls, TypeAdapter(List[item_cls]))
+    try:
+        return adapter.validate_python(items)
+    except ValidationError as e:
+        bad = {err["loc"][0] for err in e.errors() if err["loc"] and isinstance(err["loc"][0], int)}
+    good = [i for i in range(len(items)) if i not in bad]
+    kept = dict(zip(good, adapter.validate_python([items[i] for i in good])))
+    for i in bad:
+        try:
+            kept[i] = salvage_model(item_cls, items[i])
+        except (ValidationError, ValueError):
+            pass
+    return [kept[i] for i in sorted(kept)]
+
+
+def salvage_model(model_cls, data):
+    """
+    按 schema 逐条抢救：List[子模型] 字段只保留能通过校验的条目（残缺条目递归抢救其内部列表），
+    缺失的 List[子模型] 字段按空列表处理；其余字段交给 pydantic 正常校验
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"{model_cls.__name__} 需要 JSON 对象")
+    values = dict(data)
+    for name, field in model_cls.model_fields.items():
+        item_cls = _list_item_model(field.annotation)
+        if item_cls is None:
+            continue
+        values[name] = _salvage_list(item_cls, data.get(name))
+    return model_cls.model_validate(values)
+
+
+def decode_json_model(model_cls, text: str, salvage: bool = True):
+    """
+    快速路径：model_validate_json 直接从原始文本校验（不经 json.loads 中间对象）
+    失败且 salvage 为真时，宽松解析后按 schema 抢救完整条目；返回 (对象, 是否经过抢救)
+    """
+    try:
+        result = model_cls.model_validate_json(text)
+        decode_stats["fast"] += 1
+        return result, False
+    except ValidationError:
+        if not salvage:
+            raise
+    try:
+        result = salvage_model(model_cls, parse_partial_json(text)[0])
+    except (ValidationError, ValueError):
+        decode_stats["failed"] += 1
+        raise
+    decode_stats["salvaged"] += 1
+    return result, True
+
+
+class JsonObjectStream:
+    """
+    增量 JSON 扫描：按片段喂入模型输出，watch 中的键所对应数组里的对象一闭合就解析返回
+    只跟踪括号 / 字符串 / 键名状态，不构建中间树；嵌套任意深度（多块打包的 chunks[*].entities 同样适用）
+    """
+
+    def __init__(self, watch: Tuple[str, ...]):
+        self.watch = set(watch)
+        self.buf = ""
+        self.pos = 0
+        self.stack: List[list] = []   # [类型 "{" / "[", 在父对象中的键, 起始位置]
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_key: Optional[str] = None
+
+    def feed(self, piece: str) -> List[Tuple[str, dict]]:
+        self.buf += piece
+        out = []
+        buf, stack = self.buf, self.stack
+        for pos in range(self.pos, len(buf)):
+            ch = buf[pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if stack and stack[-1][0] == "{":
+                        self.last_key = buf[self.string_start + 1:pos]
+                continue
+            if ch == '"':
+                self.in_string, self.string_start = True, pos
+            elif ch in "{[":
+                parent_key = self.last_key if stack and stack[-1][0] == "{" else (stack[-1][1] if stack else None)
+                stack.append([ch, parent_key, pos])
+            elif ch in "}]" and stack:
+                kind, key, start = stack.pop()
+                if kind == "{" and stack and stack[-1][0] == "[" and stack[-1][1] in self.watch:
+                    try:
+                        out.append((stack[-1][1], _JSON_DECODER.decode(buf[start:pos + 1])))
+                    except json.JSONDecodeError:
+                        pass
+        self.pos = len(buf)
+        return out
+
+
+# ============================================
+# 令牌桶限流（RPM / TPM）+ asyncio 并发执行
+# ============================================
+EXTRACT_RPM = int(os.environ.get("JIESHUKE_RPM", "300"))
+EXTRACT_TPM = int(os.environ.get("JIESHUKE_TPM", "1000000"))
+EXTRACT_MAX_IN_FLIGHT = 256  # 协程并发上限；实际速率由令牌桶决定
+LIMITER_BURST_SECONDS = 5.0  # 允许瞬时突发的额度（秒）
+
+
+class TokenBucketLimiter:
+    """
+    两个令牌桶：请求数与 token 数，额度为每 period 秒 rpm / tpm
+    - 桶容量 = burst 秒的额度，回填速率 = (额度 - 容量) / period，
+      保证任意 period 长的滑动窗口内都不超过配额（服务端按窗口计数时不会 429）
+    - acquire() 按先来后到排队，直到两只桶都够扣；单个请求超过桶容量时按容量扣，避免永远等待
+    - settle() 用实际用量修正预扣的估算值（退还后不超过桶容量）
+    """
+
+    def __init__(self, rpm: float = EXTRACT_RPM, tpm: float = EXTRACT_TPM,
+                 burst: float = LIMITER_BURST_SECONDS, period: float = 60.0, clock=time.monotonic):
+        burst = min(burst, period / 2)
+        self.req_cap, self.tok_cap = rpm * burst / period, tpm * burst / period
+        self.req_rate = (rpm - self.req_cap) / period
+        self.tok_rate = (tpm - self.tok_cap) / period
+        self.req_cap = max(self.req_cap, 1.0)
+        self.clock = clock
+        self.requests, self.tokens = self.req_cap, self.tok_cap
+        self.updated = clock()
+        self.waited = 0.0
+        self._lock = None
+
+    def _refill(self):
+        now = self.clock()
+        elapsed, self.updated = now - self.updated, now
+        self.requests = min(self.req_cap, self.requests + elapsed * self.req_rate)
+        self.tokens = min(self.tok_cap, self.tokens + elapsed * self.tok_rate)
+
+    async def acquire(self, tokens: int = 0):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        tokens = min(tokens, self.tok_cap)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.requests) / self.req_rate if self.requests < 1 else 0.0,
+                    (tokens - self.tokens) / self.tok_rate if self.tokens < tokens else 0.0
+                )
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        if actual is not None:
+            self._refill()
+            # 退还（实际少于预估、失败时 actual=0）不能超过桶容量；超容量请求 acquire 时也只扣了容量
+            self.tokens = min(self.tok_cap, self.tokens - (actual - estimated))
+
+
+# ============================================
+# AIMD 自适应并发 + 抖动指数退避重试
+# ============================================
+EXTRACT_RETRIES = 5          # 可重试错误（429/503 等）的最大重试次数
+BACKOFF_BASE = 1.0           # 退避基数（秒），第 n 次重试等待 U(0, base·2^n)
+BACKOFF_CAP = 60.0           # 单次退避上限（秒）
+OVERLOAD_CODES = {429, 503}              # 配额 / 过载：重试并收缩并发
+RETRYABLE_CODES = OVERLOAD_CODES | {500, 502, 504}
+
+
+def error_code(exc: BaseException) -> Optional[int]:
+    """SDK 异常（google.genai.errors.APIError 等）上的 HTTP 状态码"""
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if error_code(exc) in RETRYABLE_CODES:
+        return True
+    # 网络层超时 / 连接中断（httpx、aiohttp 等）按可重试处理
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or type(exc).__name__ in (
+        "ReadTimeout", "ConnectTimeout", "ReadError", "ConnectError", "RemoteProtocolError"
+    )
+
+
+def backoff_delay(attempt: int, rng: random.Random, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """full jitter 指数退避：attempt 从 0 开始"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AimdController:
+    """
+    加性增 / 乘性减的并发窗口（类似 TCP 拥塞控制）
+    - 每成功一次 limit += increase / limit（约每轮并发 +increase）
+    - 遇到 429/503 时 limit *= decrease；同一拥塞周期内（请求发出早于上次收缩）只收缩一次，
+      避免同一批并发失败把窗口连续砍到底
+    """
+
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = EXTRACT_MAX_IN_FLIGHT,
+                 increase: float = 1.0, decrease: float = 0.5, clock=time.monotonic):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum, self.maximum = float(minimum), float(maximum)
+        self.increase, self.decrease = increase, decrease
+        self.clock = clock
+        self.in_flight = 0
+        self.peak = self.limit
+        self.shrinks = 0
+        self._last_shrink = float("-inf")
+        self._cond = None
+
+    async def acquire(self) -> float:
+        """占用一个并发名额，返回发出时刻（供 on_overload 判断拥塞周期）"""
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self.clock()
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+        self.peak = max(self.peak, self.limit)
+
+    def on_overload(self, started: float):
+        if started < self._last_shrink:
+            return
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        self._last_shrink = self.clock()
+        self.shrinks += 1
+
+
+class JobResult(NamedTuple):
+    result: object
+    status: str               # succeeded / retried / dropped
+    attempts: int
+    error: Optional[str] = None
+
+
+JOB_STATUS_CN = {"succeeded": "成功", "retried": "重试后成功", "dropped": "放弃"}
+
+
+# ============================================
+# 尾延迟对冲：请求超过运行中 p95 仍未返回时发一个副本，先返回者胜出，另一个取消
+# ============================================
+EXTRACT_TIMEOUT = float(os.environ.get("JIESHUKE_EXTRACT_TIMEOUT", "300"))  # 单次调用超时（秒），超时按可重试处理
+HEDGE_QUANTILE = 95          # 以已完成请求耗时的该百分位作为对冲阈值
+HEDGE_MIN_SAMPLES = 8        # 样本不足时不对冲（阈值不可靠）
+HEDGE_MIN_DELAY = 1.0        # 对冲阈值下限（秒），避免在极快的请求上浪费配额
+HEDGE_BUDGET = 0.1           # 对冲副本预估 token 之和不超过全部 job 预估 token 的该比例
+HEDGE_POLL = 0.5             # 等待期间重新评估阈值的间隔（秒）；早发的请求在样本攒够后也能被对冲
+
+
+class HedgePolicy:
+    """
+    对冲策略与统计
+    - delay(): 当前对冲阈值（已完成真实请求耗时的 quantile 百分位，不低于 min_delay）；样本不足时为 None
+    - allow(estimated): 额外花费（副本的预估 token）未超出 budget × 全部预估 token 时允许对冲并记账
+    - issued / won: 发出的副本数、副本先于原请求返回的次数
+    """
+
+    def __init__(self, quantile: float = HEDGE_QUANTILE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 min_delay: float = HEDGE_MIN_DELAY, budget: float = HEDGE_BUDGET):
+        self.quantile, self.min_samples, self.min_delay, self.budget = quantile, min_samples, min_delay, budget
+        self.latencies: List[float] = []
+        self.total_tokens = 0
+        self.extra_tokens = 0
+        self.issued = 0
+        self.won = 0
+        self.capped = 0
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, percentile(self.latencies, self.quantile))
+
+    def allow(self, estimated: int) -> bool:
+        if self.extra_tokens + estimated > self.budget * self.total_tokens:
+            self.capped += 1
+            return False
+        self.extra_tokens += estimated
+        self.issued += 1
+        return True
+
+
+class _Interrupted(Exception):
+    """界面已要求中断：尚未发出的请求不再发出"""
+
+
+def _is_interrupt(exc: BaseException) -> bool:
+    """Streamlit 的停止 / 重跑信号（继承 BaseException 而非 Exception）；取消与进程级退出不算"""
+    return not isinstance(exc, (Exception, asyncio.CancelledError, KeyboardInterrupt, SystemExit, GeneratorExit))
+
+
+def defer_interrupt(fn):
+    """
+    包装 worker 内更新界面的回调（如流式预览）：回调中抛出的中断信号不打断当前请求，
+    而是交给所在的 run_async_jobs，等进行中的请求全部结束后再抛出
+    """
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as exc:
+            pending = job_interrupts.get()
+            if pending is None or not _is_interrupt(exc):
+                raise
+            pending.append(exc)
+    return wrapper
+
+
+def run_async_jobs(jobs, worker, limiter: Optional[TokenBucketLimiter] = None,
+                   max_in_flight: int = EXTRACT_MAX_IN_FLIGHT, on_done=None,
+                   controller: Optional[AimdController] = None, retries: int = EXTRACT_RETRIES,
+                   seed: Optional[int] = None, after: Optional[List[Optional[int]]] = None,
+                   hedge: Optional[HedgePolicy] = None, timeout: Optional[float] = None,
+                   priority: Optional[List[float]] = None) -> List[JobResult]:
+    """
+    在当前线程跑一个事件循环，并发执行 worker(payload)（协程函数）
+    - jobs: [(预估 token 数, payload)]，返回 JobResult 列表，与 jobs 顺序一致
+    - 并发由 controller（AIMD，默认按 max_in_flight 起步）控制，不占用线程；limiter 控制 RPM / TPM
+    - worker(payload, gate) 须在真正发请求前 await gate()（取限流令牌；命中缓存时不调用即不占配额），
+      返回 (结果, 实际 token 数或 None)；抛出可重试错误时抖动退避后重试，
+      超过 retries 次或遇到不可重试错误则记为 dropped（result 为 None）
+    - on_done(序号, JobResult) 在当前线程回调（可直接更新 UI）。回调中抛出中断信号（如点击按钮触发的
+      Streamlit 重跑）时不再发出新请求，已发出的请求照常完成并回调 on_done（调用方借此写日志），
+      全部结束后再抛出该信号；worker 内的界面回调用 defer_interrupt 包装后同样处理
+    - after[i] 为 job i 必须等其结束（无论成败）才开始的前序 job 序号（见 wavefront_chains）；
+      等待期间不占并发名额
+    - timeout: 单次调用超时（秒，从过了 gate 算起、含流式读取；限流排队不计入），超时按可重试错误处理
+    - hedge: 给出时，请求发出（过了 gate）后超过 hedge.delay() 仍未返回且未超出对冲预算，
+      就再调用一次 worker（副本同样过 gate、占并发名额），先成功者胜出、另一个被取消；
+      两者都失败时按原请求的异常重试。worker 须能容忍同一 payload 被并发调用
+    - priority[i] 越大越先发出（并发名额与限流令牌都按先来后到分配）；同分按原顺序。
+      有 after 依赖的 job 仍要等前序结束，优先级只在已就绪的 job 之间生效
+    """
+    limiter = limiter or TokenBucketLimiter()
+    controller = controller or AimdController(initial=max_in_flight, maximum=max_in_flight)
+    rng = random.Random(seed)
+    results: List[Optional[JobResult]] = [None] * len(jobs)
+    finished = None
+    interrupts: List[BaseException] = []
+    if hedge is not None:
+        hedge.total_tokens += sum(est for est, _ in jobs)
+
+    async def call(estimated, payload, attempt, sent: Optional[asyncio.Event] = None):
+        """一次调用：占并发名额 -> worker（过 gate 后计时）-> 释放；失败时按错误码收缩窗口后抛出"""
+        started = await controller.acquire()
+        job_attempt.set(attempt)
+        charged = []
+        t_sent = [None]
+
+        async def gate():
+            if interrupts:
+                raise _Interrupted()
+            await limiter.acquire(estimated)
+            if interrupts:
+                limiter.settle(estimated, 0)
+                raise _Interrupted()
+            charged.append(estimated)
+            t_sent[0] = time.perf_counter()
+            if sent is not None:
+                sent.set()
+            if timeout:
+                # 超时只从请求发出算起：在限流令牌桶前排队的时间不计入
+                deadline.reschedule(asyncio.get_running_loop().time() + timeout)
+
+        try:
+            async with asyncio.timeout(None) as deadline:
+                result, actual = await worker(payload, gate)
+        except Exception as exc:
+            if charged:
+                limiter.settle(estimated, 0)  # 失败请求不计入服务端 token 用量
+            if error_code(exc) in OVERLOAD_CODES:
+                controller.on_overload(started)
+            raise
+        finally:
+            await controller.release()
+        if charged:  # 命中缓存时不过 gate：既不计入配额，也不算后端的成功响应（不据此放大并发窗口）
+            controller.on_success()
+            limiter.settle(estimated, actual)
+            if hedge is not None:
+                hedge.observe(time.perf_counter() - t_sent[0])
+        return result
+
+    async def hedged(estimated, payload, attempt):
+        if hedge is None:
+            return await call(estimated, payload, attempt)
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(call(estimated, payload, attempt, sent))
+        waiter = asyncio.ensure_future(sent.wait())
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        t_sent = time.perf_counter()
+        while not primary.done():
+            delay = hedge.delay()
+            remaining = HEDGE_POLL if delay is None else delay - (time.perf_counter() - t_sent)
+            if remaining <= 0:
+                break
+            await asyncio.wait({primary}, timeout=min(remaining, HEDGE_POLL))
+        if primary.done() or interrupts or not hedge.allow(estimated):
+            return await primary
+        backup = asyncio.ensure_future(call(estimated, payload, attempt))
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    if task is backup:
+                        hedge.won += 1
+                    return task.result()
+        return primary.result()  # 两者都失败：抛出原请求的异常
+
+    async def run(idx, estimated, payload):
+        if after is not None and after[idx] is not None:
+            await finished[after[idx]].wait()
+        attempt = 0
+        while True:
+            if interrupts:
+                finished[idx].set()
+                return
+            try:
+                result = await hedged(estimated, payload, attempt)
+            except _Interrupted:
+                continue
+            except BaseException as exc:
+                if _is_interrupt(exc):  # worker 内未包装的界面回调被中断：本次请求作废
+                    interrupts.append(exc)
+                    continue
+                if not isinstance(exc, Exception):
+                    raise
+                if attempt < retries and is_retryable(exc):
+                    await asyncio.sleep(backoff_delay(attempt, rng))
+                    attempt += 1
+                    continue
+                outcome = JobResult(None, "dropped", attempt + 1, f"{type(exc).__name__}: {exc}")
+                break
+            outcome = JobResult(result, "retried" if attempt else "succeeded", attempt + 1)
+            break
+        results[idx] = outcome
+        if on_done:
+            try:
+                on_done(idx, outcome)
+            except BaseException as exc:
+                if not _is_interrupt(exc):
+                    raise
+                interrupts.append(exc)
+        finished[idx].set()
+
+    async def main():
+        nonlocal finished
+        finished = [asyncio.Event() for _ in jobs]
+        job_interrupts.set(interrupts)
+        order = range(len(jobs)) if priority is None else sorted(range(len(jobs)), key=lambda i: -priority[i])
+        await asyncio.gather(*(run(i, *jobs[i]) for i in order))
+
+    asyncio.run(main())
+    if interrupts:
+        raise interrupts[0]
+    return results
+
+
+def wavefront_chains(n: int, segments: int) -> List[Optional[int]]:
+    """
+    波前调度：把 n 个按原文顺序排列的 job 切成 segments 个连续段，段与段并行、段内串行
+    返回 run_async_jobs 的 after 列表（段内每个 job 依赖前一个）；segments <= 0 或 >= n 时全并行
+    """
+    if segments <= 0 or segments >= n:
+        return [None] * n
+    size = -(-n // segments)
+    return [None if i % size == 0 else i - 1 for i in range(n)]
+
+
+# ============================================
+# 可续跑的抽取任务日志（每块完成即落盘，重启后只补缺失块）
+# ============================================
+JOB_DIR = os.environ.get("JIESHUKE_JOB_DIR", os.path.join(".cache", "jobs"))
+JOB_TTL = float(os.environ.get("JIESHUKE_JOB_TTL_DAYS", "14")) * 86400
+
+
+def job_id(*parts) -> str:
+    """由任务的全部输入（模型、切分参数、各文件内容摘要等）生成稳定的任务 ID"""
+    return _sha256("\x1f".join(str(p) for p in parts))
+
+
+def input_hash(text: str) -> str:
+    return _sha256(text)
+
+
+class JobJournal:
+    """
+    追加写的 JSONL 日志，一个任务一个文件：
+      {"type": "plan", "chunks": [...]}                       首行：切分结果（续跑时原样复用，不重新切分）
+      {"type": "result", "index": i, "hash": h, "result": {...}}  每块校验通过的抽取结果
+    - 每行写完即 flush + fsync；崩溃时写了一半的末行在加载时截掉
+    - 结果的 hash 与计划中该块输入的 hash 不一致时视为无效，续跑时重抽
+    - 多线程写入由锁串行化；创建时顺带清理超过 JOB_TTL 未更新的旧日志
+    - 写入失败（磁盘满、目录不可写等）不抛出：记下首个错误到 error 并停止写日志，
+      本次任务照常进行，只是无法续跑；由调用方决定如何提示
+    """
+
+    def __init__(self, job: str, root: str = JOB_DIR):
+        self.path = os.path.join(root, f"{job}.jsonl")
+        self.plan: Optional[List[str]] = None
+        self.results: Dict[int, dict] = {}
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        prune_journals(root)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        if lines and not lines[-1].endswith("\n"):
+            # 截掉崩溃时写了一半的末行，否则后续追加会接在它后面
+            lines.pop()
+            try:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                self.error = str(e)  # 与 _append 一致：只记录，不中断任务（之后也不再写日志）
+        hashes: List[str] = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("type") == "plan":
+                self.plan = entry["chunks"]
+                hashes = [input_hash(c) for c in self.plan]
+            elif entry.get("type") == "result" and self.plan is not None:
+                idx = entry.get("index")
+                if isinstance(idx, int) and 0 <= idx < len(hashes) and entry.get("hash") == hashes[idx]:
+                    self.results[idx] = entry["result"]
+
+    def _append(self, entry: dict, mode: str = "a"):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self.error is not None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, mode, encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                self.error = str(e)
+
+    def start(self, chunks: List[str]):
+        """写入新计划（覆盖旧日志）"""
+        self.plan, self.results = list(chunks), {}
+        self._append({"type": "plan", "chunks": self.plan}, mode="w")
+
+    def record(self, index: int, result: dict):
+        if self.plan is None:
+            return
+        self.results[index] = result
+        self._append({"type": "result", "index": index, "hash": input_hash(self.plan[index]), "result": result})
+
+    def pending(self) -> List[int]:
+        return [i for i in range(len(self.plan or [])) if i not in self.results]
+
+    def reset(self):
+        self.plan, self.results = None, {}
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def prune_journals(root: str = JOB_DIR, ttl: float = JOB_TTL):
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    cutoff = time.time() - ttl
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            if name.endswith(".jsonl") and os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass